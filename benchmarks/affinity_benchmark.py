@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Core affinity benchmark: audio underruns and detection latency.
+
+Replays footage through the camera loop and detection worker (as
+benchmarks/vision_latency.py does) while a stand-in for the microphone
+loop has to process one audio block every --block-ms. A block handled
+more than one block period late counts as an underrun: the capture
+buffer would have overrun and the recognizer lost audio. Run once with
+--affinity-profile none and once with the board's plan, then compare.
+
+Usage:
+    uv run benchmarks/affinity_benchmark.py --source footage.mp4 --affinity-profile none --output before.json
+    uv run benchmarks/affinity_benchmark.py --source footage.mp4 --affinity-profile auto --output after.json --compare before.json
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from core_affinity import get_affinity_planner
+from vision_latency import print_comparison, run_benchmark
+from vision_metrics import percentile
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Audio underruns and detection latency with and without a core affinity plan")
+    parser.add_argument("--source", required=True, help="Video file, JPEG directory or recorded bundle")
+    parser.add_argument("--affinity-profile", default="auto", help="auto, none, generic or a hardware type from core_affinity.AFFINITY_PROFILES")
+    parser.add_argument("--pacing", default="realtime", choices=("realtime", "fast"), help="Replay pacing (default: realtime)")
+    parser.add_argument("--max-seconds", type=float, default=30, help="Stop after this many seconds (0 = whole source)")
+    parser.add_argument("--block-ms", type=float, default=100.0, help="Audio block period")
+    parser.add_argument("--work-ms", type=float, default=3.0, help="CPU time the audio loop spends per block")
+    parser.add_argument("--detection-process", action="store_true", help="Run the detector in its own process")
+    parser.add_argument("--label", default="", help="Free-form label stored in the report (default: the affinity profile)")
+    parser.add_argument("--output", default="", help="Write the JSON report to this file (default: stdout)")
+    parser.add_argument("--compare", default="", help="Previous JSON report to compare against")
+    return parser.parse_args()
+
+
+class AudioDeadlineLoop:
+    """Stand-in for listener.mic_listen: a fixed-rate consumer with a CPU cost per block."""
+
+    def __init__(self, block_ms: float, work_ms: float):
+        self.block = block_ms / 1000.0
+        self.work = work_ms / 1000.0
+        self.samples = np.random.default_rng(0).integers(-2000, 2000, int(16000 * self.block), dtype=np.int16)
+        self.lateness = []
+        self.blocks = 0
+        self.underruns = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="mic-listen", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join(timeout=2.0)
+
+    def _process_block(self):
+        start = time.thread_time()
+        while time.thread_time() - start < self.work:
+            block = self.samples.astype(np.float32)
+            np.sqrt(np.mean(block * block))
+            np.abs(np.fft.rfft(block))
+
+    def _run(self):
+        deadline = time.perf_counter() + self.block
+        while not self._stop.is_set():
+            delay = deadline - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            late = time.perf_counter() - deadline
+            self.lateness.append(late)
+            self.blocks += 1
+            if late > self.block:
+                # Blocks that arrived meanwhile were lost; resynchronize to the audio clock
+                self.underruns += 1
+                deadline += int(late // self.block) * self.block
+            self._process_block()
+            deadline += self.block
+
+    def summary(self):
+        lateness = sorted(self.lateness)
+        stats = {'blocks': self.blocks, 'underruns': self.underruns,
+                 'underrun_rate': round(self.underruns / self.blocks, 4) if self.blocks else 0.0}
+        for pct in (50, 95, 99):
+            stats[f'lateness_p{pct}_ms'] = round(percentile(lateness, pct) * 1000.0, 3) if lateness else 0.0
+        stats['lateness_max_ms'] = round(lateness[-1] * 1000.0, 3) if lateness else 0.0
+        return stats
+
+
+def run(bench_args):
+    planner = get_affinity_planner()
+    planner.configure(bench_args.affinity_profile)  # Before the detector builds its sessions
+
+    vision_args = argparse.Namespace(source=bench_args.source, pacing=bench_args.pacing, decode_scale=1,
+                                     detection_process=bench_args.detection_process,
+                                     max_seconds=bench_args.max_seconds, label=bench_args.label,
+                                     greet_gender=False, no_regreet=False)
+    result = {}
+    audio = AudioDeadlineLoop(bench_args.block_ms, bench_args.work_ms)
+    audio.start()
+    camera = threading.Thread(target=lambda: result.update(vision=run_benchmark(vision_args)), name="camera-loop")
+    camera.start()
+    while camera.is_alive():
+        planner.apply()  # As the CPU optimizer does in the app
+        camera.join(timeout=0.5)
+    audio.stop()
+
+    return {
+        'label': bench_args.label or bench_args.affinity_profile,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'affinity': {'requested': bench_args.affinity_profile, 'profile': planner.profile,
+                     'plan': {k: list(v) for k, v in (planner.plan or {}).items()}},
+        'audio': audio.summary(),
+        'vision': result.get('vision', {}),
+    }
+
+
+def print_audio_comparison(report, baseline):
+    print(f"\n=== Audio: {report['label']} vs {baseline['label']} ===")
+    for key in ('underruns', 'underrun_rate', 'lateness_p50_ms', 'lateness_p95_ms', 'lateness_p99_ms', 'lateness_max_ms'):
+        print(f"{key:>20}: {baseline['audio'].get(key)} -> {report['audio'].get(key)}")
+
+
+if __name__ == "__main__":
+    bench_args = parse_args()
+    report = run(bench_args)
+
+    report_json = json.dumps(report, indent=2)
+    if bench_args.output:
+        with open(bench_args.output, 'w', encoding='utf-8') as f:
+            f.write(report_json)
+        print(f"Benchmark report written to {bench_args.output}")
+    else:
+        print(report_json)
+    print(f"Audio: {report['audio']['underruns']} underruns in {report['audio']['blocks']} blocks, "
+          f"p99 lateness {report['audio']['lateness_p99_ms']:.1f}ms")
+
+    if bench_args.compare:
+        with open(bench_args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        print_audio_comparison(report, baseline)
+        if report['vision'] and baseline.get('vision'):
+            print_comparison(report['vision'], baseline['vision'])
@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+"""
+INT8 quantization and accuracy/latency comparison for the face models.
+
+Quantizes the detector (and optionally genderage) with ONNX Runtime static
+quantization, calibrated on recorded frames preprocessed exactly as the
+camera loop does, then runs FP32 and INT8 side by side on held-out frames
+and reports recall, box IoU and ms/frame. With --write-profile the INT8
+models are listed in the ONNX Runtime profile, so face_detection_worker
+loads them in place of the FP32 ones (main.py --ort-profile).
+
+Usage:
+    uv run benchmarks/quantize_detector.py --source saved_frames/
+    uv run benchmarks/quantize_detector.py --source saved_frames/ --genderage --write-profile ort_profile.json
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+from insightface.app.common import Face
+from onnxruntime.quantization import CalibrationDataReader, CalibrationMethod, QuantFormat, QuantType, quantize_static
+from onnxruntime.quantization.shape_inference import quant_pre_process
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from detection_process import detect_faces
+from face_tracker import box_iou
+from ort_session import ORT_PROFILE_PATH, FaceModels, load_model_overrides, load_session_profile, save_model_overrides
+from tune_ort_session import load_frames
+from vision_metrics import percentile
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Quantize the face detector to INT8 and compare it against FP32")
+    parser.add_argument("--source", default="saved_frames", help="Video file, JPEG directory or recorded bundle")
+    parser.add_argument("--calibration-frames", type=int, default=100, help="Frames used to calibrate activation ranges")
+    parser.add_argument("--eval-frames", type=int, default=200, help="Held-out frames used for the comparison")
+    parser.add_argument("--det-size", type=int, default=320, help="Square detector input size")
+    parser.add_argument("--no-rotate", action="store_true", help="Frames are not rotated for the detector (ENABLE_FRAME_ROTATION = False)")
+    parser.add_argument("--genderage", action="store_true", help="Also quantize the genderage model")
+    parser.add_argument("--format", default="qdq", choices=("qdq", "qoperator"), help="Quantized graph format")
+    parser.add_argument("--per-channel", action="store_true", help="Per-channel weight quantization")
+    parser.add_argument("--iou-threshold", type=float, default=0.5, help="IoU for an INT8 box to count as matching an FP32 box")
+    parser.add_argument("--warmup", type=int, default=5, help="Untimed runs per model before the comparison")
+    parser.add_argument("--profile", default=ORT_PROFILE_PATH, help="Session profile both variants are timed with")
+    parser.add_argument("--output-dir", default="quantized_models", help="Where the INT8 models are written")
+    parser.add_argument("--output", default="", help="Write the comparison report as JSON")
+    parser.add_argument("--write-profile", default="", help="List the INT8 models in this ONNX Runtime profile")
+    return parser.parse_args()
+
+
+class RecordingSession:
+    """Forwards to an ONNX Runtime session and keeps a copy of every input feed."""
+
+    def __init__(self, session):
+        self.session = session
+        self.feeds = []
+
+    def run(self, output_names, input_feed, run_options=None):
+        self.feeds.append({name: np.array(value, copy=True) for name, value in input_feed.items()})
+        return self.session.run(output_names, input_feed, run_options)
+
+    def __getattr__(self, name):
+        return getattr(self.session, name)
+
+
+class FeedReader(CalibrationDataReader):
+    """Calibration data reader over recorded model inputs."""
+
+    def __init__(self, feeds):
+        self.feeds = iter(feeds)
+
+    def get_next(self):
+        return next(self.feeds, None)
+
+
+def record_calibration_feeds(models, frames, genderage):
+    """
+    Run the FP32 models over `frames` and capture their exact inputs, so the
+    calibration data goes through the same preprocessing as at runtime.
+    Returns (detector_feeds, genderage_feeds).
+    """
+    det_model = models.det_model
+    ga_model = models.models.get('genderage') if genderage else None
+    det_recorder = RecordingSession(det_model.session)
+    ga_recorder = RecordingSession(ga_model.session) if ga_model is not None else None
+
+    det_model.session = det_recorder
+    if ga_recorder is not None:
+        ga_model.session = ga_recorder
+    try:
+        for frame in frames:
+            faces = detect_faces(models, frame)
+            if ga_model is not None:
+                for face in faces:
+                    ga_model.get(frame, face)
+    finally:
+        det_model.session = det_recorder.session
+        if ga_recorder is not None:
+            ga_model.session = ga_recorder.session
+    return det_recorder.feeds, (ga_recorder.feeds if ga_recorder is not None else [])
+
+
+def quantize_model(fp32_path, output_path, feeds, quant_format, per_channel):
+    """Static INT8 quantization (uint8 activations, int8 weights) calibrated on `feeds`."""
+    prep_path = output_path[:-len('.onnx')] + '_prep.onnx'
+    source_path = fp32_path
+    try:
+        quant_pre_process(fp32_path, prep_path)
+        source_path = prep_path
+    except Exception as e:
+        print(f"Pre-processing {fp32_path} failed, quantizing the original graph: {e}")
+
+    try:
+        quantize_static(
+            source_path, output_path, FeedReader(feeds),
+            quant_format=QuantFormat.QDQ if quant_format == 'qdq' else QuantFormat.QOperator,
+            per_channel=per_channel,
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8,
+            calibrate_method=CalibrationMethod.MinMax)
+    finally:
+        if os.path.exists(prep_path):
+            os.remove(prep_path)
+    print(f"Wrote {output_path} ({os.path.getsize(fp32_path) / 1e6:.1f}MB -> {os.path.getsize(output_path) / 1e6:.1f}MB)")
+
+
+def latency_summary(latencies):
+    latencies = sorted(latencies)
+    if not latencies:
+        return {'count': 0}
+    return {
+        'count': len(latencies),
+        'p50_ms': round(percentile(latencies, 50) * 1000.0, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000.0, 3),
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000.0, 3),
+    }
+
+
+def match_faces(reference, candidate, iou_threshold):
+    """Greedy one-to-one matching by IoU; returns [(reference_index, candidate_index, iou), ...]."""
+    if not reference or not candidate:
+        return []
+    ref_boxes = np.array([f.bbox[:4] for f in reference], dtype=np.float32)
+    cand_boxes = np.array([f.bbox[:4] for f in candidate], dtype=np.float32)
+    iou = box_iou(ref_boxes, cand_boxes)
+    matches = []
+    used_ref, used_cand = set(), set()
+    for flat in np.argsort(-iou, axis=None):
+        r, c = np.unravel_index(flat, iou.shape)
+        if iou[r, c] < iou_threshold:
+            break
+        if r in used_ref or c in used_cand:
+            continue
+        used_ref.add(r)
+        used_cand.add(c)
+        matches.append((int(r), int(c), float(iou[r, c])))
+    return matches
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def compare_models(fp32, int8, frames, iou_threshold, warmup, compare_genderage):
+    """Run both variants on every frame and collect detection and genderage agreement."""
+    for i in range(warmup):
+        detect_faces(fp32, frames[i % len(frames)])
+        detect_faces(int8, frames[i % len(frames)])
+
+    fp32_ga = fp32.models.get('genderage')
+    int8_ga = int8.models.get('genderage')
+    det_times = {'fp32': [], 'int8': []}
+    ga_times = {'fp32': [], 'int8': []}
+    fp32_total = int8_total = 0
+    ious = []
+    gender_agree = 0
+    age_errors = []
+
+    for frame in frames:
+        fp32_faces, fp32_seconds = timed(detect_faces, fp32, frame)
+        int8_faces, int8_seconds = timed(detect_faces, int8, frame)
+        det_times['fp32'].append(fp32_seconds)
+        det_times['int8'].append(int8_seconds)
+        fp32_total += len(fp32_faces)
+        int8_total += len(int8_faces)
+
+        for r, c, iou in match_faces(fp32_faces, int8_faces, iou_threshold):
+            ious.append(iou)
+            if not compare_genderage or fp32_ga is None or int8_ga is None:
+                continue
+            # Both genderage variants see the same FP32 face, isolating their own error
+            reference = fp32_faces[r]
+            fp32_face = Face(bbox=reference.bbox, kps=reference.kps, det_score=reference.det_score)
+            int8_face = Face(bbox=reference.bbox, kps=reference.kps, det_score=reference.det_score)
+            _, fp32_ga_seconds = timed(fp32_ga.get, frame, fp32_face)
+            _, int8_ga_seconds = timed(int8_ga.get, frame, int8_face)
+            ga_times['fp32'].append(fp32_ga_seconds)
+            ga_times['int8'].append(int8_ga_seconds)
+            gender_agree += int(int8_face.gender == fp32_face.gender)
+            age_errors.append(abs(float(int8_face.age) - float(fp32_face.age)))
+
+    fp32_latency = latency_summary(det_times['fp32'])
+    int8_latency = latency_summary(det_times['int8'])
+    report = {
+        'detection': {
+            'fp32': fp32_latency,
+            'int8': int8_latency,
+            'speedup_p50': round(fp32_latency['p50_ms'] / int8_latency['p50_ms'], 3) if int8_latency.get('p50_ms') else None,
+            'fp32_faces': fp32_total,
+            'int8_faces': int8_total,
+            'matched_faces': len(ious),
+            'recall': round(len(ious) / fp32_total, 4) if fp32_total else None,
+            'precision': round(len(ious) / int8_total, 4) if int8_total else None,
+            'mean_iou': round(float(np.mean(ious)), 4) if ious else None,
+            'p05_iou': round(float(np.percentile(ious, 5)), 4) if ious else None,
+        },
+    }
+    if compare_genderage and age_errors:
+        report['genderage'] = {
+            'fp32': latency_summary(ga_times['fp32']),
+            'int8': latency_summary(ga_times['int8']),
+            'faces': len(age_errors),
+            'gender_agreement': round(gender_agree / len(age_errors), 4),
+            'mean_abs_age_error': round(float(np.mean(age_errors)), 3),
+        }
+    return report
+
+
+def print_report(report):
+    det = report['detection']
+    print("\nDetection (INT8 vs FP32 reference)")
+    print(f"  ms/frame p50: {det['fp32'].get('p50_ms', 0):.2f} -> {det['int8'].get('p50_ms', 0):.2f}"
+          f"  p95: {det['fp32'].get('p95_ms', 0):.2f} -> {det['int8'].get('p95_ms', 0):.2f}"
+          f"  (x{det['speedup_p50'] or 0:.2f})")
+    print(f"  faces: {det['fp32_faces']} FP32, {det['int8_faces']} INT8, {det['matched_faces']} matched")
+    print(f"  recall: {det['recall']}  precision: {det['precision']}  mean IoU: {det['mean_iou']}  p05 IoU: {det['p05_iou']}")
+    ga = report.get('genderage')
+    if ga:
+        print("Genderage (same FP32 faces)")
+        print(f"  ms/face p50: {ga['fp32'].get('p50_ms', 0):.2f} -> {ga['int8'].get('p50_ms', 0):.2f}")
+        print(f"  gender agreement: {ga['gender_agreement']}  mean |age error|: {ga['mean_abs_age_error']}")
+
+
+if __name__ == "__main__":
+    quant_args = parse_args()
+    det_size = (quant_args.det_size, quant_args.det_size)
+    total = quant_args.calibration_frames + quant_args.eval_frames
+    frames = load_frames(quant_args.source, total, det_size, not quant_args.no_rotate)
+    if len(frames) > quant_args.calibration_frames:
+        calibration_frames = frames[:quant_args.calibration_frames]
+        eval_frames = frames[quant_args.calibration_frames:]
+    else:
+        print(f"Only {len(frames)} frames available; calibrating and evaluating on the same frames")
+        calibration_frames = eval_frames = frames
+    print(f"{len(calibration_frames)} calibration frames, {len(eval_frames)} evaluation frames from {quant_args.source}")
+
+    session_profile = load_session_profile(quant_args.profile)
+    modules = ['detection', 'genderage']
+    fp32 = FaceModels(allowed_modules=modules, session_profile=session_profile, cache_dir=None)
+    fp32.prepare(ctx_id=-1, det_size=det_size)
+
+    det_feeds, ga_feeds = record_calibration_feeds(fp32, calibration_frames, quant_args.genderage)
+    print(f"Recorded {len(det_feeds)} detector and {len(ga_feeds)} genderage calibration inputs")
+
+    os.makedirs(quant_args.output_dir, exist_ok=True)
+    overrides = {}
+    targets = [('detection', det_feeds)]
+    if quant_args.genderage:
+        if ga_feeds:
+            targets.append(('genderage', ga_feeds))
+        else:
+            print("No faces in the calibration frames, genderage stays FP32")
+    for taskname, feeds in targets:
+        model = fp32.models[taskname]
+        stem = os.path.splitext(os.path.basename(model.model_file))[0]
+        output_path = os.path.join(quant_args.output_dir, f"{stem}_int8.onnx")
+        quantize_model(model.model_file, output_path, feeds, quant_args.format, quant_args.per_channel)
+        overrides[taskname] = {'path': output_path}
+        for attr in ('input_mean', 'input_std'):
+            if hasattr(model, attr):
+                overrides[taskname][attr] = float(getattr(model, attr))
+
+    int8 = FaceModels(allowed_modules=modules, session_profile=session_profile, cache_dir=None, model_overrides=overrides)
+    int8.prepare(ctx_id=-1, det_size=det_size)
+
+    report = compare_models(fp32, int8, eval_frames, quant_args.iou_threshold, quant_args.warmup,
+                            'genderage' in overrides)
+    report.update({
+        'source': quant_args.source,
+        'det_size': list(det_size),
+        'calibration_frames': len(calibration_frames),
+        'eval_frames': len(eval_frames),
+        'format': quant_args.format,
+        'per_channel': quant_args.per_channel,
+        'iou_threshold': quant_args.iou_threshold,
+        'models': overrides,
+    })
+    print_report(report)
+
+    if quant_args.output:
+        with open(quant_args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport written to {quant_args.output}")
+    if quant_args.write_profile:
+        profile_overrides = load_model_overrides(quant_args.write_profile)
+        profile_overrides.update(overrides)
+        save_model_overrides(profile_overrides, quant_args.write_profile)
+        print(f"INT8 models listed in {quant_args.write_profile}")
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+One-shot ONNX Runtime tuner for the face detector.
+
+Sweeps intra-op thread counts and graph optimization levels against
+recorded frames on the target box, then writes the fastest session
+profile to disk. face_detection_worker loads it at startup
+(main.py --ort-profile, default ort_profile.json).
+
+Usage:
+    uv run benchmarks/tune_ort_session.py --source saved_frames/
+    uv run benchmarks/tune_ort_session.py --source bundles/lunch_rush --threads 1,2,4 --levels extended,all
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from frame_preprocess import DetectorPreprocessor
+from frame_source import PACING_FAST, open_frame_source
+from ort_session import (DEFAULT_SESSION_PROFILE, GRAPH_OPTIMIZATION_LEVELS, ORT_PROFILE_PATH,
+                         FaceModels, allowed_cpu_count, describe_session_profile, save_session_profile)
+from vision_metrics import percentile
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Find the fastest ONNX Runtime session settings for the face detector")
+    parser.add_argument("--source", default="saved_frames", help="Video file, JPEG directory or recorded bundle")
+    parser.add_argument("--frames", type=int, default=60, help="Number of frames to time per configuration")
+    parser.add_argument("--warmup", type=int, default=5, help="Untimed runs per configuration")
+    parser.add_argument("--threads", default="", help="Comma-separated intra-op thread counts (default: 1, 2, 4, ... up to the allowed cores)")
+    parser.add_argument("--levels", default="basic,extended,all", help="Comma-separated graph optimization levels")
+    parser.add_argument("--det-size", type=int, default=320, help="Square detector input size")
+    parser.add_argument("--no-rotate", action="store_true", help="Frames are not rotated for the detector (ENABLE_FRAME_ROTATION = False)")
+    parser.add_argument("--output", default=ORT_PROFILE_PATH, help="Profile file to write")
+    return parser.parse_args()
+
+
+def default_thread_counts():
+    """Powers of two up to the number of cores this process may use, plus that number."""
+    limit = allowed_cpu_count()
+    counts = []
+    n = 1
+    while n < limit:
+        counts.append(n)
+        n *= 2
+    counts.append(limit)
+    return counts
+
+
+def load_frames(source_spec, count, det_size, rotate):
+    """Read up to `count` frames and letterbox them exactly as the camera loop does."""
+    source = open_frame_source(source_spec, pacing=PACING_FAST)
+    if not source.open():
+        raise SystemExit(f"Could not open frame source: {source_spec}")
+    preprocessor = DetectorPreprocessor(det_size, rotate=rotate)
+    frames = []
+    try:
+        while len(frames) < count:
+            ret, frame = source.read()
+            if not ret:
+                break
+            frames.append(preprocessor.prepare(frame))
+    finally:
+        source.release()
+    if not frames:
+        raise SystemExit(f"No frames read from {source_spec}")
+    return frames
+
+
+def time_profile(profile, frames, det_size, warmup):
+    """Load the detector with `profile` and return per-frame latencies in seconds."""
+    models = FaceModels(allowed_modules=['detection'], session_profile=profile, cache_dir=None)
+    models.prepare(ctx_id=-1, det_size=det_size)
+    detector = models.det_model
+    for i in range(warmup):
+        detector.detect(frames[i % len(frames)], max_num=0, metric='default')
+    latencies = []
+    for frame in frames:
+        start = time.perf_counter()
+        detector.detect(frame, max_num=0, metric='default')
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+if __name__ == "__main__":
+    tune_args = parse_args()
+    det_size = (tune_args.det_size, tune_args.det_size)
+    thread_counts = [int(t) for t in tune_args.threads.split(',') if t] or default_thread_counts()
+    levels = [level for level in tune_args.levels.split(',') if level]
+    for level in levels:
+        if level not in GRAPH_OPTIMIZATION_LEVELS:
+            raise SystemExit(f"Unknown optimization level: {level} (expected one of {', '.join(GRAPH_OPTIMIZATION_LEVELS)})")
+
+    frames = load_frames(tune_args.source, tune_args.frames, det_size, not tune_args.no_rotate)
+    print(f"Tuning on {len(frames)} frames from {tune_args.source}, {allowed_cpu_count()} usable cores")
+
+    results = []
+    for level in levels:
+        for threads in thread_counts:
+            profile = dict(DEFAULT_SESSION_PROFILE, intra_op_num_threads=threads, graph_optimization_level=level)
+            latencies = sorted(time_profile(profile, frames, det_size, tune_args.warmup))
+            result = {
+                'session': profile,
+                'p50_ms': round(percentile(latencies, 50) * 1000.0, 3),
+                'p95_ms': round(percentile(latencies, 95) * 1000.0, 3),
+                'mean_ms': round(sum(latencies) / len(latencies) * 1000.0, 3),
+            }
+            results.append(result)
+            print(f"{describe_session_profile(profile):>60}: p50 {result['p50_ms']:.1f}ms, p95 {result['p95_ms']:.1f}ms")
+
+    best = min(results, key=lambda r: (r['p50_ms'], r['p95_ms']))
+    save_session_profile(best['session'], tune_args.output, results)
+    print(f"\nFastest: {describe_session_profile(best['session'])} (p50 {best['p50_ms']:.1f}ms)")
+    print(f"Profile written to {tune_args.output}")
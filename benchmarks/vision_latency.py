@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+End-to-end vision latency benchmark.
+
+Replays recorded footage through main.face_detection_loop and
+main.face_detection_worker and reports p50/p95/p99 latency per stage
+(capture, preprocess, frame mailbox wait, FaceAnalysis.get, greeting
+decision), frames per second and CPU seconds per frame (including the
+detection child process with --detection-process) as JSON.
+
+Usage:
+    uv run benchmarks/vision_latency.py --source footage.mp4 --pacing fast --output bench.json
+    uv run benchmarks/vision_latency.py --source bundles/lunch_rush --compare bench.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import queue
+import sys
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vision_metrics import get_vision_metrics
+
+# Stages compared between runs
+COMPARE_KEYS = ('p50_ms', 'p95_ms', 'p99_ms')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Replay footage through the vision pipeline and report stage latencies")
+    parser.add_argument("--source", required=True, help="Video file, JPEG directory or recorded bundle")
+    parser.add_argument("--pacing", default="fast", choices=("realtime", "fast"), help="Replay pacing (default: fast)")
+    parser.add_argument("--decode-scale", type=int, default=1, choices=(1, 2, 4),
+                        help="Reduced-scale JPEG decode for the detection path (JPEG directories and bundles)")
+    parser.add_argument("--detection-process", action="store_true",
+                        help="Run the face detector in a separate process (shared-memory frame transport)")
+    parser.add_argument("--roi", default="", help="Detection region of interest, passed to main.py's --roi")
+    parser.add_argument("--max-seconds", type=float, default=0, help="Stop after this many seconds (0 = whole source)")
+    parser.add_argument("--label", default="", help="Free-form build label stored in the report")
+    parser.add_argument("--output", default="", help="Write the JSON report to this file (default: stdout)")
+    parser.add_argument("--compare", default="", help="Previous JSON report to print a per-stage comparison against")
+    parser.add_argument("--greet-gender", action="store_true",
+                        help="Enable gender-aware greetings so on-demand genderage inference is included")
+    parser.add_argument("--no-regreet", action="store_true",
+                        help="Only greet once per visitor instead of re-arming the greeting after every greeting")
+    return parser.parse_args()
+
+
+def speech_sink(app_module, regreet, stop_event):
+    """Stand-in for the speech workers: drain queued speech without playing it."""
+    while not stop_event.is_set():
+        try:
+            request = app_module.pending_speech_requests.get(timeout=0.1)
+        except queue.Empty:
+            continue
+        if request is not None and request.get('type') == 'instant_greeting' and regreet:
+            # Re-arm so every detection with faces exercises the greeting path
+            app_module.is_greeted = False
+        app_module.pending_speech_requests.task_done()
+
+
+def run_benchmark(bench_args):
+    # main.py parses its own CLI at import time
+    sys.argv = ['main.py', '--headless', '--source', bench_args.source, '--pacing', bench_args.pacing,
+                '--decode-scale', str(bench_args.decode_scale)]
+    if bench_args.detection_process:
+        sys.argv.append('--detection-process')
+    if bench_args.roi:
+        sys.argv += ['--roi', bench_args.roi]
+    import main as app_module
+    app_module.setup_detection_process()
+
+    app_module.GREET_GENDER_ENABLED = bench_args.greet_gender
+    metrics = get_vision_metrics()
+    metrics.reset()
+
+    sink_stop = threading.Event()
+    sink_thread = threading.Thread(target=speech_sink, args=(app_module, not bench_args.no_regreet, sink_stop),
+                                   name="speech-worker-sink", daemon=True)
+    sink_thread.start()
+
+    worker_thread = threading.Thread(target=app_module.face_detection_worker, name="face-detection-worker", daemon=True)
+    worker_thread.start()
+
+    if bench_args.max_seconds > 0:
+        timer = threading.Timer(bench_args.max_seconds, app_module.stop_event.set)
+        timer.daemon = True
+        timer.start()
+
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    children_start = os.times()
+    app_module.face_detection_loop()  # Returns at end of source
+    worker_thread.join(timeout=10.0)
+    cpu_seconds = time.process_time() - cpu_start
+    wall_seconds = time.perf_counter() - wall_start
+
+    sink_stop.set()
+    sink_thread.join(timeout=1.0)
+    if app_module.detection_process is not None:
+        app_module.detection_process.stop()
+    # Detection child CPU (os.times() counts children once they have been joined), so both modes compare
+    children_end = os.times()
+    cpu_seconds += (children_end.children_user - children_start.children_user
+                    + children_end.children_system - children_start.children_system)
+
+    summary = metrics.summary()
+    counters = summary['counters']
+    frames_captured = counters.get('frames_captured', 0)
+    frames_detected = counters.get('frames_detected', 0)
+
+    return {
+        'label': bench_args.label,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'source': bench_args.source,
+        'pacing': bench_args.pacing,
+        'decode_scale': bench_args.decode_scale,
+        'detection_process': bench_args.detection_process,
+        'roi': bench_args.roi,
+        'wall_seconds': round(wall_seconds, 3),
+        'cpu_seconds': round(cpu_seconds, 3),
+        'frames_captured': frames_captured,
+        'frames_detected': frames_detected,
+        'capture_fps': round(frames_captured / wall_seconds, 2) if wall_seconds > 0 else 0.0,
+        'detection_fps': round(frames_detected / wall_seconds, 2) if wall_seconds > 0 else 0.0,
+        'cpu_seconds_per_frame': round(cpu_seconds / frames_detected, 4) if frames_detected else None,
+        'stages': summary['stages'],
+        'counters': counters,
+        'system': {
+            'platform': platform.platform(),
+            'machine': platform.machine(),
+            'python': platform.python_version(),
+            'cpu_count': os.cpu_count(),
+        },
+    }
+
+
+def print_comparison(report, baseline):
+    """Print per-stage latency deltas against a previous report."""
+    print(f"\n=== Vision latency: {report.get('label') or 'current'} vs {baseline.get('label') or 'baseline'} ===")
+    for stage, stats in report['stages'].items():
+        base_stats = baseline.get('stages', {}).get(stage)
+        if not base_stats or not stats.get('count') or not base_stats.get('count'):
+            continue
+        parts = []
+        for key in COMPARE_KEYS:
+            old, new = base_stats[key], stats[key]
+            delta = ((new - old) / old * 100.0) if old else 0.0
+            parts.append(f"{key[:-3]} {old:.1f}->{new:.1f}ms ({delta:+.0f}%)")
+        print(f"{stage:>20}: " + ", ".join(parts))
+    for key in ('detection_fps', 'cpu_seconds_per_frame'):
+        print(f"{key:>20}: {baseline.get(key)} -> {report.get(key)}")
+
+
+if __name__ == "__main__":
+    bench_args = parse_args()
+    report = run_benchmark(bench_args)
+
+    report_json = json.dumps(report, indent=2)
+    if bench_args.output:
+        with open(bench_args.output, 'w', encoding='utf-8') as f:
+            f.write(report_json)
+        print(f"Benchmark report written to {bench_args.output}")
+    else:
+        print(report_json)
+
+    if bench_args.compare:
+        with open(bench_args.compare, 'r', encoding='utf-8') as f:
+            print_comparison(report, json.load(f))
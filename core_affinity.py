@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Core Affinity Planner for AI Kiosk Application
+Pins each subsystem's threads to its own cores instead of restricting the
+whole process: ONNX Runtime inference on some cores, audio capture and
+playback on a dedicated core, network/websocket/polling threads on
+another. Plans come from a profile per hardware type and are applied per
+thread through native thread IDs (os.sched_setaffinity). Threads started
+natively by a pinned thread (PortAudio callbacks, the ffmpeg decoder)
+inherit its cores; ONNX Runtime's intra-op pool is pinned through the
+session options.
+"""
+
+import os
+import re
+import threading
+from typing import Dict, Optional, Sequence, Tuple
+
+from system_metrics import DEFAULT_SYSFS_ROOT, OTHER_SUBSYSTEM, subsystem_for_thread
+
+AFFINITY_SUPPORTED = hasattr(os, 'sched_setaffinity') and hasattr(os, 'sched_getaffinity')
+
+# Subsystem -> cores for 4-core boards
+QUAD_CORE_PLAN = {
+    'vision': (0, 1),     # Camera loop, face detection worker, ONNX Runtime intra-op threads
+    'audio': (3,),        # Microphone capture
+    'tts': (3,),          # Speech workers and playback (the ffmpeg decoder inherits the core)
+    'websocket': (2,),
+    'polling': (2,),
+    OTHER_SUBSYSTEM: (2,),  # Main thread and library threads
+}
+
+# Plans per hardware type ('generic' is computed from the core count, see generic_plan)
+AFFINITY_PROFILES = {
+    'raspberry_pi_3': QUAD_CORE_PLAN,
+    'raspberry_pi_4': QUAD_CORE_PLAN,
+    'raspberry_pi_5': QUAD_CORE_PLAN,
+}
+
+
+def detect_hardware_type(sysfs_root: str = DEFAULT_SYSFS_ROOT) -> str:
+    """Affinity profile name for this board, from the device tree model string."""
+    try:
+        with open(os.path.join(sysfs_root, 'firmware', 'devicetree', 'base', 'model'), 'r') as f:
+            model = f.read().strip('\x00\n ')
+    except OSError:
+        return 'generic'
+    match = re.match(r'Raspberry Pi (\d+)', model)
+    if match and f"raspberry_pi_{match.group(1)}" in AFFINITY_PROFILES:
+        return f"raspberry_pi_{match.group(1)}"
+    return 'generic'
+
+
+def generic_plan(cores: Sequence[int]) -> Optional[Dict[str, Tuple[int, ...]]]:
+    """Last core for audio, the one before it for network threads, the rest for vision."""
+    cores = sorted(cores)
+    if len(cores) < 4:
+        return None  # Too few cores to dedicate any of them
+    audio, network, vision = (cores[-1],), (cores[-2],), tuple(cores[:-2])
+    return {
+        'vision': vision,
+        'audio': audio,
+        'tts': audio,
+        'websocket': network,
+        'polling': network,
+        OTHER_SUBSYSTEM: network,
+    }
+
+
+class AffinityPlanner:
+    """
+    Per-subsystem core plan, applied to threads by name.
+
+    configure() picks the plan once at startup. apply() pins every Python
+    thread not pinned yet (by native ID, subsystem from its name) and is
+    cheap enough to call periodically so threads started later are picked
+    up. Without a plan every method is a no-op.
+    """
+
+    def __init__(self):
+        self.plan: Optional[Dict[str, Tuple[int, ...]]] = None
+        self.profile: Optional[str] = None
+        self._pinned: Dict[int, Tuple[int, ...]] = {}  # native thread ID -> cores
+        self._lock = threading.Lock()
+
+    @property
+    def active(self) -> bool:
+        return self.plan is not None
+
+    def configure(self, profile: str = 'auto', sysfs_root: str = DEFAULT_SYSFS_ROOT) -> bool:
+        """Select the plan for `profile` ('auto', 'none', 'generic' or a hardware type). Returns True if a plan is active."""
+        self.plan, self.profile = None, None
+        if profile == 'none':
+            return False
+        if not AFFINITY_SUPPORTED:
+            print("Core affinity: not supported on this platform")
+            return False
+        name = detect_hardware_type(sysfs_root) if profile == 'auto' else profile
+        allowed = sorted(os.sched_getaffinity(0))
+        if name == 'generic':
+            plan = generic_plan(allowed)
+        elif name in AFFINITY_PROFILES:
+            plan = AFFINITY_PROFILES[name]
+        else:
+            print(f"Core affinity: unknown profile '{name}' (expected auto, none, generic or {', '.join(AFFINITY_PROFILES)})")
+            return False
+        if plan is None:
+            print(f"Core affinity: {len(allowed)} usable cores, not pinning subsystems")
+            return False
+
+        # Stay within the cores the process was started with (taskset, cgroups)
+        self.plan = {subsystem: tuple(c for c in cores if c in allowed) or tuple(allowed)
+                     for subsystem, cores in plan.items()}
+        self.profile = name
+        print(f"Core affinity: {name} plan " + ", ".join(f"{subsystem} {list(cores)}" for subsystem, cores in self.plan.items()))
+        return True
+
+    def adopt(self, plan: Optional[Dict[str, Tuple[int, ...]]], profile: Optional[str] = None) -> bool:
+        """Use a plan another process resolved with configure() (detector child processes). Returns True if a plan is active."""
+        self.plan = dict(plan) if plan else None
+        self.profile = profile if plan else None
+        return self.active
+
+    def cores_for(self, subsystem: str) -> Optional[Tuple[int, ...]]:
+        if self.plan is None:
+            return None
+        return self.plan.get(subsystem, self.plan.get(OTHER_SUBSYSTEM))
+
+    def apply(self) -> int:
+        """Pin threads that are new or not on their subsystem's cores yet. Returns the number pinned."""
+        if self.plan is None:
+            return 0
+        pinned = 0
+        with self._lock:
+            alive = set()
+            for thread in threading.enumerate():
+                native_id = thread.native_id
+                if native_id is None:
+                    continue
+                alive.add(native_id)
+                cores = self.cores_for(subsystem_for_thread(thread.name))
+                if self._pinned.get(native_id) == cores:
+                    continue
+                try:
+                    os.sched_setaffinity(native_id, cores)
+                    self._pinned[native_id] = cores
+                    pinned += 1
+                except OSError as e:
+                    print(f"Core affinity: could not pin {thread.name} to {list(cores)}: {e}")
+                    self._pinned[native_id] = cores  # Don't retry every call
+            for native_id in list(self._pinned):
+                if native_id not in alive:
+                    del self._pinned[native_id]
+        return pinned
+
+    def pin_process(self, pid: int, subsystem: str) -> bool:
+        """Pin a process's main thread, 0 for the calling thread (threads it starts later inherit the cores)."""
+        cores = self.cores_for(subsystem)
+        if cores is None:
+            return False
+        try:
+            os.sched_setaffinity(pid, cores)
+            return True
+        except OSError as e:
+            print(f"Core affinity: could not pin process {pid} to {list(cores)}: {e}")
+            return False
+
+    def ort_thread_affinities(self, intra_op_num_threads: int) -> Optional[str]:
+        """
+        Value for ONNX Runtime's session.intra_op_thread_affinities: one entry per
+        pool thread (the calling thread is the first intra-op thread), processor IDs from 1.
+        """
+        cores = self.cores_for('vision')
+        if cores is None or intra_op_num_threads < 2:
+            return None
+        entry = ','.join(str(core + 1) for core in cores)
+        return ';'.join([entry] * (intra_op_num_threads - 1))
+
+
+# Global planner instance
+affinity_planner = AffinityPlanner()
+
+def get_affinity_planner() -> AffinityPlanner:
+    """Get the global core affinity planner."""
+    return affinity_planner
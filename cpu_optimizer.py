@@ -10,6 +10,9 @@ import os
 import sys
 from typing import Dict, Any, Optional
 
+from core_affinity import get_affinity_planner
+from system_metrics import DEFAULT_SYSFS_ROOT, ThermalReader, get_system_sampler
+
 try:
     import psutil
     PSUTIL_AVAILABLE = True
@@ -21,9 +24,37 @@ class CPUOptimizer:
     """
     Real-time CPU optimization manager for the AI kiosk application.
     Monitors CPU usage and provides adaptive performance adjustments.
+    
+    Level changes have hysteresis: moving to a more demanding level needs
+    CPU/memory usage `hysteresis_margin` percent below the threshold that
+    would push it back down, and every change needs the same recommendation
+    `confirm_samples` checks in a row, so levels do not flap. Consumers
+    apply the current level's settings live (camera loop: detector input
+    size and camera resolution; listener: audio block size at the next
+    recognition restart).
+    
+    Before lowering the level for everyone, the optimizer looks at the
+    per-subsystem CPU rates from the system metrics sampler. If one
+    throttleable subsystem (audio, websocket, polling) is using most of
+    the process's CPU, only that subsystem is slowed down via its throttle
+    factor (get_throttle), and throttles are relaxed again before the
+    level steps back up.
+    
+    On fanless hardware the SoC temperature (sysfs thermal zones, read
+    under `sysfs_root`) also caps the level: within `thermal_headroom`
+    degrees of the throttle temperature the detection rate and resolution
+    are lowered before the firmware clocks the CPU down, and a detected
+    frequency cap forces ultra_low. Throttle events are logged.
     """
     
-    def __init__(self, target_cpu_usage: float = 70.0):
+    # Most to least demanding
+    LEVEL_ORDER = ('ultra_high', 'high', 'medium', 'low', 'ultra_low')
+    
+    # Subsystems that scale their own work by get_throttle(); anything else is handled by the level
+    THROTTLEABLE_SUBSYSTEMS = ('audio', 'websocket', 'polling')
+    
+    def __init__(self, target_cpu_usage: float = 70.0, hysteresis_margin: float = 8.0, confirm_samples: int = 3,
+                 sysfs_root: str = DEFAULT_SYSFS_ROOT):
         self.target_cpu_usage = target_cpu_usage
         self.monitoring_active = False
         self.monitor_thread: Optional[threading.Thread] = None
@@ -34,7 +65,7 @@ class CPUOptimizer:
                 'face_detection_fps': 5,
                 'face_detection_interval': 0.3,
                 'audio_block_size': 6400,
-                'detection_size': (736, 736),
+                'detection_size': (384, 384),
                 'camera_resolution': (480, 360),
                 'sleep_multiplier': 1.0
             },
@@ -42,7 +73,7 @@ class CPUOptimizer:
                 'face_detection_fps': 4,
                 'face_detection_interval': 0.4,
                 'audio_block_size': 8000,
-                'detection_size': (736, 736),
+                'detection_size': (352, 352),
                 'camera_resolution': (440, 330),
                 'sleep_multiplier': 1.2
             },
@@ -50,7 +81,7 @@ class CPUOptimizer:
                 'face_detection_fps': 3,
                 'face_detection_interval': 0.6,
                 'audio_block_size': 9600,
-                'detection_size': (736, 736),
+                'detection_size': (320, 320),
                 'camera_resolution': (400, 300),
                 'sleep_multiplier': 1.5
             },
@@ -58,7 +89,7 @@ class CPUOptimizer:
                 'face_detection_fps': 2,
                 'face_detection_interval': 0.8,
                 'audio_block_size': 12800,
-                'detection_size': (736, 736),
+                'detection_size': (288, 288),
                 'camera_resolution': (360, 270),
                 'sleep_multiplier': 2.0
             },
@@ -66,7 +97,7 @@ class CPUOptimizer:
                 'face_detection_fps': 1,
                 'face_detection_interval': 1.0,
                 'audio_block_size': 16000,
-                'detection_size': (736, 736),
+                'detection_size': (256, 256),
                 'camera_resolution': (320, 240),
                 'sleep_multiplier': 3.0
             }
@@ -77,31 +108,43 @@ class CPUOptimizer:
         self.adjustment_cooldown = 5.0  # Seconds between adjustments
         self.last_adjustment = 0
         
-    def get_cpu_usage(self) -> float:
-        """Get current CPU usage percentage."""
-        if not PSUTIL_AVAILABLE:
-            return 50.0  # Default assumption
+        # Hysteresis
+        self.hysteresis_margin = hysteresis_margin  # CPU/memory percent below a threshold needed to step back up
+        self.confirm_samples = confirm_samples      # Consecutive identical recommendations before changing level
+        self._pending_level = None
+        self._pending_count = 0
+        self.level_changes = 0
         
-        try:
-            return psutil.cpu_percent(interval=0.1)
-        except Exception as e:
-            print(f"Error getting CPU usage: {e}")
-            return 50.0
+        # Per-subsystem throttling
+        self.subsystem_throttle = {name: 1.0 for name in self.THROTTLEABLE_SUBSYSTEMS}
+        self.max_throttle = 4.0      # Largest slow-down factor for a single subsystem
+        self.offender_share = 0.4    # Share of the process's CPU that makes a subsystem the offender
+        self.offender_min_cpu = 10.0 # Percent of one core below which nothing counts as an offender
+        self.throttle_changes = 0
+        
+        # Thermal limits
+        self.thermal = ThermalReader(sysfs_root)
+        self.thermal_headroom = {        # Degrees below the throttle temperature at which a level is the most allowed
+            'ultra_low': 3.0,
+            'low': 8.0,
+            'medium': 15.0,
+        }
+        self.thermal_hysteresis = 3.0    # Extra degrees of headroom needed to step back up
+        self.thermal_state = self.thermal.read()
+        self.thermal_limited = False     # Current recommendation comes from temperature, not CPU load
+        self.thermal_throttle_events = 0
+        
+    def get_cpu_usage(self) -> float:
+        """Get current CPU usage percentage (latest sampler snapshot, never blocks)."""
+        return get_system_sampler().snapshot()['cpu_percent']
     
     def get_memory_usage(self) -> Dict[str, float]:
-        """Get current memory usage statistics."""
-        if not PSUTIL_AVAILABLE:
-            return {'percent': 50.0, 'available': 1000}
-        
-        try:
-            memory = psutil.virtual_memory()
-            return {
-                'percent': memory.percent,
-                'available': memory.available / (1024 * 1024)  # MB
-            }
-        except Exception as e:
-            print(f"Error getting memory usage: {e}")
-            return {'percent': 50.0, 'available': 1000}
+        """Get current memory usage statistics (latest sampler snapshot, never blocks)."""
+        snapshot = get_system_sampler().snapshot()
+        return {
+            'percent': snapshot['memory_percent'],
+            'available': snapshot['memory_available_mb']  # MB
+        }
     
     def analyze_performance_need(self) -> str:
         """
@@ -118,19 +161,85 @@ class CPUOptimizer:
         
         # Calculate average CPU usage over recent history
         avg_cpu = sum(self.cpu_history) / len(self.cpu_history)
+        thermal = self.check_thermal()
         
-        # Determine appropriate performance level
-        if avg_cpu > 85 or memory_usage['percent'] > 90:
+        # Shed load as soon as a threshold is crossed...
+        level = self._limit_level(self._level_for_usage(avg_cpu, memory_usage['percent']),
+                                  self._level_for_temperature(thermal))
+        if self._level_rank(level) >= self._level_rank(self.current_level):
+            return level
+        # ...but only step back up once usage is clearly below the thresholds
+        level = self._limit_level(self._level_for_usage(avg_cpu, memory_usage['percent'], margin=self.hysteresis_margin),
+                                  self._level_for_temperature(thermal, margin=self.thermal_hysteresis))
+        if self._level_rank(level) < self._level_rank(self.current_level):
+            return level
+        return self.current_level
+    
+    def _limit_level(self, usage_level: str, thermal_level: str) -> str:
+        """The less demanding of the two levels; records whether temperature decided it."""
+        self.thermal_limited = self._level_rank(thermal_level) > self._level_rank(usage_level)
+        return thermal_level if self.thermal_limited else usage_level
+    
+    def _level_for_temperature(self, thermal: Dict[str, Any], margin: float = 0.0) -> str:
+        """Most demanding level the SoC temperature allows, needing `margin` extra degrees of headroom."""
+        if thermal['throttled']:
+            return 'ultra_low'
+        if thermal['temperature_c'] is None:
+            return 'ultra_high'
+        headroom = thermal['throttle_temp_c'] - thermal['temperature_c']
+        for level in ('ultra_low', 'low', 'medium'):
+            if headroom < self.thermal_headroom[level] + margin:
+                return level
+        return 'ultra_high'
+    
+    def check_thermal(self) -> Dict[str, Any]:
+        """Read temperature and CPU frequency limits, logging throttle events."""
+        previous = self.thermal_state
+        thermal = self.thermal.read()
+        self.thermal_state = thermal
+        if thermal['throttled'] and not previous['throttled']:
+            self.thermal_throttle_events += 1
+            print(f"CPU Optimizer: SoC throttling detected - {self._describe_thermal(thermal)}")
+        elif previous['throttled'] and not thermal['throttled']:
+            print(f"CPU Optimizer: SoC throttling cleared - {self._describe_thermal(thermal)}")
+        return thermal
+    
+    def _describe_thermal(self, thermal: Dict[str, Any]) -> str:
+        parts = []
+        if thermal['temperature_c'] is not None:
+            parts.append(f"{thermal['temperature_c']:.1f}C ({thermal['zone']}, limit {thermal['throttle_temp_c']:.0f}C)")
+        if thermal['cpu_freq_mhz'] is not None:
+            parts.append(f"{thermal['cpu_freq_mhz']:.0f}/{thermal['cpu_max_freq_mhz'] or 0:.0f}MHz")
+        if thermal['freq_capped']:
+            parts.append("frequency capped")
+        if thermal['firmware_flags']:
+            parts.append(f"firmware flags 0x{thermal['firmware_flags']:x}")
+        return ", ".join(parts) or "no thermal data"
+    
+    def _level_for_usage(self, avg_cpu: float, memory_percent: float, margin: float = 0.0) -> str:
+        """Level for the given usage, with every threshold lowered by `margin` percent."""
+        if avg_cpu > 85 - margin or memory_percent > 90 - margin:
             return 'ultra_low'
-        elif avg_cpu > 75 or memory_usage['percent'] > 80:
+        elif avg_cpu > 75 - margin or memory_percent > 80 - margin:
             return 'low'
-        elif avg_cpu > 65 or memory_usage['percent'] > 70:
+        elif avg_cpu > 65 - margin or memory_percent > 70 - margin:
             return 'medium'
-        elif avg_cpu > 50:
+        elif avg_cpu > 50 - margin:
             return 'high'
         else:
             return 'ultra_high'
     
+    def _level_rank(self, level: str) -> int:
+        return self.LEVEL_ORDER.index(level) if level in self.LEVEL_ORDER else self.LEVEL_ORDER.index('medium')
+    
+    def confirm_level(self, level: str) -> bool:
+        """True once `level` has been recommended `confirm_samples` times in a row."""
+        if level != self._pending_level:
+            self._pending_level = level
+            self._pending_count = 0
+        self._pending_count += 1
+        return self._pending_count >= self.confirm_samples
+    
     def get_performance_settings(self, level: str = None) -> Dict[str, Any]:
         """Get performance settings for specified level."""
         if level is None:
@@ -138,6 +247,65 @@ class CPUOptimizer:
         
         return self.performance_levels.get(level, self.performance_levels['medium'])
     
+    def detection_sizes(self):
+        """Every detector input size a level can switch to, largest first (prepared when the detector starts)."""
+        sizes = {tuple(settings['detection_size']) for settings in self.performance_levels.values()}
+        return sorted(sizes, key=lambda size: size[0] * size[1], reverse=True)
+    
+    def find_offender(self) -> Optional[str]:
+        """Subsystem using the largest share of the process's CPU, if it dominates."""
+        rates = get_system_sampler().snapshot()['subsystem_cpu']
+        total = sum(rates.values())
+        if not rates or total <= 0:
+            return None
+        name, rate = max(rates.items(), key=lambda item: item[1])
+        if rate < self.offender_min_cpu or rate < self.offender_share * total:
+            return None
+        return name
+    
+    def get_throttle(self, subsystem: str) -> float:
+        """Slow-down factor for a subsystem's intervals/batch sizes (1.0 = not throttled)."""
+        return self.subsystem_throttle.get(subsystem, 1.0)
+    
+    def throttle_offender(self) -> bool:
+        """
+        Slow down the offending subsystem instead of lowering the level.
+        Returns True if the offender was throttled.
+        """
+        offender = self.find_offender()
+        if offender not in self.subsystem_throttle or self.subsystem_throttle[offender] >= self.max_throttle:
+            return False
+        current_time = time.time()
+        if current_time - self.last_adjustment < self.adjustment_cooldown:
+            return False
+        
+        throttle = min(self.subsystem_throttle[offender] * 2.0, self.max_throttle)
+        self.subsystem_throttle[offender] = throttle
+        self.last_adjustment = current_time
+        self.throttle_changes += 1
+        rates = get_system_sampler().snapshot()['subsystem_cpu']
+        print(f"CPU Optimizer: {offender} is using {rates.get(offender, 0.0):.0f}% CPU, throttled x{throttle:g} "
+              f"(level stays {self.current_level})")
+        return True
+    
+    def relax_throttles(self) -> bool:
+        """
+        Halve every subsystem throttle. Returns True if any throttle was relaxed.
+        """
+        throttled = [name for name, throttle in self.subsystem_throttle.items() if throttle > 1.0]
+        if not throttled:
+            return False
+        current_time = time.time()
+        if current_time - self.last_adjustment < self.adjustment_cooldown:
+            return False
+        
+        for name in throttled:
+            self.subsystem_throttle[name] = max(1.0, self.subsystem_throttle[name] / 2.0)
+        self.last_adjustment = current_time
+        self.throttle_changes += 1
+        print(f"CPU Optimizer: Relaxed throttles {self.subsystem_throttle}")
+        return True
+    
     def adjust_performance_level(self, new_level: str) -> bool:
         """
         Adjust performance level if needed and enough time has passed.
@@ -156,6 +324,7 @@ class CPUOptimizer:
         old_level = self.current_level
         self.current_level = new_level
         self.last_adjustment = current_time
+        self.level_changes += 1
         
         print(f"CPU Optimizer: Performance level changed from {old_level} to {new_level}")
         print(f"  New settings: {self.get_performance_settings()}")
@@ -168,15 +337,30 @@ class CPUOptimizer:
         
         while self.monitoring_active:
             try:
+                # Pin threads started since the last check to their subsystem's cores
+                get_affinity_planner().apply()
+                
                 # Analyze current performance needs
                 recommended_level = self.analyze_performance_need()
                 
-                # Adjust if needed
-                if self.adjust_performance_level(recommended_level):
+                rank_change = self._level_rank(recommended_level) - self._level_rank(self.current_level)
+                
+                # Adjust once the recommendation has held for a few checks. Shedding load
+                # throttles the offending subsystem if there is one; stepping back up
+                # relaxes subsystem throttles before raising the level.
+                if not self.confirm_level(recommended_level):
+                    pass
+                elif rank_change > 0 and not self.thermal_limited and self.throttle_offender():
+                    pass
+                elif rank_change < 0 and self.relax_throttles():
+                    pass
+                elif self.adjust_performance_level(recommended_level):
                     # Log current system stats
                     cpu_usage = self.get_cpu_usage()
                     memory_usage = self.get_memory_usage()
                     print(f"CPU Optimizer: Current stats - CPU: {cpu_usage:.1f}%, Memory: {memory_usage['percent']:.1f}%")
+                    if self.thermal_limited:
+                        print(f"CPU Optimizer: Level limited by temperature - {self._describe_thermal(self.thermal_state)}")
                 
                 # Wait before next check
                 time.sleep(2.0)
@@ -191,7 +375,8 @@ class CPUOptimizer:
             return
         
         self.monitoring_active = True
-        self.monitor_thread = threading.Thread(target=self.monitor_loop, daemon=True)
+        get_system_sampler().start()
+        self.monitor_thread = threading.Thread(target=self.monitor_loop, name="cpu-optimizer", daemon=True)
         self.monitor_thread.start()
         print("CPU Optimizer: Monitoring thread started")
     
@@ -208,7 +393,10 @@ class CPUOptimizer:
             'cpu_usage': self.get_cpu_usage(),
             'memory_usage': self.get_memory_usage(),
             'current_performance_level': self.current_level,
-            'performance_settings': self.get_performance_settings()
+            'performance_settings': self.get_performance_settings(),
+            'subsystem_throttle': dict(self.subsystem_throttle),
+            'thermal': self.thermal_state,
+            'thermal_throttle_events': self.thermal_throttle_events
         }
         
         if PSUTIL_AVAILABLE:
@@ -216,7 +404,9 @@ class CPUOptimizer:
                 info.update({
                     'cpu_count': psutil.cpu_count(),
                     'cpu_freq': psutil.cpu_freq()._asdict() if psutil.cpu_freq() else {},
-                    'load_average': os.getloadavg() if hasattr(os, 'getloadavg') else None
+                    'per_cpu_usage': get_system_sampler().snapshot()['per_cpu_percent'],
+                    'load_average': get_system_sampler().snapshot()['load_average'],
+                    'subsystem_cpu': get_system_sampler().snapshot()['subsystem_cpu']
                 })
             except Exception as e:
                 print(f"Error getting extended system info: {e}")
@@ -235,6 +425,14 @@ class CPUOptimizer:
         print(f"Audio Block Size: {info['performance_settings']['audio_block_size']}")
         if 'cpu_count' in info:
             print(f"CPU Cores: {info['cpu_count']}")
+        if info.get('subsystem_cpu'):
+            busiest = sorted(info['subsystem_cpu'].items(), key=lambda item: item[1], reverse=True)
+            print("Subsystem CPU: " + ", ".join(f"{name} {rate:.0f}%" for name, rate in busiest))
+        if info['thermal']['available']:
+            print(f"Thermal: {self._describe_thermal(info['thermal'])}, {info['thermal_throttle_events']} throttle events")
+        throttled = {name: throttle for name, throttle in info['subsystem_throttle'].items() if throttle > 1.0}
+        if throttled:
+            print(f"Throttled: {throttled}")
         print("=" * 35)
 
 # Global optimizer instance
@@ -260,20 +458,14 @@ def optimize_process_priority():
     except Exception as e:
         print(f"CPU Optimizer: Could not adjust process priority: {e}")
 
-def enable_cpu_affinity_optimization():
-    """Optimize CPU affinity if possible."""
-    if not PSUTIL_AVAILABLE:
-        return
-    
+def enable_cpu_affinity_optimization(profile: str = 'auto'):
+    """
+    Select the per-subsystem core plan (see core_affinity.py). Threads are
+    pinned by get_affinity_planner().apply() once they are running; the
+    whole process keeps every core.
+    """
     try:
-        process = psutil.Process()
-        cpu_count = psutil.cpu_count()
-        
-        if cpu_count > 4:
-            # Use only some cores to leave others free for system
-            cores_to_use = list(range(cpu_count // 2))
-            process.cpu_affinity(cores_to_use)
-            print(f"CPU Optimizer: Limited to cores {cores_to_use}")
+        get_affinity_planner().configure(profile)
     except Exception as e:
         print(f"CPU Optimizer: Could not optimize CPU affinity: {e}")
 
@@ -284,6 +476,7 @@ if __name__ == "__main__":
     # Apply system optimizations
     optimize_process_priority() 
     enable_cpu_affinity_optimization()
+    get_affinity_planner().apply()
     
     # Start monitoring
     optimizer.start_monitoring()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Deep Idle Coordinator for AI Kiosk Application
+While the task monitor has the application disabled, subsystems drop into
+a low-power state: the camera is released, the detector's ONNX sessions
+are optionally unloaded, speech recognition is stopped and suggestion
+timers are suspended. This module holds the shared enabled/disabled
+state so those threads block instead of polling, and measures how long
+the warm start takes once the application is enabled again.
+"""
+
+import ctypes
+import ctypes.util
+import gc
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from vision_metrics import STAGE_RESUME, get_vision_metrics
+
+# Components that report in before a resume counts as complete
+RESUME_COMPONENTS = ('camera', 'detector')
+
+
+def trim_process_memory():
+    """Collect garbage and hand freed heap pages back to the OS (glibc only)."""
+    gc.collect()
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6')
+        libc.malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+
+
+class DeepIdle:
+    """
+    Application enabled/disabled state plus resume latency measurement.
+
+    enter() and resume() are called from the task monitor callbacks. Each
+    component calls component_ready(name) once it is working again after a
+    resume (camera: first frame read; detector: models loaded); when every
+    component in `components` has reported, the resume latency is recorded
+    as the 'resume' vision stage and compared with `resume_target`.
+    """
+
+    def __init__(self, resume_target: float = 3.0, unload_models: bool = False,
+                 components: Tuple[str, ...] = RESUME_COMPONENTS):
+        self.resume_target = resume_target  # Seconds from enable to camera and detector working
+        self.unload_models = unload_models  # Drop the ONNX sessions while idle (slower resume, less RAM)
+        self.components = tuple(components)
+        self._enabled = threading.Event()
+        self._enabled.set()
+        self._lock = threading.Lock()
+        self._resume_started: Optional[float] = None
+        self._ready: Dict[str, float] = {}
+        self.entered_at: Optional[float] = None
+        self.resumes = 0
+        self.last_resume: Dict[str, float] = {}
+
+    @property
+    def idle(self) -> bool:
+        return not self._enabled.is_set()
+
+    def enter(self):
+        """Application disabled: subsystems release what they hold."""
+        with self._lock:
+            if self.idle:
+                return
+            self._resume_started = None
+            self.entered_at = time.time()
+            self._enabled.clear()
+        print(f"Entering deep idle (models {'unloaded' if self.unload_models else 'kept loaded'})")
+
+    def resume(self):
+        """Application enabled: start timing the warm start and wake every waiting subsystem."""
+        with self._lock:
+            if not self.idle:
+                return
+            self._resume_started = time.perf_counter()
+            self._ready = {}
+            idle_seconds = time.time() - self.entered_at if self.entered_at else 0.0
+            self._enabled.set()
+        print(f"Leaving deep idle after {idle_seconds:.0f}s")
+
+    def wait_enabled(self, timeout: Optional[float] = None) -> bool:
+        """Block while idle; True once the application is enabled."""
+        return self._enabled.wait(timeout)
+
+    def component_ready(self, name: str):
+        """A component is working again; completes the resume once every component has reported."""
+        with self._lock:
+            if self._resume_started is None or name in self._ready:
+                return
+            self._ready[name] = time.perf_counter() - self._resume_started
+            if not all(component in self._ready for component in self.components):
+                return
+            total = max(self._ready.values())
+            self.last_resume = dict(self._ready, total=total)
+            self._resume_started = None
+            self.resumes += 1
+        get_vision_metrics().record(STAGE_RESUME, total)
+        parts = ", ".join(f"{component} {seconds:.2f}s" for component, seconds in self.last_resume.items()
+                          if component != 'total')
+        status = "within" if total <= self.resume_target else "OVER"
+        print(f"Resumed from deep idle in {total:.2f}s ({parts}), {status} the {self.resume_target:.1f}s target")
+
+
+# Global deep idle instance
+deep_idle = DeepIdle()
+
+def get_deep_idle() -> DeepIdle:
+    """Get the global deep idle coordinator."""
+    return deep_idle
@@ -0,0 +1,9 @@
+#!/usr/bin/env python3
+"""
+Face Detection Child Entry Module for AI Kiosk Application
+Spawned face detection processes run this module as their main module
+instead of re-running the parent's script (see
+detection_process.use_slim_child_main). It deliberately imports nothing:
+unpickling the child's target, detection_process._detection_process_main,
+loads only what detection needs.
+"""
@@ -0,0 +1,409 @@
+#!/usr/bin/env python3
+"""
+Face Detection Backends for AI Kiosk Application
+Runs InsightFace either in the calling thread (LocalFaceDetector) or in a
+supervised child process (DetectionProcess), so its Python-side pre/post
+processing does not compete for the GIL with audio capture and TTS.
+Detector inputs reach the child through a shared-memory ring of fixed
+slots; only slot indices and compact face result arrays (face_results.py)
+cross the process boundary. Every detector input size the CPU optimizer can switch to is
+prepared when the detector starts, and each frame is detected at its own
+size. Before reporting ready the detector runs a few warm-up inferences on
+synthetic frames, so one-time allocation and kernel selection costs are
+not paid by the first visitor.
+"""
+
+import importlib.util
+import multiprocessing
+import queue
+import sys
+import time
+from multiprocessing import shared_memory
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from insightface.app.common import Face
+
+from face_results import empty_face_results, face_results_from_detections, largest_face_index
+from face_tracker import box_iou
+from core_affinity import get_affinity_planner
+from ort_session import ORT_PROFILE_PATH, FaceModels, load_model_overrides, load_session_profile
+from system_metrics import get_system_sampler
+from vision_metrics import STAGE_MODEL_LOAD, get_vision_metrics
+
+# Inferences on synthetic frames after the models are loaded (the first one pays the cold-start costs)
+DEFAULT_WARMUP_INFERENCES = 3
+
+
+def detect_boxes(app, frame):
+    """Detection-only pass: (N, 5) boxes with scores and (N, 5, 2) landmarks (or None)"""
+    # Frames arrive letterboxed to the current detector input size, so detect at exactly that size
+    return app.det_model.detect(frame, input_size=(frame.shape[1], frame.shape[0]), max_num=0, metric='default')
+
+
+def detect_faces(app, frame):
+    """Detection-only pass as InsightFace Face objects (benchmark tooling; the app uses run_detection)"""
+    bboxes, kpss = detect_boxes(app, frame)
+    faces = []
+    for i in range(bboxes.shape[0]):
+        kps = kpss[i] if kpss is not None else None
+        faces.append(Face(bbox=bboxes[i, 0:4], kps=kps, det_score=bboxes[i, 4]))
+    return faces
+
+
+def analyze_face_attributes(app, frame, face):
+    """Run genderage on a single face on demand (sets face.gender / face.age)"""
+    genderage_model = app.models.get('genderage')
+    if genderage_model is not None and face.get('gender') is None:
+        genderage_model.get(frame, face)
+    return face
+
+
+def select_attribute_index(faces, attribute_box):
+    """Index of the detected face matching the tracked box the camera loop asked about, -1 if none"""
+    if not len(faces) or attribute_box is None:
+        return -1
+    iou = box_iou(np.asarray(attribute_box, dtype=np.float32).reshape(1, 4), faces['bbox'])[0]
+    best = int(np.argmax(iou))
+    return best if iou[best] > 0.1 else -1
+
+
+def run_detection(app, frame, attribute_box=None, largest_attributes=False):
+    """
+    Detect faces and, on demand, gender/age for one of them: the face matching
+    `attribute_box`, else the largest face when `largest_attributes` is set.
+    Returns (faces, attribute_index, inference_seconds, attribute_seconds) with
+    `faces` a face results array and `attribute_index` -1 when genderage did not run.
+    """
+    inference_start = time.perf_counter()
+    bboxes, _ = detect_boxes(app, frame)
+    faces = face_results_from_detections(bboxes)
+    inference_end = time.perf_counter()
+
+    attribute_index = select_attribute_index(faces, attribute_box)
+    if attribute_index < 0 and largest_attributes:
+        attribute_index = largest_face_index(faces)
+    if attribute_index >= 0:
+        # genderage reads the box from a Face and writes gender/age back into it
+        face = analyze_face_attributes(app, frame, Face(bbox=faces['bbox'][attribute_index],
+                                                        det_score=faces['score'][attribute_index]))
+        if face.get('gender') is not None:
+            faces['gender'][attribute_index] = int(face.gender)
+            faces['age'][attribute_index] = int(face.age)
+    attribute_end = time.perf_counter()
+
+    return faces, attribute_index, inference_end - inference_start, attribute_end - inference_end
+
+
+def load_face_analysis(det_size, profile_path=ORT_PROFILE_PATH):
+    """Load detection and genderage; genderage only runs on demand for one face."""
+    app = FaceModels(allowed_modules=['detection', 'genderage'], session_profile=load_session_profile(profile_path),
+                     model_overrides=load_model_overrides(profile_path))
+    app.prepare(ctx_id=-1, det_size=det_size)
+    return app
+
+
+def warm_up_detector(app, det_size, det_sizes=(), inferences=DEFAULT_WARMUP_INFERENCES) -> Dict[str, Any]:
+    """
+    Run `inferences` detections (and one genderage pass) on a synthetic frame
+    at `det_size`, then one detection at each other of `det_sizes` so they are
+    prepared ahead of a switch (anchor centres and ONNX Runtime buffers for
+    that shape). Returns the cold (first) and warm (median of the rest)
+    detection latencies in ms.
+    """
+    width, height = det_size
+    # Noise rather than a black frame, so post-processing sees candidate boxes like on real footage
+    frame = np.random.default_rng(0).integers(0, 256, (height, width, 3), dtype=np.uint8)
+    timings = []
+    for _ in range(inferences):
+        start = time.perf_counter()
+        detect_boxes(app, frame)
+        timings.append(time.perf_counter() - start)
+    attribute_ms = None
+    if inferences:
+        start = time.perf_counter()
+        analyze_face_attributes(app, frame, Face(bbox=np.array([width * 0.25, height * 0.25, width * 0.75, height * 0.75],
+                                                               dtype=np.float32), det_score=1.0))
+        attribute_ms = round((time.perf_counter() - start) * 1000, 1)
+    for size in det_sizes:
+        if tuple(size) != tuple(det_size):
+            detect_boxes(app, np.zeros((size[1], size[0], 3), dtype=np.uint8))
+    return {
+        'warmup_inferences': inferences,
+        'cold_ms': round(timings[0] * 1000, 1) if timings else None,
+        'warm_ms': round(float(np.median(timings[1:])) * 1000, 1) if len(timings) > 1 else None,
+        'attributes_cold_ms': attribute_ms,
+    }
+
+
+def largest_det_size(det_size, det_sizes=()):
+    """Largest of the startup size and the sizes the detector may switch to."""
+    return max([tuple(det_size)] + [tuple(size) for size in det_sizes], key=lambda size: size[0] * size[1])
+
+
+class LocalFaceDetector:
+    """Runs the face detector in the calling thread."""
+
+    def __init__(self, det_size: Tuple[int, int], profile_path: str = ORT_PROFILE_PATH, det_sizes=(),
+                 warmup_inferences: int = DEFAULT_WARMUP_INFERENCES):
+        self.det_size = det_size
+        self.det_sizes = list(det_sizes)
+        self.profile_path = profile_path
+        self.warmup_inferences = warmup_inferences
+        self.warmup: Dict[str, Any] = {}  # warm_up_detector() result of the last start()
+        self.app = None
+
+    def start(self) -> bool:
+        start_time = time.perf_counter()
+        self.app = load_face_analysis(self.det_size, self.profile_path)
+        self.warmup = warm_up_detector(self.app, self.det_size, self.det_sizes, self.warmup_inferences)
+        get_vision_metrics().record(STAGE_MODEL_LOAD, time.perf_counter() - start_time)
+        return True
+
+    def detect(self, frame, attribute_box=None, largest_attributes=False):
+        return run_detection(self.app, frame, attribute_box, largest_attributes)
+
+    def unload(self):
+        """Drop the ONNX sessions; start() loads them again."""
+        self.app = None
+
+    def stop(self):
+        self.unload()
+
+
+class SharedFrameRing:
+    """
+    Fixed number of equally sized uint8 image slots in one shared memory block.
+    A slot can also be viewed as any smaller image shape (for smaller
+    detector input sizes); the view starts at the slot's first byte.
+    """
+
+    def __init__(self, slots: int, shape: Tuple[int, ...], name: Optional[str] = None):
+        self.slots = slots
+        self.shape = tuple(shape)
+        self.slot_bytes = int(np.prod(self.shape))
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=self.slot_bytes * slots)
+            self.owner = True
+        else:
+            # Attaching process must not unlink the block when it exits
+            self.shm = shared_memory.SharedMemory(name=name, track=False)
+            self.owner = False
+        self.array = np.ndarray((slots,) + self.shape, dtype=np.uint8, buffer=self.shm.buf)
+        self._base_address = self.array.__array_interface__['data'][0]
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def slot(self, index: int, shape: Optional[Tuple[int, ...]] = None) -> np.ndarray:
+        if shape is None or tuple(shape) == self.shape:
+            return self.array[index]
+        size = int(np.prod(shape))
+        if size > self.slot_bytes:
+            raise ValueError(f"Image shape {tuple(shape)} does not fit a {self.shape} slot")
+        return self.array[index].reshape(-1)[:size].reshape(shape)
+
+    def slot_of(self, frame: np.ndarray) -> Optional[int]:
+        """Index of the slot `frame` is a view of, or None if it lives elsewhere."""
+        if frame.dtype != np.uint8 or frame.nbytes > self.slot_bytes or not frame.flags['C_CONTIGUOUS']:
+            return None
+        offset = frame.__array_interface__['data'][0] - self._base_address
+        if offset < 0 or offset % self.slot_bytes:
+            return None
+        index = offset // self.slot_bytes
+        return index if index < self.slots else None
+
+    def close(self):
+        del self.array
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def _detection_process_main(ring_name, slots, shape, det_size, det_sizes, profile_path, warmup_inferences,
+                            affinity_plan, requests, responses, ready):
+    """Child process: load and warm up the models, then answer detection requests until told to stop."""
+    # The parent's core plan: this thread first (threads started later inherit its cores),
+    # then the ONNX Runtime sessions pick up the vision cores for their intra-op threads
+    planner = get_affinity_planner()
+    if planner.adopt(*affinity_plan):
+        planner.pin_process(0, 'vision')
+    ring = SharedFrameRing(slots, shape, name=ring_name)
+    app = load_face_analysis(det_size, profile_path)
+    responses.put(('warmup', warm_up_detector(app, det_size, det_sizes, warmup_inferences)))
+    ready.set()
+    print("Face detection process started")
+
+    try:
+        while True:
+            request = requests.get()
+            if request is None:  # Shutdown signal
+                break
+            request_id, slot, frame_shape, attribute_box, largest_attributes = request
+            try:
+                faces, attribute_index, inference_seconds, attribute_seconds = run_detection(
+                    app, ring.slot(slot, frame_shape), attribute_box, largest_attributes)
+                responses.put((request_id, faces, attribute_index, inference_seconds, attribute_seconds))
+            except Exception as e:
+                print(f"Face detection process error: {e}")
+                responses.put((request_id, empty_face_results(), -1, 0.0, 0.0))
+    finally:
+        ring.close()
+
+
+def use_slim_child_main():
+    """
+    Spawned children import the parent's main module as __mp_main__; for
+    main.py that is argparse, the CPU optimizer and the audio, TTS and
+    WebSocket imports in every detector child and on every restart. Naming
+    detection_child as the main module's spec makes children run that
+    empty module instead. The parent's __main__ module itself is unchanged.
+    """
+    main_module = sys.modules['__main__']
+    if getattr(getattr(main_module, '__spec__', None), 'name', None) != 'detection_child':
+        main_module.__spec__ = importlib.util.find_spec('detection_child')
+
+
+class DetectionProcess:
+    """
+    Face detector in a supervised child process.
+
+    Frames must be written into slots of `ring` (the camera loop's frame
+    buffer pool hands them out); frames from anywhere else are copied into
+    a spare slot. Slots are sized for the largest of `det_sizes`. If the
+    child dies or stops answering it is restarted with exponential backoff,
+    and detect() returns None for the lost frame.
+    """
+
+    def __init__(self, det_size: Tuple[int, int], slots: int = 5, profile_path: str = ORT_PROFILE_PATH,
+                 response_timeout: float = 10.0, start_timeout: float = 120.0, det_sizes=(),
+                 warmup_inferences: int = DEFAULT_WARMUP_INFERENCES):
+        self.det_size = det_size
+        self.det_sizes = list(det_sizes)
+        self.profile_path = profile_path
+        self.warmup_inferences = warmup_inferences
+        self.warmup: Dict[str, Any] = {}  # warm_up_detector() result reported by the current child
+        self.response_timeout = response_timeout
+        self.start_timeout = start_timeout
+        max_width, max_height = largest_det_size(det_size, self.det_sizes)
+        self.ring = SharedFrameRing(slots + 1, (max_height, max_width, 3))
+        self.spare_slot = slots  # Last slot is for frames that do not live in the ring
+
+        self._ctx = multiprocessing.get_context('spawn')
+        use_slim_child_main()  # Once, from the creating thread, before any child is spawned
+        self.process = None
+        self.requests = None
+        self.responses = None
+        self._request_id = 0
+
+        # Supervision
+        self.restarts = 0
+        self._consecutive_failures = 0
+
+    def pool_buffers(self, shape: Optional[Tuple[int, ...]] = None) -> List[np.ndarray]:
+        """Ring slots, viewed as `shape`, to use as the camera loop's detector input buffers."""
+        return [self.ring.slot(i, shape) for i in range(self.spare_slot)]
+
+    def start(self) -> bool:
+        """Spawn the child and wait until its models are loaded."""
+        start_time = time.perf_counter()
+        self.requests = self._ctx.Queue()
+        self.responses = self._ctx.Queue()
+        ready = self._ctx.Event()
+        planner = get_affinity_planner()  # Configured by now; the child pins itself with the same plan
+        self.process = self._ctx.Process(
+            target=_detection_process_main,
+            args=(self.ring.name, self.ring.slots, self.ring.shape, self.det_size, self.det_sizes,
+                  self.profile_path, self.warmup_inferences, (planner.plan, planner.profile),
+                  self.requests, self.responses, ready),
+            name="face-detection",
+            daemon=True)
+        self.process.start()
+        get_system_sampler().register_process(self.process.pid, 'vision', 'face-detection-process')
+
+        deadline = time.time() + self.start_timeout
+        while not ready.wait(0.5):
+            if not self.process.is_alive():
+                print(f"Face detection process exited during startup (exit code {self.process.exitcode})")
+                return False
+            if time.time() > deadline:
+                print("Face detection process did not become ready in time")
+                self._kill()
+                return False
+        load_seconds = time.perf_counter() - start_time
+        get_vision_metrics().record(STAGE_MODEL_LOAD, load_seconds)
+        try:
+            _, self.warmup = self.responses.get(timeout=5.0)  # Put by the child just before it became ready
+        except queue.Empty:
+            self.warmup = {}
+        print(f"Face detection process ready in {load_seconds:.2f}s")
+        return True
+
+    def _kill(self):
+        if self.process is not None:
+            get_system_sampler().unregister_process(self.process.pid)
+        if self.process is not None and self.process.is_alive():
+            self.process.terminate()
+            self.process.join(timeout=2.0)
+            if self.process.is_alive():
+                self.process.kill()
+                self.process.join(timeout=2.0)
+
+    def _restart(self, reason: str) -> bool:
+        self._kill()
+        self._consecutive_failures += 1
+        self.restarts += 1
+        get_vision_metrics().increment('detection_process_restarts')
+        backoff = min(30.0, 0.5 * (2 ** (self._consecutive_failures - 1)))
+        print(f"Face detection process {reason}; restarting in {backoff:.1f}s (restart #{self.restarts})")
+        time.sleep(backoff)
+        return self.start()
+
+    def detect(self, frame, attribute_box=None, largest_attributes=False):
+        """Same contract as run_detection(), or None if the frame was lost to a crash."""
+        if self.process is None or not self.process.is_alive():
+            if not self._restart("is not running"):
+                return None
+
+        slot = self.ring.slot_of(frame)
+        if slot is None:
+            slot = self.spare_slot
+            np.copyto(self.ring.slot(slot, frame.shape), frame)
+
+        self._request_id += 1
+        request_id = self._request_id
+        self.requests.put((request_id, slot, frame.shape, attribute_box, largest_attributes))
+
+        deadline = time.time() + self.response_timeout
+        while True:
+            try:
+                response = self.responses.get(timeout=0.5)
+            except queue.Empty:
+                if not self.process.is_alive():
+                    self._restart(f"crashed (exit code {self.process.exitcode})")
+                    return None
+                if time.time() > deadline:
+                    self._restart("stopped responding")
+                    return None
+                continue
+            if response[0] == request_id:
+                break  # Anything else is a late answer to a request we gave up on
+
+        self._consecutive_failures = 0
+        return response[1:]
+
+    def unload(self):
+        """Stop the child (freeing its models); the frame ring stays, start() spawns a new child."""
+        if self.process is not None and self.process.is_alive():
+            try:
+                self.requests.put(None)
+                self.process.join(timeout=5.0)
+            except Exception:
+                pass
+        self._kill()
+        self.process = None
+
+    def stop(self):
+        self.unload()
+        self.ring.close()
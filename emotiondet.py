@@ -1,7 +1,7 @@
 import cv2
 import time
 import numpy as np
-from insightface.app import FaceAnalysis
+from ort_session import FaceModels
 import argparse
 
 # Argument parser for headless mode
@@ -11,7 +11,7 @@ parser.add_argument("--camid", type=int, default=0, help="Camera index to use")
 args = parser.parse_args()
 
 # Initialize face analysis with emotion detection
-app = FaceAnalysis(allowed_modules=['detection', 'genderage', 'emotion'])
+app = FaceModels(allowed_modules=['detection', 'genderage', 'emotion'])
 app.prepare(ctx_id=-1, det_size=(640, 640))
 
 # Initialize camera
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Compact Face Detection Results for AI Kiosk Application
+Detections and tracked faces are passed around as one NumPy structured
+array (bbox, score, age, gender, track_id per face) instead of lists of
+InsightFace Face objects, so results are cheap to copy and to ship
+between processes, and questions like "which face is largest" or "how
+far away is everyone" are single vectorized operations.
+"""
+
+from typing import Optional
+
+import numpy as np
+
+FACE_RESULT_DTYPE = np.dtype([
+    ('bbox', np.float32, (4,)),  # x1, y1, x2, y2 in detector-input pixels
+    ('score', np.float32),       # Detection confidence
+    ('age', np.int16),           # AGE_UNKNOWN until genderage has run for the face
+    ('gender', np.int8),         # GENDER_FEMALE / GENDER_MALE (InsightFace's encoding) or GENDER_UNKNOWN
+    ('track_id', np.int32),      # NO_TRACK until the tracker has associated the face
+])
+
+GENDER_UNKNOWN = -1
+GENDER_FEMALE = 0
+GENDER_MALE = 1
+AGE_UNKNOWN = -1
+NO_TRACK = -1
+
+
+def empty_face_results(count: int = 0) -> np.ndarray:
+    """`count` faces with unknown attributes and no track."""
+    faces = np.zeros(count, dtype=FACE_RESULT_DTYPE)
+    faces['age'] = AGE_UNKNOWN
+    faces['gender'] = GENDER_UNKNOWN
+    faces['track_id'] = NO_TRACK
+    return faces
+
+
+def face_results_from_detections(detections: np.ndarray) -> np.ndarray:
+    """Detector output rows of x1, y1, x2, y2, score -> face results."""
+    detections = np.asarray(detections, dtype=np.float32).reshape(-1, 5)
+    faces = empty_face_results(len(detections))
+    faces['bbox'] = detections[:, :4]
+    faces['score'] = detections[:, 4]
+    return faces
+
+
+def face_widths(faces: np.ndarray) -> np.ndarray:
+    boxes = faces['bbox']
+    return boxes[:, 2] - boxes[:, 0]
+
+
+def face_areas(faces: np.ndarray) -> np.ndarray:
+    boxes = faces['bbox']
+    return (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+
+
+def largest_face_index(faces: np.ndarray) -> int:
+    """Index of the largest (closest) face, -1 if there are none."""
+    return int(np.argmax(face_areas(faces))) if len(faces) else -1
+
+
+def sort_largest_first(faces: np.ndarray) -> np.ndarray:
+    return faces[np.argsort(-face_areas(faces), kind='stable')]
+
+
+def gender_label(gender: int) -> str:
+    """'M', 'F' or 'unknown' for a gender code."""
+    if gender == GENDER_MALE:
+        return 'M'
+    if gender == GENDER_FEMALE:
+        return 'F'
+    return 'unknown'
+
+
+def face_age(face) -> Optional[int]:
+    """Age of one face result, None until genderage has run for it."""
+    age = int(face['age'])
+    return age if age != AGE_UNKNOWN else None
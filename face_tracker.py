@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+"""
+Lightweight Multi-Face Tracker for AI Kiosk Application
+Keeps stable track IDs between detector runs: detections are associated
+to tracks by IoU (falling back to centroid distance) and boxes are
+propagated every frame with sparse Lucas-Kanade optical flow, so the
+detector only needs to re-anchor the tracks periodically. Detections come
+in and tracked faces go out as face result arrays (face_results.py).
+"""
+
+import itertools
+from collections import deque
+from typing import List, Optional
+
+import cv2
+import numpy as np
+
+from face_results import AGE_UNKNOWN, GENDER_UNKNOWN, empty_face_results, sort_largest_first
+
+# Optical flow parameters
+LK_PARAMS = dict(winSize=(15, 15),
+                 maxLevel=2,
+                 criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 10, 0.03))
+FEATURE_PARAMS = dict(maxCorners=20, qualityLevel=0.01, minDistance=3, blockSize=5)
+
+
+def box_iou(boxes_a: np.ndarray, boxes_b: np.ndarray) -> np.ndarray:
+    """Pairwise IoU between two (N, 4) and (M, 4) arrays of x1, y1, x2, y2 boxes."""
+    if len(boxes_a) == 0 or len(boxes_b) == 0:
+        return np.zeros((len(boxes_a), len(boxes_b)), dtype=np.float32)
+    a = boxes_a[:, None, :]
+    b = boxes_b[None, :, :]
+    inter_w = np.clip(np.minimum(a[..., 2], b[..., 2]) - np.maximum(a[..., 0], b[..., 0]), 0, None)
+    inter_h = np.clip(np.minimum(a[..., 3], b[..., 3]) - np.maximum(a[..., 1], b[..., 1]), 0, None)
+    inter = inter_w * inter_h
+    area_a = (a[..., 2] - a[..., 0]) * (a[..., 3] - a[..., 1])
+    area_b = (b[..., 2] - b[..., 0]) * (b[..., 3] - b[..., 1])
+    union = area_a + area_b - inter
+    return np.where(union > 0, inter / np.maximum(union, 1e-6), 0.0).astype(np.float32)
+
+
+def top_k_indices(scores: np.ndarray, k: int, eligible: Optional[np.ndarray] = None) -> np.ndarray:
+    """Indices of the `k` highest scores (optionally among `eligible` only), highest first."""
+    scores = np.asarray(scores, dtype=np.float32).reshape(-1)
+    candidates = np.arange(len(scores)) if eligible is None else np.flatnonzero(eligible)
+    if len(candidates) > k:
+        # Linear-time partial selection, then sort just the K winners
+        candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+    return candidates[np.argsort(-scores[candidates], kind='stable')]
+
+
+class Track:
+    """A single tracked face."""
+
+    def __init__(self, track_id: int, bbox, face, timestamp: float):
+        self.track_id = track_id
+        self.bbox = np.asarray(bbox, dtype=np.float32)[:4].copy()
+        self.score = float(face['score'])  # Confidence of the latest matched detection
+        self.gender = GENDER_UNKNOWN     # Cached for the track's lifetime once genderage has run
+        self.age = AGE_UNKNOWN
+        self.hits = 1                    # Detector confirmations
+        self.misses = 0                  # Consecutive detector passes without a match
+        self.flow_failures = 0           # Consecutive frames optical flow could not follow
+        self.created_time = timestamp
+        self.last_detection_time = timestamp
+        self.points: Optional[np.ndarray] = None  # Feature points inside the box, shape (N, 1, 2)
+        self.history = deque(maxlen=60)  # (timestamp, bbox) for re-anchoring stale detections
+        self.history.append((timestamp, self.bbox.copy()))
+        self.absorb_attributes(face)
+
+    def absorb_attributes(self, face):
+        """Cache gender/age the first time a matched detection (face result row) carries them."""
+        if self.gender == GENDER_UNKNOWN and face['gender'] != GENDER_UNKNOWN:
+            self.gender = int(face['gender'])
+            self.age = int(face['age'])
+
+    @property
+    def has_attributes(self) -> bool:
+        return self.gender != GENDER_UNKNOWN
+
+    @property
+    def width(self) -> float:
+        return float(self.bbox[2] - self.bbox[0])
+
+    @property
+    def area(self) -> float:
+        return float((self.bbox[2] - self.bbox[0]) * (self.bbox[3] - self.bbox[1]))
+
+    @property
+    def center(self):
+        return ((self.bbox[0] + self.bbox[2]) / 2.0, (self.bbox[1] + self.bbox[3]) / 2.0)
+
+    def bbox_at(self, timestamp: float) -> np.ndarray:
+        """Box position closest to (but not after) the given timestamp."""
+        best = self.history[0][1]
+        for t, bbox in self.history:
+            if t > timestamp:
+                break
+            best = bbox
+        return best
+
+
+class FaceTracker:
+    """
+    Multi-face tracker used by the camera loop.
+
+    Call propagate() once per camera frame with a grayscale image in the
+    detector's coordinate system, and update() whenever a detection result
+    arrives. get_tracks() returns the tracks to use for presence, distance
+    and overlay on the current frame, results() the same as a face result
+    array.
+    """
+
+    def __init__(self,
+                 iou_threshold: float = 0.3,
+                 centroid_threshold: float = 0.6,
+                 max_misses: int = 2,
+                 max_flow_failures: int = 5,
+                 min_hits_stable: int = 3,
+                 min_points: int = 4):
+        self.iou_threshold = iou_threshold
+        self.centroid_threshold = centroid_threshold  # Max centre distance as a fraction of the box width
+        self.max_misses = max_misses
+        self.max_flow_failures = max_flow_failures
+        self.min_hits_stable = min_hits_stable
+        self.min_points = min_points
+
+        self.tracks: List[Track] = []
+        self.prev_gray: Optional[np.ndarray] = None
+        self.redetect_requested = False
+        self._ids = itertools.count(1)
+
+    def reset(self):
+        self.tracks = []
+        self.prev_gray = None
+        self.redetect_requested = False
+
+    def rescale(self, factor: float):
+        """Scale every track after the detector input size changed (the letterbox origin stays top-left)."""
+        for track in self.tracks:
+            track.bbox = track.bbox * factor
+            track.history = deque(((t, bbox * factor) for t, bbox in track.history), maxlen=track.history.maxlen)
+            if track.points is not None:
+                track.points = track.points * np.float32(factor)
+        self.prev_gray = None  # The next frame has a different size; tracks resume from it
+
+    def _seed_points(self, track: Track, gray: np.ndarray):
+        """Pick trackable corners inside the (slightly shrunk) face box."""
+        h, w = gray.shape[:2]
+        x1, y1, x2, y2 = track.bbox
+        pad_x, pad_y = (x2 - x1) * 0.15, (y2 - y1) * 0.15
+        x1, y1 = int(max(0, x1 + pad_x)), int(max(0, y1 + pad_y))
+        x2, y2 = int(min(w, x2 - pad_x)), int(min(h, y2 - pad_y))
+        if x2 - x1 < 4 or y2 - y1 < 4:
+            track.points = None
+            return
+        mask = np.zeros_like(gray)
+        mask[y1:y2, x1:x2] = 255
+        track.points = cv2.goodFeaturesToTrack(gray, mask=mask, **FEATURE_PARAMS)
+
+    def propagate(self, gray: np.ndarray, timestamp: float):
+        """Move every track with the optical flow between the previous and current frame."""
+        prev_gray = self.prev_gray
+        self.prev_gray = gray
+        if prev_gray is None or prev_gray.shape != gray.shape or not self.tracks:
+            return
+
+        # Track all faces' points in a single LK call
+        tracked = [t for t in self.tracks if t.points is not None and len(t.points) >= self.min_points]
+        for track in self.tracks:
+            if track not in tracked:
+                track.flow_failures += 1
+                self._seed_points(track, gray)
+
+        if tracked:
+            counts = [len(t.points) for t in tracked]
+            old_points = np.concatenate([t.points for t in tracked]).astype(np.float32)
+            new_points, status, _ = cv2.calcOpticalFlowPyrLK(prev_gray, gray, old_points, None, **LK_PARAMS)
+
+            offset = 0
+            for track, count in zip(tracked, counts):
+                ok = status[offset:offset + count].reshape(-1) == 1
+                old_p = old_points[offset:offset + count].reshape(-1, 2)[ok]
+                new_p = new_points[offset:offset + count].reshape(-1, 2)[ok]
+                offset += count
+
+                if len(new_p) < self.min_points:
+                    track.flow_failures += 1
+                    self._seed_points(track, gray)
+                    continue
+
+                # Median translation plus scale from the change in point spread
+                dx, dy = np.median(new_p - old_p, axis=0)
+                old_spread = np.linalg.norm(old_p - old_p.mean(axis=0), axis=1).mean()
+                new_spread = np.linalg.norm(new_p - new_p.mean(axis=0), axis=1).mean()
+                scale = float(np.clip(new_spread / old_spread, 0.9, 1.1)) if old_spread > 1e-3 else 1.0
+
+                cx, cy = track.center
+                half_w, half_h = track.width * scale / 2.0, (track.bbox[3] - track.bbox[1]) * scale / 2.0
+                cx, cy = cx + dx, cy + dy
+                track.bbox = np.array([cx - half_w, cy - half_h, cx + half_w, cy + half_h], dtype=np.float32)
+                track.points = new_p.reshape(-1, 1, 2)
+                track.flow_failures = 0
+
+        for track in self.tracks:
+            track.history.append((timestamp, track.bbox.copy()))
+
+        # Drop tracks the flow has lost for too long; ask for a detector pass
+        lost = [t for t in self.tracks if t.flow_failures > self.max_flow_failures]
+        if lost:
+            self.tracks = [t for t in self.tracks if t not in lost]
+            self.redetect_requested = True
+        if any(t.flow_failures > 0 for t in self.tracks):
+            self.redetect_requested = True
+
+    def update(self, faces: np.ndarray, detection_timestamp: float, gray: Optional[np.ndarray] = None):
+        """
+        Re-anchor tracks with a detector result (face result array; each
+        face's track_id is filled in). Detections may be a few hundred ms
+        old; they are matched against where each track was at
+        `detection_timestamp` and shifted by the motion seen since.
+        """
+        if gray is None:
+            gray = self.prev_gray
+        self.redetect_requested = False
+
+        det_boxes = faces['bbox']
+        track_boxes = np.array([t.bbox_at(detection_timestamp) for t in self.tracks], dtype=np.float32).reshape(-1, 4)
+
+        matched_tracks = set()
+        matched_dets = set()
+        if len(self.tracks) and len(faces):
+            iou = box_iou(track_boxes, det_boxes)
+            # Greedy association, best IoU first
+            for flat in np.argsort(-iou, axis=None):
+                ti, di = np.unravel_index(flat, iou.shape)
+                if iou[ti, di] < self.iou_threshold:
+                    break
+                if ti in matched_tracks or di in matched_dets:
+                    continue
+                matched_tracks.add(ti)
+                matched_dets.add(di)
+                self._anchor(self.tracks[ti], faces[di], det_boxes[di], track_boxes[ti], detection_timestamp, gray)
+
+            # Centroid fallback for fast movers whose boxes no longer overlap
+            for ti, track in enumerate(self.tracks):
+                if ti in matched_tracks:
+                    continue
+                tcx = (track_boxes[ti, 0] + track_boxes[ti, 2]) / 2.0
+                tcy = (track_boxes[ti, 1] + track_boxes[ti, 3]) / 2.0
+                best_di, best_dist = None, None
+                for di in range(len(faces)):
+                    if di in matched_dets:
+                        continue
+                    dcx = (det_boxes[di, 0] + det_boxes[di, 2]) / 2.0
+                    dcy = (det_boxes[di, 1] + det_boxes[di, 3]) / 2.0
+                    dist = np.hypot(tcx - dcx, tcy - dcy)
+                    limit = self.centroid_threshold * max(track_boxes[ti, 2] - track_boxes[ti, 0], 1.0)
+                    if dist <= limit and (best_dist is None or dist < best_dist):
+                        best_di, best_dist = di, dist
+                if best_di is not None:
+                    matched_tracks.add(ti)
+                    matched_dets.add(best_di)
+                    self._anchor(track, faces[best_di], det_boxes[best_di], track_boxes[ti], detection_timestamp, gray)
+
+        # Unmatched tracks missed this detector pass: unconfirmed ones expire at once, and the
+        # flow may be following background texture, so ask for a detector pass right away
+        survivors = []
+        for ti, track in enumerate(self.tracks):
+            if ti not in matched_tracks:
+                track.misses += 1
+                self.redetect_requested = True
+                if track.misses > self.max_misses or track.hits < self.min_hits_stable:
+                    continue
+            survivors.append(track)
+        self.tracks = survivors
+
+        # Unmatched detections start new tracks
+        for di, face in enumerate(faces):
+            if di in matched_dets:
+                continue
+            track = Track(next(self._ids), det_boxes[di], face, detection_timestamp)
+            face['track_id'] = track.track_id
+            if gray is not None:
+                self._seed_points(track, gray)
+            self.tracks.append(track)
+
+    def _anchor(self, track: Track, face, det_box: np.ndarray, track_box_then: np.ndarray,
+                detection_timestamp: float, gray: Optional[np.ndarray]):
+        # Carry the detection forward by the motion the track has made since the detector's frame
+        motion = track.bbox - track_box_then
+        track.bbox = det_box + motion
+        track.score = float(face['score'])
+        face['track_id'] = track.track_id
+        track.absorb_attributes(face)
+        track.hits += 1
+        track.misses = 0
+        track.flow_failures = 0
+        track.last_detection_time = detection_timestamp
+        if gray is not None:
+            self._seed_points(track, gray)
+
+    def get_tracks(self) -> List[Track]:
+        """Tracks to use for the current frame, largest first."""
+        return sorted(self.tracks, key=lambda t: t.area, reverse=True)
+
+    def results(self) -> np.ndarray:
+        """Tracked faces for the current frame as a face result array, largest first."""
+        faces = empty_face_results(len(self.tracks))
+        for i, track in enumerate(self.tracks):
+            faces[i] = (track.bbox, track.score, track.age, track.gender, track.track_id)
+        return sort_largest_first(faces)
+
+    def largest_track(self) -> Optional[Track]:
+        return max(self.tracks, key=lambda t: t.area) if self.tracks else None
+
+    def is_stable(self) -> bool:
+        """True when the main face is confirmed, matched by the last detector pass and followed by optical flow."""
+        track = self.largest_track()
+        return (track is not None
+                and track.hits >= self.min_hits_stable
+                and track.misses == 0
+                and track.flow_failures == 0
+                and not self.redetect_requested)
@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+Detector Preprocessing for AI Kiosk Application
+Turns a raw camera frame into the letterboxed input the face detector
+expects in one step (downscale + optional rotation written straight into a
+reusable buffer), and maps detector boxes back to camera frame coordinates.
+An optional region of interest (crop rectangle or polygon, from the machine
+config) limits detection to the kiosk's service zone.
+"""
+
+import json
+from typing import Any, Dict, Optional, Tuple
+
+import cv2
+import numpy as np
+
+# Detector strides; cropped inputs are rounded up to a multiple of the largest
+DETECTOR_INPUT_ALIGN = 32
+
+
+def parse_roi(value: Any) -> Optional[Dict[str, Any]]:
+    """
+    Normalize a region of interest from the machine config or the command line.
+
+    Accepts {'rect': [x1, y1, x2, y2]}, {'polygon': [[x, y], ...]}, a bare
+    rectangle or point list, or the same as a JSON / comma-separated
+    string. Coordinates are fractions of the camera frame as captured
+    (before rotation, 0-1), so the ROI does not depend on the resolution. Returns None for an
+    empty value and {'rect': (x1, y1, x2, y2), 'polygon': points or None}
+    otherwise; raises ValueError for anything malformed.
+    """
+    if value is None or value == '' or value == {} or value == []:
+        return None
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except json.JSONDecodeError:
+            value = [part for part in value.split(',')]
+    if isinstance(value, dict):
+        if value.get('polygon'):
+            value = value['polygon']
+        elif value.get('rect'):
+            value = value['rect']
+        else:
+            raise ValueError(f"ROI needs a 'rect' or 'polygon': {value}")
+
+    try:
+        if len(value) == 4 and not isinstance(value[0], (list, tuple)):
+            x1, y1, x2, y2 = (float(v) for v in value)
+            polygon = None
+        else:
+            polygon = tuple((float(x), float(y)) for x, y in value)
+            if len(polygon) < 3:
+                raise ValueError(f"ROI polygon needs at least 3 points: {value}")
+            xs, ys = [x for x, _ in polygon], [y for _, y in polygon]
+            x1, y1, x2, y2 = min(xs), min(ys), max(xs), max(ys)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid ROI {value!r}: {e}")
+
+    if not (0.0 <= x1 < x2 <= 1.0 and 0.0 <= y1 < y2 <= 1.0):
+        raise ValueError(f"ROI must be fractions of the frame with x1 < x2 and y1 < y2: {(x1, y1, x2, y2)}")
+    return {'rect': (x1, y1, x2, y2), 'polygon': polygon}
+
+
+class DetectorPreprocessor:
+    """
+    Raw frame -> detector input of exactly `det_size` (width, height).
+
+    The frame is downscaled once to the size it occupies inside the
+    detector input and, when `rotate` is set, rotated 90 degrees
+    counter-clockwise directly into the top-left corner of the output
+    buffer. The rest of the buffer is zero padding, which is the same
+    layout InsightFace builds internally, so its own resize becomes a
+    no-op and returned boxes are in detector-input pixels.
+
+    With a region of interest only the ROI's bounding rectangle is
+    downscaled, at the scale the whole frame would get, so faces keep their
+    detector size (distance estimates and tracking are unchanged) while the
+    detector input shrinks to `input_size`; pixels outside an ROI polygon
+    are blacked out.
+    """
+
+    def __init__(self, det_size: Tuple[int, int] = (320, 320), rotate: bool = True):
+        self.det_size = det_size
+        self.rotate = rotate
+
+        self.source_shape: Optional[Tuple[int, int]] = None  # (height, width) of the raw frame
+        self.scaled_size = (0, 0)   # (width, height) of the downscaled, unrotated frame
+        self.content_size = (0, 0)  # (width, height) of the image area inside the detector input
+        self.scale_x = 1.0
+        self.scale_y = 1.0
+        self.input_scale = 1.0      # Frames given to prepare() relative to the camera resolution (reduced decode)
+        self.input_size = tuple(det_size)  # (width, height) of the detector input actually produced
+        self.roi: Optional[Dict[str, Any]] = None  # parse_roi() result
+        self.crop = (0, 0, 0, 0)    # x1, y1, x2, y2 of the ROI in frame pixels
+
+        self._scaled = None                          # Downscaled frame before rotation
+        self._gray_buffers = [None, None]            # Alternating so the tracker can keep the previous one
+        self._gray_index = 0
+        self._roi_mask = None                        # (h, w, 1) 0/1 mask of the ROI polygon inside the content area
+
+    def set_roi(self, roi: Optional[Dict[str, Any]]):
+        """Limit detection to a parse_roi() region (None for the whole frame); takes effect with the next prepare()."""
+        if roi != self.roi:
+            self.roi = roi
+            self.source_shape = None
+
+    def set_det_size(self, det_size: Tuple[int, int]):
+        """Switch to another detector input size; takes effect with the next prepare()."""
+        det_size = tuple(det_size)
+        if det_size != tuple(self.det_size):
+            self.det_size = det_size
+            self.source_shape = None
+
+    @property
+    def scale(self) -> float:
+        """Detector pixels per camera pixel."""
+        return min(self.scale_x, self.scale_y)
+
+    @property
+    def camera_scale(self) -> float:
+        """Detector pixels per pixel of the full-resolution camera frame."""
+        return self.scale * self.input_scale
+
+    def _configure(self, height: int, width: int):
+        det_w, det_h = self.det_size
+        # Size of the frame as the detector sees it (rotated if enabled)
+        view_w, view_h = (height, width) if self.rotate else (width, height)
+        scale = min(det_w / float(view_w), det_h / float(view_h))
+
+        crop_x1, crop_y1, crop_x2, crop_y2 = 0, 0, width, height
+        if self.roi is not None:
+            x1, y1, x2, y2 = self.roi['rect']
+            crop_x1, crop_y1 = int(x1 * width), int(y1 * height)
+            crop_x2 = max(crop_x1 + 1, int(round(x2 * width)))
+            crop_y2 = max(crop_y1 + 1, int(round(y2 * height)))
+        crop_w, crop_h = crop_x2 - crop_x1, crop_y2 - crop_y1
+        if self.rotate:
+            crop_w, crop_h = crop_h, crop_w
+
+        content_w = max(1, min(det_w, int(round(crop_w * scale))))
+        content_h = max(1, min(det_h, int(round(crop_h * scale))))
+        scaled_w, scaled_h = (content_h, content_w) if self.rotate else (content_w, content_h)
+
+        self.source_shape = (height, width)
+        self.crop = (crop_x1, crop_y1, crop_x2, crop_y2)
+        self.scaled_size = (scaled_w, scaled_h)
+        self.content_size = (content_w, content_h)
+        self.scale_x = scaled_w / float(crop_x2 - crop_x1)
+        self.scale_y = scaled_h / float(crop_y2 - crop_y1)
+        if self.roi is None:
+            self.input_size = (det_w, det_h)
+        else:
+            align = DETECTOR_INPUT_ALIGN
+            self.input_size = (min(det_w, -(-content_w // align) * align), min(det_h, -(-content_h // align) * align))
+        self._scaled = np.zeros((scaled_h, scaled_w, 3), dtype=np.uint8) if self.rotate else None
+        self._gray_buffers = [None, None]
+        self._roi_mask = self._polygon_mask() if self.roi is not None and self.roi['polygon'] else None
+
+    def _polygon_mask(self) -> np.ndarray:
+        """0/1 mask of the ROI polygon in detector content coordinates."""
+        height, width = self.source_shape
+        crop_x1, crop_y1 = self.crop[:2]
+        points = np.array(self.roi['polygon'], dtype=np.float32) * (width, height)
+        x = (points[:, 0] - crop_x1) * self.scale_x
+        y = (points[:, 1] - crop_y1) * self.scale_y
+        if self.rotate:
+            # Counter-clockwise rotation: detector x is frame y, detector y runs against frame x
+            x, y = y, self.scaled_size[0] - x
+        content_w, content_h = self.content_size
+        mask = np.zeros((content_h, content_w), dtype=np.uint8)
+        cv2.fillPoly(mask, [np.round(np.stack([x, y], axis=1)).astype(np.int32)], 1)
+        return mask[:, :, None]
+
+    def roi_view(self, frame: np.ndarray) -> np.ndarray:
+        """The part of `frame` the detector sees (the whole frame without an ROI)."""
+        if self.roi is None or self.source_shape != frame.shape[:2]:
+            return frame
+        crop_x1, crop_y1, crop_x2, crop_y2 = self.crop
+        return frame[crop_y1:crop_y2, crop_x1:crop_x2]
+
+    def prepare(self, frame: np.ndarray, out: Optional[np.ndarray] = None) -> np.ndarray:
+        """Write the detector input for `frame` into `out` (allocated if missing or the wrong size)."""
+        height, width = frame.shape[:2]
+        if self.source_shape != (height, width):
+            self._configure(height, width)
+
+        input_w, input_h = self.input_size
+        shape = (input_h, input_w, 3)
+        if out is not None and out.shape != shape and out.dtype == np.uint8 and out.flags['C_CONTIGUOUS'] \
+                and out.size >= input_w * input_h * 3:
+            # Full-size pool buffer holding a smaller ROI input: view its first bytes, like SharedFrameRing.slot()
+            out = out.reshape(-1)[:input_w * input_h * 3].reshape(shape)
+        if out is None or out.shape != shape or out.dtype != np.uint8:
+            out = np.zeros(shape, dtype=np.uint8)
+
+        if self.roi is not None:
+            frame = self.roi_view(frame)
+        content_w, content_h = self.content_size
+        region = out[:content_h, :content_w]
+        if self.rotate:
+            cv2.resize(frame, self.scaled_size, dst=self._scaled, interpolation=cv2.INTER_LINEAR)
+            cv2.rotate(self._scaled, cv2.ROTATE_90_COUNTERCLOCKWISE, dst=region)
+        else:
+            cv2.resize(frame, self.scaled_size, dst=region, interpolation=cv2.INTER_LINEAR)
+        if self._roi_mask is not None:
+            np.multiply(region, self._roi_mask, out=region)
+
+        # Buffers are reused, keep the padding black
+        out[content_h:, :] = 0
+        out[:content_h, content_w:] = 0
+        return out
+
+    def to_gray(self, det_input: np.ndarray) -> np.ndarray:
+        """Grayscale copy of a detector input for optical flow, in the same coordinates."""
+        buffer = self._gray_buffers[self._gray_index]
+        if buffer is None or buffer.shape != det_input.shape[:2]:
+            buffer = np.empty(det_input.shape[:2], dtype=np.uint8)
+            self._gray_buffers[self._gray_index] = buffer
+        self._gray_index ^= 1
+        cv2.cvtColor(det_input, cv2.COLOR_BGR2GRAY, dst=buffer)
+        return buffer
+
+    def boxes_to_source(self, boxes) -> np.ndarray:
+        """Map (N, 4) detector-input boxes back to x1, y1, x2, y2 in camera frame coordinates."""
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        if self.source_shape is None:
+            return boxes.copy()
+        if self.rotate:
+            # Counter-clockwise rotation: detector x is frame y, detector y runs against frame x
+            scaled_w = float(self.scaled_size[0])
+            x1 = (scaled_w - boxes[:, 3]) / self.scale_x
+            x2 = (scaled_w - boxes[:, 1]) / self.scale_x
+            y1 = boxes[:, 0] / self.scale_y
+            y2 = boxes[:, 2] / self.scale_y
+        else:
+            x1 = boxes[:, 0] / self.scale_x
+            x2 = boxes[:, 2] / self.scale_x
+            y1 = boxes[:, 1] / self.scale_y
+            y2 = boxes[:, 3] / self.scale_y
+        height, width = self.source_shape
+        mapped = np.stack([x1, y1, x2, y2], axis=1)
+        if self.roi is not None:
+            # Crop coordinates -> full frame coordinates
+            mapped[:, 0::2] += self.crop[0]
+            mapped[:, 1::2] += self.crop[1]
+        mapped[:, 0::2] = np.clip(mapped[:, 0::2], 0, width)
+        mapped[:, 1::2] = np.clip(mapped[:, 1::2], 0, height)
+        return mapped
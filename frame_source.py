@@ -0,0 +1,631 @@
+#!/usr/bin/env python3
+"""
+Frame Source Layer for AI Kiosk Application
+Lets the vision pipeline read frames from a live camera, a video file,
+a directory of JPEGs or a recorded bundle, with real-time or
+as-fast-as-possible pacing.
+"""
+
+import glob
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import cv2
+
+# Pacing modes
+PACING_REALTIME = 'realtime'  # Deliver frames at their recorded rate
+PACING_FAST = 'fast'          # Deliver frames as fast as the consumer reads them
+PACING_MODES = (PACING_REALTIME, PACING_FAST)
+
+# Recorded bundle layout: <bundle_dir>/manifest.json + <bundle_dir>/frames/*.jpg
+BUNDLE_MANIFEST = 'manifest.json'
+BUNDLE_FRAME_DIR = 'frames'
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+# Reduced-scale JPEG decode: libjpeg scales during the IDCT, far cheaper than decode + resize
+DECODE_SCALES = (1, 2, 4)
+DECODE_FLAGS = {1: cv2.IMREAD_COLOR, 2: cv2.IMREAD_REDUCED_COLOR_2, 4: cv2.IMREAD_REDUCED_COLOR_4}
+
+
+def try_camera_indices(cam_ids=(0, 1)):
+    """Try camera indices 0 and 1 to find a working camera"""
+    for cam_id in cam_ids:
+        print(f"Trying camera index {cam_id}...")
+        cap = cv2.VideoCapture(cam_id)
+
+        if cap.isOpened():
+            # Test if we can actually read a frame
+            ret, frame = cap.read()
+            if ret:
+                print(f"Camera {cam_id} working successfully!")
+                return cap, cam_id
+            else:
+                print(f"Camera {cam_id} opened but can't read frames")
+                cap.release()
+        else:
+            print(f"Camera {cam_id} failed to open")
+            cap.release()
+
+    return None, -1
+
+
+class FrameSource:
+    """
+    Base class for everything the camera loop can read frames from.
+    Subclasses implement open/_read_frame/release; pacing is handled here.
+    """
+
+    is_live = False
+
+    def __init__(self, pacing: str = PACING_REALTIME, fps: float = 15.0):
+        if pacing not in PACING_MODES:
+            raise ValueError(f"Unknown pacing mode: {pacing} (expected one of {PACING_MODES})")
+        self.pacing = pacing
+        self.fps = fps
+        self.frame_index = 0
+        self.last_frame_timestamp = None  # Media timestamp of the last frame (seconds from start)
+        self.last_grab_time = None        # perf_counter() when the last frame left the driver (live sources)
+        self.decode_scale = 1             # Frames from read() are 1/decode_scale of the capture resolution
+        self._last_frame = None
+        self._start_wall_time = None
+        self._start_media_time = None
+
+    @property
+    def full_speed(self) -> bool:
+        """True when frames should be consumed without any wall-clock throttling."""
+        return not self.is_live and self.pacing == PACING_FAST
+
+    def open(self, retry: bool = True) -> bool:
+        """Open the source; with retry=False a live source makes a single attempt instead of waiting for the device."""
+        raise NotImplementedError
+
+    def _read_frame(self) -> Tuple[bool, Any, Optional[float]]:
+        """Return (ok, frame, media_timestamp)."""
+        raise NotImplementedError
+
+    def read(self) -> Tuple[bool, Any]:
+        """Read the next frame, sleeping as needed for real-time pacing."""
+        ret, frame, media_time = self._read_frame()
+        if not ret:
+            return False, None
+
+        if media_time is None:
+            media_time = self.frame_index / self.fps if self.fps > 0 else 0.0
+
+        if self.pacing == PACING_REALTIME and not self.is_live:
+            now = time.time()
+            if self._start_wall_time is None:
+                self._start_wall_time = now
+                self._start_media_time = media_time
+            else:
+                due = self._start_wall_time + (media_time - self._start_media_time)
+                if due > now:
+                    time.sleep(due - now)
+
+        self.frame_index += 1
+        self.last_frame_timestamp = media_time
+        self._last_frame = frame
+        return True, frame
+
+    def set_decode_scale(self, scale: int) -> bool:
+        """Request reduced-scale decoding for read(); returns False if the source cannot do it."""
+        if scale not in DECODE_SCALES:
+            raise ValueError(f"Unsupported decode scale: {scale} (expected one of {DECODE_SCALES})")
+        return scale == 1
+
+    def full_frame(self):
+        """Full-resolution version of the last frame returned by read()."""
+        return self._last_frame
+
+    def skip(self) -> bool:
+        """Consume the next frame without using it."""
+        ret, _ = self.read()
+        return ret
+
+    def configure(self, resolution, fps):
+        """Apply capture settings (only meaningful for live sources)."""
+        pass
+
+    def reconnect(self) -> bool:
+        """Try to recover after a failed read. Recorded sources cannot recover."""
+        return False
+
+    def release(self):
+        pass
+
+    def describe(self) -> str:
+        return self.__class__.__name__
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Source-specific capture statistics (empty for recorded sources)."""
+        return {}
+
+
+class FrameGrabber:
+    """
+    Background thread that keeps the capture driver drained with cap.grab().
+
+    Grabbing only moves the compressed frame out of the driver; the MJPEG
+    decode happens in retrieve(), which runs only when a consumer asks for a
+    frame and always decodes the most recently grabbed one.
+    """
+
+    def __init__(self, cap, max_failures: int = 30, name: str = "camera-grabber"):
+        self.cap = cap
+        self.max_failures = max_failures
+        self.name = name
+        self._cap_lock = threading.Lock()       # grab() and retrieve() must not overlap
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+
+        self._grab_seq = 0
+        self._grab_time = None
+        self._delivered_seq = 0
+        self._retrieving = False
+        self._failures = 0
+        self.failed = False
+
+        # Statistics
+        self.frames_grabbed = 0
+        self.frames_delivered = 0
+        self._window_start = time.perf_counter()
+        self._window_grabbed = 0
+        self._window_delivered = 0
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            # Let a pending retrieve() decode the frame it was woken for before grabbing over it
+            with self._cond:
+                while self._retrieving and not self._stop.is_set():
+                    self._cond.wait(0.05)
+
+            # The sequence number moves with the grab under _cap_lock, so retrieve() always
+            # decodes exactly the frame numbered by the sequence it read
+            with self._cap_lock:
+                ok = self.cap.grab()
+                grab_time = time.perf_counter()
+                with self._cond:
+                    if ok:
+                        self._grab_seq += 1
+                        self._grab_time = grab_time
+                        self._failures = 0
+                        self.frames_grabbed += 1
+                    else:
+                        self._failures += 1
+                        if self._failures >= self.max_failures:
+                            self.failed = True
+                    self._cond.notify_all()
+
+            if not ok:
+                if self.failed:
+                    break
+                time.sleep(0.01)
+
+    def retrieve(self, timeout: float = 1.0) -> Tuple[bool, Any, Optional[float]]:
+        """Decode the newest grabbed frame not delivered yet: (ok, frame, grab_time)."""
+        with self._cond:
+            ready = self._cond.wait_for(
+                lambda: self._grab_seq > self._delivered_seq or self.failed or self._stop.is_set(), timeout)
+            if not ready or self._grab_seq <= self._delivered_seq:
+                return False, None, None
+            self._retrieving = True  # The grabber holds off until this frame is decoded
+
+        ok = False
+        seq = None
+        try:
+            with self._cap_lock:
+                # No grab() can run between reading the sequence and decoding the frame
+                with self._cond:
+                    seq, grab_time = self._grab_seq, self._grab_time
+                ok, frame = self.cap.retrieve()
+        finally:
+            with self._cond:
+                self._retrieving = False
+                if seq is not None:
+                    self._delivered_seq = seq
+                if ok:
+                    self.frames_delivered += 1
+                self._cond.notify_all()
+        return ok, frame, grab_time
+
+    def get_stats(self):
+        """Grabbed vs delivered (decoded) frame counts and rates since the last call."""
+        with self._cond:
+            now = time.perf_counter()
+            elapsed = max(now - self._window_start, 1e-6)
+            stats = {
+                'frames_grabbed': self.frames_grabbed,
+                'frames_delivered': self.frames_delivered,
+                'grab_fps': (self.frames_grabbed - self._window_grabbed) / elapsed,
+                'delivered_fps': (self.frames_delivered - self._window_delivered) / elapsed,
+            }
+            self._window_start = now
+            self._window_grabbed = self.frames_grabbed
+            self._window_delivered = self.frames_delivered
+            return stats
+
+
+class CameraFrameSource(FrameSource):
+    """
+    Live webcam source with the kiosk's retry and reconnect behaviour.
+    A FrameGrabber thread drains the driver; frames are only decoded when read.
+    """
+
+    is_live = True
+
+    def __init__(self, cam_ids=(0, 1), pacing: str = PACING_REALTIME):
+        super().__init__(pacing=pacing)
+        self.cam_ids = tuple(cam_ids)
+        self.cap = None
+        self.grabber: Optional[FrameGrabber] = None
+        self.working_cam_id = -1
+        self.camera_res = None
+        self._last_jpeg = None       # Raw MJPEG buffer of the last frame when decoding at reduced scale
+        self._full_frame = None
+
+    def open(self, retry: bool = True) -> bool:
+        # Try to initialize camera with retry logic
+        while self.cap is None:
+            print(f"Trying camera indices {', '.join(map(str, self.cam_ids))}...")
+            self.cap, self.working_cam_id = try_camera_indices(self.cam_ids)
+
+            # If still no camera found, wait briefly and retry
+            if self.cap is None:
+                if not retry:
+                    print(f"No working camera found (tried indices {self.cam_ids})")
+                    return False
+                print(f"No working camera found (tried indices {self.cam_ids}). Retrying immediately...")
+                time.sleep(1)  # Brief 1-second delay to prevent excessive CPU usage
+
+        print(f"Successfully connected to camera {self.working_cam_id}")
+        self._start_grabber()
+        return True
+
+    def _start_grabber(self):
+        self.grabber = FrameGrabber(self.cap)
+        self.grabber.start()
+
+    def _stop_grabber(self):
+        if self.grabber is not None:
+            self.grabber.stop()
+            self.grabber = None
+
+    def configure(self, resolution, fps):
+        """Setup camera properties for optimal performance"""
+        self.camera_res = resolution
+        self.fps = fps
+        cap = self.cap
+        if cap is None:
+            return
+        # Property changes must not race the grabber thread
+        restart_grabber = self.grabber is not None
+        self._stop_grabber()
+        cap.set(cv2.CAP_PROP_FRAME_WIDTH, resolution[0])  # Adaptive width
+        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, resolution[1])  # Adaptive height
+        cap.set(cv2.CAP_PROP_FPS, fps)  # Adaptive FPS
+        cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)  # Minimize buffer to avoid lag
+        cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc('M', 'J', 'P', 'G'))  # Use MJPEG for better performance
+        cap.set(cv2.CAP_PROP_AUTOFOCUS, 0)  # Disable autofocus to save CPU
+        cap.set(cv2.CAP_PROP_AUTO_EXPOSURE, 0.25)  # Reduce auto-exposure processing
+        # Raw MJPEG buffers from retrieve() so we can decode at reduced scale ourselves
+        cap.set(cv2.CAP_PROP_CONVERT_RGB, 0 if self.decode_scale > 1 else 1)
+        if restart_grabber:
+            self._start_grabber()
+
+    def _read_frame(self):
+        if self.grabber is None:
+            return False, None, None
+        ret, frame, grab_time = self.grabber.retrieve()
+        if not ret:
+            return False, None, None
+        self.last_grab_time = grab_time
+        self._last_jpeg = None
+        self._full_frame = None
+        if self.decode_scale > 1:
+            if frame.ndim == 3 and frame.shape[2] == 3:
+                # Backend ignored CAP_PROP_CONVERT_RGB=0 and already decoded the frame
+                print("Camera does not deliver raw MJPEG buffers, falling back to full-resolution decode")
+                self.decode_scale = 1
+            else:
+                self._last_jpeg = frame
+                frame = cv2.imdecode(frame, DECODE_FLAGS[self.decode_scale])
+                if frame is None:
+                    return False, None, None
+        return True, frame, time.time()
+
+    def set_decode_scale(self, scale: int) -> bool:
+        """Decode MJPEG at 1/2 or 1/4 scale; takes effect at the next configure()."""
+        super().set_decode_scale(scale)
+        self.decode_scale = scale
+        return True
+
+    def full_frame(self):
+        """Decode the last MJPEG buffer at full resolution (only when a consumer needs it)."""
+        if self._last_jpeg is None:
+            return self._last_frame
+        if self._full_frame is None:
+            self._full_frame = cv2.imdecode(self._last_jpeg, cv2.IMREAD_COLOR)
+        return self._full_frame
+
+    def skip(self) -> bool:
+        """The grabber keeps draining the driver, so a skipped frame is simply never decoded."""
+        return self.grabber is not None and not self.grabber.failed
+
+    def get_stats(self):
+        """Grab and delivery rates of the grabber thread."""
+        return self.grabber.get_stats() if self.grabber is not None else {}
+
+    def reconnect(self) -> bool:
+        """Reconnect to the last working camera, falling back to the other indices."""
+        print("Attempting to reconnect to camera...")
+        self._stop_grabber()
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
+
+        # First try the working camera ID
+        if self.working_cam_id != -1:
+            print(f"Trying to reconnect to camera {self.working_cam_id}...")
+            cap = cv2.VideoCapture(self.working_cam_id)
+            if cap.isOpened():
+                ret, _ = cap.read()
+                if ret:
+                    print(f"Successfully reconnected to camera {self.working_cam_id}")
+                    self.cap = cap
+                    if self.camera_res is not None:
+                        self.configure(self.camera_res, self.fps)
+                    self._start_grabber()
+                    return True
+                print(f"Camera {self.working_cam_id} opened but can't read frames")
+            cap.release()
+
+        # If reconnection failed, try the other camera indices
+        print(f"Trying camera indices {', '.join(map(str, self.cam_ids))}...")
+        cap, new_cam_id = try_camera_indices(self.cam_ids)
+        if cap is not None:
+            print(f"Successfully switched to camera {new_cam_id}")
+            self.cap = cap
+            self.working_cam_id = new_cam_id
+            if self.camera_res is not None:
+                self.configure(self.camera_res, self.fps)
+            self._start_grabber()
+            return True
+
+        print(f"No working camera found (tried indices {self.cam_ids})")
+        return False
+
+    def release(self):
+        self._stop_grabber()
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
+
+    def describe(self) -> str:
+        return f"Camera: {self.working_cam_id}"
+
+
+class VideoFileFrameSource(FrameSource):
+    """Replays a video file; timestamps come from the container."""
+
+    def __init__(self, path: str, pacing: str = PACING_REALTIME):
+        super().__init__(pacing=pacing)
+        self.path = path
+        self.cap = None
+
+    def open(self, retry: bool = True) -> bool:
+        self.cap = cv2.VideoCapture(self.path)
+        if not self.cap.isOpened():
+            print(f"Could not open video file: {self.path}")
+            return False
+        fps = self.cap.get(cv2.CAP_PROP_FPS)
+        if fps and fps > 0:
+            self.fps = fps
+        print(f"Opened video file {self.path} ({self.fps:.1f}fps, pacing={self.pacing})")
+        return True
+
+    def _read_frame(self):
+        if self.cap is None:
+            return False, None, None
+        ret, frame = self.cap.read()
+        if not ret:
+            return False, None, None
+        pos_msec = self.cap.get(cv2.CAP_PROP_POS_MSEC)
+        media_time = pos_msec / 1000.0 if pos_msec and pos_msec > 0 else None
+        return True, frame, media_time
+
+    def release(self):
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
+
+    def describe(self) -> str:
+        return f"Video: {os.path.basename(self.path)}"
+
+
+class ImageDirectoryFrameSource(FrameSource):
+    """Replays a directory of still images (e.g. saved_frames/) in name order."""
+
+    def __init__(self, directory: str, pacing: str = PACING_REALTIME, fps: float = 15.0):
+        super().__init__(pacing=pacing, fps=fps)
+        self.directory = directory
+        self.paths: List[str] = []
+
+    def open(self, retry: bool = True) -> bool:
+        self.paths = sorted(
+            path for path in glob.glob(os.path.join(self.directory, '*'))
+            if path.lower().endswith(IMAGE_EXTENSIONS)
+        )
+        if not self.paths:
+            print(f"No images found in {self.directory}")
+            return False
+        print(f"Opened image directory {self.directory} ({len(self.paths)} frames, pacing={self.pacing})")
+        return True
+
+    def _read_frame(self):
+        while self.frame_index < len(self.paths):
+            frame = cv2.imread(self.paths[self.frame_index], DECODE_FLAGS[self.decode_scale])
+            if frame is not None:
+                return True, frame, None
+            print(f"Skipping unreadable image: {self.paths[self.frame_index]}")
+            self.frame_index += 1
+        return False, None, None
+
+    def set_decode_scale(self, scale: int) -> bool:
+        super().set_decode_scale(scale)
+        self.decode_scale = scale
+        return True
+
+    def full_frame(self):
+        if self.decode_scale == 1 or self.frame_index == 0:
+            return self._last_frame
+        return cv2.imread(self.paths[self.frame_index - 1], cv2.IMREAD_COLOR)
+
+    def describe(self) -> str:
+        return f"Images: {os.path.basename(os.path.normpath(self.directory))}"
+
+
+class BundleFrameSource(ImageDirectoryFrameSource):
+    """
+    Replays a recorded bundle: JPEG frames plus a manifest holding the
+    original capture timestamps, so real-time replay keeps field timing.
+    """
+
+    def __init__(self, bundle_dir: str, pacing: str = PACING_REALTIME):
+        super().__init__(bundle_dir, pacing=pacing)
+        self.bundle_dir = bundle_dir
+        self.manifest: Dict[str, Any] = {}
+        self.timestamps: List[float] = []
+
+    def open(self, retry: bool = True) -> bool:
+        manifest_path = os.path.join(self.bundle_dir, BUNDLE_MANIFEST)
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                self.manifest = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Could not read bundle manifest {manifest_path}: {e}")
+            return False
+
+        entries = self.manifest.get('frames', [])
+        self.paths = [os.path.join(self.bundle_dir, entry['file']) for entry in entries]
+        self.fps = float(self.manifest.get('fps', self.fps))
+        self.timestamps = [float(entry.get('t', i / self.fps)) for i, entry in enumerate(entries)]
+        if not self.paths:
+            print(f"Bundle {self.bundle_dir} has no frames")
+            return False
+        print(f"Opened bundle {self.bundle_dir} ({len(self.paths)} frames, pacing={self.pacing})")
+        return True
+
+    def _read_frame(self):
+        ret, frame, _ = super()._read_frame()
+        if not ret:
+            return False, None, None
+        return True, frame, self.timestamps[self.frame_index]
+
+    def describe(self) -> str:
+        return f"Bundle: {os.path.basename(os.path.normpath(self.bundle_dir))}"
+
+
+class BundleRecorder:
+    """Writes frames and their capture timestamps into a replayable bundle."""
+
+    def __init__(self, bundle_dir: str, jpeg_quality: int = 90):
+        self.bundle_dir = bundle_dir
+        self.jpeg_quality = jpeg_quality
+        self.entries: List[Dict[str, Any]] = []
+        self.start_time = None
+        os.makedirs(os.path.join(bundle_dir, BUNDLE_FRAME_DIR), exist_ok=True)
+
+    def add_frame(self, frame, capture_time: Optional[float] = None):
+        if capture_time is None:
+            capture_time = time.time()
+        if self.start_time is None:
+            self.start_time = capture_time
+        filename = os.path.join(BUNDLE_FRAME_DIR, f"frame_{len(self.entries):06d}.jpg")
+        cv2.imwrite(os.path.join(self.bundle_dir, filename), frame,
+                    [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+        self.entries.append({'file': filename, 't': round(capture_time - self.start_time, 6)})
+
+    def close(self):
+        duration = self.entries[-1]['t'] if self.entries else 0.0
+        fps = (len(self.entries) - 1) / duration if duration > 0 else 15.0
+        manifest = {
+            'version': 1,
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'fps': round(fps, 3),
+            'frames': self.entries
+        }
+        with open(os.path.join(self.bundle_dir, BUNDLE_MANIFEST), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2)
+        print(f"Recorded bundle {self.bundle_dir}: {len(self.entries)} frames over {duration:.1f}s")
+
+
+def open_frame_source(spec: str = 'camera', pacing: str = PACING_REALTIME, cam_ids=(0, 1)) -> FrameSource:
+    """
+    Build a frame source from a CLI spec:
+      camera                 - live webcam (tries cam_ids)
+      path/to/video.mp4      - video file
+      path/to/dir            - directory of JPEG/PNG frames
+      path/to/bundle         - recorded bundle (directory containing manifest.json)
+    """
+    if spec in (None, '', 'camera'):
+        return CameraFrameSource(cam_ids=cam_ids, pacing=pacing)
+    if os.path.isdir(spec):
+        if os.path.exists(os.path.join(spec, BUNDLE_MANIFEST)):
+            return BundleFrameSource(spec, pacing=pacing)
+        return ImageDirectoryFrameSource(spec, pacing=pacing)
+    if os.path.isfile(spec):
+        return VideoFileFrameSource(spec, pacing=pacing)
+    raise ValueError(f"Frame source not found: {spec}")
+
+
+if __name__ == "__main__":
+    # Record a bundle from the live camera for later replay
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Record a replayable frame bundle from the camera")
+    parser.add_argument("bundle_dir", help="Output bundle directory")
+    parser.add_argument("--seconds", type=float, default=30.0, help="Recording length in seconds")
+    parser.add_argument("--camid", type=int, default=None, help="Camera ID (default: try 0 and 1)")
+    parser.add_argument("--width", type=int, default=400, help="Capture width")
+    parser.add_argument("--height", type=int, default=300, help="Capture height")
+    parser.add_argument("--fps", type=int, default=15, help="Capture FPS")
+    record_args = parser.parse_args()
+
+    cam_ids = (record_args.camid,) if record_args.camid is not None else (0, 1)
+    source = CameraFrameSource(cam_ids=cam_ids)
+    source.open()
+    source.configure((record_args.width, record_args.height), record_args.fps)
+    recorder = BundleRecorder(record_args.bundle_dir)
+
+    end_time = time.time() + record_args.seconds
+    try:
+        while time.time() < end_time:
+            ret, frame = source.read()
+            if not ret:
+                if not source.reconnect():
+                    time.sleep(1)
+                continue
+            recorder.add_frame(frame)
+    except KeyboardInterrupt:
+        print("\nStopping recording...")
+    finally:
+        recorder.close()
+        source.release()
@@ -2,7 +2,7 @@ import cv2
 import time
 import threading
 import argparse
-from insightface.app import FaceAnalysis
+from ort_session import FaceModels
 from speak import init_dashscope_api_key, synthesis_text_to_speech_and_play_by_streaming_mode,LLM_Speak,userQueryQueue,LAST_ASSISTANT_RESPONSE,STOP_EVENT,NOW_SPEAKING
 from greetings import male_greetings, female_greetings, neutral_greetings
 from suggestion import AUTO_SUGGESTIONS
@@ -21,7 +21,7 @@ parser.add_argument("--headless", action="store_true", help="Run without GUI dis
 args = parser.parse_args()
 
 # Initialize face analysis
-app = FaceAnalysis(allowed_modules=['detection','genderage'])
+app = FaceModels(allowed_modules=['detection','genderage'])
 app.prepare(ctx_id=-1, det_size=(640, 640))
 
 cap = cv2.VideoCapture(0)
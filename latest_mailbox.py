@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Latest-Wins Mailbox for AI Kiosk Application
+Single-slot hand-off between the camera loop and the face detection
+worker. A new item overwrites the one still waiting, so the consumer
+always works on the freshest frame (or result) and never on a backlog.
+"""
+
+import queue
+import threading
+import time
+from typing import Any, Optional, Tuple
+
+
+class LatestMailbox:
+    """
+    Thread-safe single-slot mailbox with sequence numbers.
+
+    put() stores an item under the next sequence number and returns the
+    unread item it replaced (or None), so callers can recycle buffers.
+    get() blocks for the next unread item and returns (seq, item); gaps in
+    the sequence numbers are the items that were overwritten. Raises
+    queue.Empty on timeout or once the mailbox is closed, like queue.Queue.
+    """
+
+    def __init__(self, name: str = "mailbox"):
+        self.name = name
+        self._cond = threading.Condition()
+        self._item: Any = None
+        self._item_seq = 0
+        self._has_item = False
+        self._closed = False
+
+        # Statistics
+        self.seq = 0          # Sequence number of the last item put
+        self.delivered = 0
+        self.dropped = 0      # Items overwritten before anyone read them
+
+    def put(self, item: Any, block: bool = False, timeout: Optional[float] = None) -> Any:
+        """
+        Store `item`, overwriting any unread one. With block=True, first wait
+        up to `timeout` seconds for the consumer to take the unread item
+        (used when replaying footage, where no frame should be dropped).
+        """
+        with self._cond:
+            if block and self._has_item and not self._closed:
+                deadline = None if timeout is None else time.monotonic() + timeout
+                while self._has_item and not self._closed:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+
+            replaced = None
+            if self._has_item:
+                replaced = self._item
+                self.dropped += 1
+            self.seq += 1
+            self._item = item
+            self._item_seq = self.seq
+            self._has_item = True
+            self._cond.notify_all()
+            return replaced
+
+    def get(self, timeout: Optional[float] = None) -> Tuple[int, Any]:
+        """Take the latest unread item as (seq, item)."""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._has_item or self._closed, timeout):
+                raise queue.Empty
+            if not self._has_item:
+                raise queue.Empty  # Closed
+            return self._take()
+
+    def get_nowait(self) -> Tuple[int, Any]:
+        with self._cond:
+            if not self._has_item:
+                raise queue.Empty
+            return self._take()
+
+    def _take(self) -> Tuple[int, Any]:
+        item, seq = self._item, self._item_seq
+        self._item = None
+        self._has_item = False
+        self.delivered += 1
+        self._cond.notify_all()
+        return seq, item
+
+    def pending(self) -> bool:
+        """True while an item is waiting to be read."""
+        with self._cond:
+            return self._has_item
+
+    def clear(self) -> Any:
+        """Discard the unread item (returned so buffers can be recycled)."""
+        with self._cond:
+            item = self._item if self._has_item else None
+            self._item = None
+            self._has_item = False
+            self._cond.notify_all()
+            return item
+
+    def close(self):
+        """Wake every waiter; get() raises queue.Empty from now on once the slot is empty."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def get_stats(self):
+        """Get mailbox statistics."""
+        with self._cond:
+            return {
+                'name': self.name,
+                'seq': self.seq,
+                'delivered': self.delivered,
+                'dropped': self.dropped,
+                'drop_ratio': self.dropped / self.seq if self.seq else 0.0
+            }
@@ -10,8 +10,11 @@ import pyaudio  # For pyaudio error handling
 
 import dashscope
 from dashscope.audio.asr import *
-from speak import userQueryQueue, LAST_ASSISTANT_RESPONSE, NOW_SPEAKING, USER_ABSENT, SHOULD_LISTEN
+from speak import userQueryQueue, LAST_ASSISTANT_RESPONSE, NOW_SPEAKING, USER_ABSENT, SHOULD_LISTEN, dashscope_api_key_missing
 from echocheck import is_likely_system_echo
+from cpu_optimizer import get_optimizer
+from deep_idle import get_deep_idle
+from presence import ENGAGED_STATES, get_presence
 
 # Global application state - will be set by main.py
 APPLICATION_SHOULD_RUN = None
@@ -29,7 +32,8 @@ sample_rate = 16000  # sampling rate (Hz) - keeping standard for compatibility
 channels = 1  # mono channel
 dtype = 'int16'  # data type
 format_pcm = 'pcm'  # the format of the audio data
-block_size = 9600  # Increased from 6400 to 9600 to further reduce processing frequency (600ms chunks)
+block_size = 9600  # Increased from 6400 to 9600 to further reduce processing frequency (600ms chunks); follows the CPU optimizer's level
+MAX_AUDIO_BLOCK_SIZE = 2 * sample_rate  # Upper bound for throttled audio blocks (2s chunks)
 
 # Maximum reconnection attempts before giving up
 MAX_RETRY_ATTEMPTS = 10
@@ -38,6 +42,17 @@ INITIAL_BACKOFF = 2
 # Maximum time to wait for a recognition response
 RECOGNITION_TIMEOUT = 15  # seconds
 
+def apply_audio_block_size():
+    """Take the CPU optimizer's audio block size; only called before recognition (re)starts, when no stream is open"""
+    global block_size
+    optimizer = get_optimizer()
+    # Larger blocks while audio is the throttled subsystem (fewer callbacks and sends per second)
+    new_block_size = int(optimizer.get_performance_settings()['audio_block_size'] * optimizer.get_throttle('audio'))
+    new_block_size = min(new_block_size, MAX_AUDIO_BLOCK_SIZE)
+    if new_block_size != block_size:
+        print(f"Audio block size changed from {block_size} to {new_block_size} frames ({new_block_size * 1000 // sample_rate}ms)")
+        block_size = new_block_size
+
 def init_dashscope_api_key():
     """
         Set your DashScope API-key. More information:
@@ -186,6 +201,22 @@ def signal_handler(sig, frame):
 
 # def isLenedteEntd
 
+def check_asr_ready():
+    """Check speech recognition prerequisites (API key, microphone); returns an error or None"""
+    if dashscope_api_key_missing():
+        return "DASHSCOPE_API_KEY not set"
+    try:
+        audio = pyaudio.PyAudio()
+    except Exception as e:
+        return f"audio system unavailable: {e}"
+    try:
+        for i in range(audio.get_device_count()):
+            if audio.get_device_info_by_index(i).get('maxInputChannels', 0) > 0:
+                return None
+        return "no microphone"
+    finally:
+        audio.terminate()
+
 def mic_listen():
     global mic, stream
     callback = Callback()
@@ -213,13 +244,22 @@ def mic_listen():
                         print(f"Error stopping recognition: {e}")
                     recognition = None
                 
+                # Deep idle: release the audio device too (on_open creates a new PyAudio instance)
+                if mic is not None and stream is None:
+                    try:
+                        mic.terminate()
+                    except Exception as e:
+                        print(f"Error releasing audio device: {e}")
+                    mic = None
+                    print("Audio device released for deep idle")
+                
                 # Reset all pause flags
                 recognition_paused_for_listen_status = True
                 recognition_paused_for_speech = False
                 recognition_paused_for_absence = False
                 
-                # Wait longer to reduce CPU usage when application is disabled
-                time.sleep(3.0)
+                # Sleep until the application is enabled again (checked every 3s as before)
+                get_deep_idle().wait_enabled(3.0)
                 continue
             
             # SECOND CHECK: If listening is disabled by API, skip everything
@@ -271,8 +311,9 @@ def mic_listen():
                     recognition = None
                     recognition_paused_for_absence = True
                 
-                # Wait longer to reduce CPU usage during user absence
-                time.sleep(3.0)  # Increased from 2.0 to 3.0 seconds for maximum CPU savings
+                # Block until the presence state machine reports a user (or 3s pass)
+                if get_presence().wait_for(ENGAGED_STATES, timeout=3.0):
+                    last_check_time = 0  # Restart recognition right away instead of after the status check interval
                 continue
             
             # User is present now, check if we need to restart recognition
@@ -281,8 +322,6 @@ def mic_listen():
                 recognition_paused_for_absence = False
                 # Reset consecutive stops counter since this is an intentional restart
                 consecutive_recognition_stops = 0
-                # Small delay to make sure everything is ready
-                time.sleep(1.0)
             
             # Check if system is speaking
             if NOW_SPEAKING.locked():
@@ -338,6 +377,9 @@ def mic_listen():
             
             # Initialize recognition if needed (only if listening is enabled)
             if recognition is None and SHOULD_LISTEN.is_set():
+                # Performance level changes reach the audio stream here, before it is reopened
+                apply_audio_block_size()
+                
                 # Call recognition service by async mode
                 recognition = Recognition(
                     model='paraformer-realtime-v2',
@@ -1,6 +1,6 @@
 from fetchDataFromAPI import fetch_product_by_name, check_listen_status
 import sys
-from listener import mic_listen
+from listener import mic_listen, check_asr_ready
 import cv2
 import time
 import threading
@@ -8,7 +8,6 @@ import argparse
 import numpy as np
 import queue
 from collections import deque
-from insightface.app import FaceAnalysis
 from task_monitor import TaskMonitor
 import os
 import glob
@@ -22,7 +21,8 @@ from speak import ( init_dashscope_api_key,
                     STOP_EVENT, 
                     NOW_SPEAKING,
                     USER_ABSENT,
-                    SHOULD_LISTEN)
+                    SHOULD_LISTEN,
+                    check_tts_ready)
 
 from greetings import (male_greetings, 
                        female_greetings, 
@@ -46,7 +46,31 @@ except ImportError:
 
 # Import CPU optimizer
 from cpu_optimizer import get_optimizer, optimize_process_priority, enable_cpu_affinity_optimization
+from core_affinity import AFFINITY_PROFILES, get_affinity_planner
+from deep_idle import get_deep_idle, trim_process_memory
+from presence import ENGAGED_STATES, PRESENCE_ABSENT, PRESENCE_LEAVING, PRESENCE_PRESENT, PRESENCE_TOO_FAR, get_presence
+from system_metrics import get_system_sampler
 from websocket_server import init_websocket_server, update_user_presence
+from frame_source import open_frame_source, PACING_MODES, PACING_REALTIME, DECODE_SCALES
+from motion_gate import MotionGate
+from face_results import empty_face_results, face_age, face_widths, face_areas, gender_label
+from face_tracker import FaceTracker, top_k_indices
+from detection_process import DEFAULT_WARMUP_INFERENCES, DetectionProcess, LocalFaceDetector
+from readiness import get_readiness
+from startup import get_startup
+from ort_session import ORT_PROFILE_PATH
+from frame_preprocess import DetectorPreprocessor, parse_roi
+from latest_mailbox import LatestMailbox
+from vision_metrics import (get_vision_metrics,
+                            STAGE_CAPTURE,
+                            STAGE_CAPTURE_TO_USE,
+                            STAGE_PREPROCESS,
+                            STAGE_QUEUE_WAIT,
+                            STAGE_INFERENCE,
+                            STAGE_ATTRIBUTES,
+                            STAGE_GREETING_DECISION,
+                            STAGE_CAPTURE_TO_RESULT,
+                            STAGE_CAPTURE_TO_GREETING)
 
 # Argument parser for headless mode
 parser = argparse.ArgumentParser()
@@ -55,6 +79,17 @@ parser.add_argument("--headless", action="store_true", help="Run without GUI dis
 parser.add_argument("--camid", type=int, default=1, help="Camera ID")
 # Machine id
 parser.add_argument("--machineid", type=str, default="7", help="Machine ID")
+# Frame source (camera, video file, image directory or recorded bundle)
+parser.add_argument("--source", type=str, default="camera", help="Frame source: 'camera', a video file, a directory of JPEGs or a recorded bundle")
+parser.add_argument("--pacing", type=str, default=PACING_REALTIME, choices=PACING_MODES, help="Replay pacing for recorded sources: realtime or fast (as fast as possible)")
+parser.add_argument("--detection-process", action="store_true", help="Run the face detector in a separate process (frames via shared memory)")
+parser.add_argument("--ort-profile", type=str, default=ORT_PROFILE_PATH, help="ONNX Runtime session profile for the face detector (see benchmarks/tune_ort_session.py)")
+parser.add_argument("--warmup-inferences", type=int, default=DEFAULT_WARMUP_INFERENCES, help="Detector warm-up inferences on synthetic frames before vision reports ready")
+parser.add_argument("--idle-unload-models", action="store_true", help="Unload the face models while the task monitor has the application disabled (less RAM, slower resume)")
+parser.add_argument("--resume-target", type=float, default=3.0, help="Target seconds for camera and detector to be working again after the application is re-enabled")
+parser.add_argument("--affinity-profile", type=str, default="auto", help=f"Per-subsystem core plan: auto (detect the board), none, generic or one of {', '.join(AFFINITY_PROFILES)}")
+parser.add_argument("--roi", type=str, default="", help="Detection region of interest as frame fractions: x1,y1,x2,y2 or a JSON polygon [[x,y],...] (overrides the machine config's detectionRoi)")
+parser.add_argument("--decode-scale", type=int, default=1, choices=DECODE_SCALES, help="Decode MJPEG frames at 1/N scale for detection (headless only; full resolution decoded on demand)")
 args = parser.parse_args()
 
 absence_threshold = 5  # seconds
@@ -73,32 +108,61 @@ application_should_run = True
 GREET_GENDER_ENABLED = False  # Controls whether gender detection is enabled
 
 # Performance optimization variables
-frame_queue = queue.Queue(maxsize=3)  # Small queue to prevent memory buildup
-detection_result_queue = queue.Queue(maxsize=5)
+# Latest-wins single-slot mailboxes: the worker always gets the newest frame and the
+# camera loop the newest result, so detection latency stays bounded by one inference
+frame_mailbox = LatestMailbox("frames")
+detection_result_mailbox = LatestMailbox("detection results")
 latest_frame = None
-latest_faces = []
+latest_faces = empty_face_results()  # Face result array of the latest detection (face_results.py)
 detection_timestamp = 0
 frame_lock = threading.Lock()
 
 # Camera optimization flags
-ENABLE_FRAME_ROTATION = True  # Set to False to eliminate expensive rotation
+ENABLE_FRAME_ROTATION = True  # Rotate frames 90 degrees counter-clockwise for the detector (portrait kiosk camera)
+DET_SIZE = tuple(get_optimizer().get_performance_settings()['detection_size'])  # Detector input size at startup; frames are letterboxed straight into it
+DET_SIZES = get_optimizer().detection_sizes()  # Sizes the performance levels switch between at runtime, prepared up front
+ENABLE_MOTION_GATE = True  # Skip face detection while nobody is in view and the scene is static
+MOTION_GATE_SAFETY_INTERVAL = 5.0  # Run detection at least this often even when the scene looks static
 
-# Memory optimization - pre-allocated buffers
+# Memory optimization - pre-allocated detector input buffers (queued frames + the one being detected)
 frame_buffer_pool = []
 BUFFER_POOL_SIZE = 5
 
+# Raw frame -> letterboxed detector input, and detector boxes -> camera frame coordinates
+detector_preprocessor = DetectorPreprocessor(DET_SIZE, rotate=ENABLE_FRAME_ROTATION)
+
+def apply_detection_roi(roi_value, origin):
+    """Limit face detection to the service zone (crop rectangle or polygon); invalid ROIs are ignored"""
+    try:
+        roi = parse_roi(roi_value)
+    except ValueError as e:
+        print(f"Ignoring detection ROI from {origin}: {e}")
+        return False
+    detector_preprocessor.set_roi(roi)
+    if roi is not None:
+        shape = f"polygon of {len(roi['polygon'])} points" if roi['polygon'] else "rectangle"
+        print(f"Detection ROI from {origin}: {shape}, bounds {roi['rect']}")
+    return roi is not None
+
+if args.roi:
+    apply_detection_roi(args.roi, "--roi")
+
+# Out-of-process face detector (--detection-process); its shared-memory slots back frame_buffer_pool
+detection_process = None
+
+# Detector and frame source, loaded / opened once by the startup phases (or lazily by their threads)
+face_detector = None
+face_detector_lock = threading.Lock()
+camera_source = None
+camera_source_lock = threading.Lock()
+
 # FPS monitoring
 fps_counter = 0
 fps_start_time = time.time()
 current_fps = 0
 
-# Face tracking for optimization
-face_tracking_data = {
-    'last_position': None,
-    'stability_count': 0,
-    'last_detection_time': 0,
-    'tracking_mode': False
-}
+# Face tracking between detector runs (boxes propagated with optical flow)
+face_tracker = FaceTracker()
 
 # Frame saving configuration
 FRAME_SAVE_DIR = "saved_frames"
@@ -115,6 +179,14 @@ last_ws_update_time = 0
 # Face distance estimation constants
 KNOWN_FACE_WIDTH = 0.15  # Average human face width in meters (15cm)
 FOCAL_LENGTH = 500  # Approximate focal length, will need calibration for accuracy
+DISTANCE_REFERENCE_SCALE = 0.5  # FOCAL_LENGTH was calibrated on half-size detection frames
+
+# Crowd mode - per-frame work stays bounded when a group stands in front of the kiosk
+CROWD_MAX_FACES = 3  # Only the K largest (closest) faces are tracked, drawn and considered for attributes
+CROWD_MAX_DISTANCE = 4.0  # Faces estimated farther than this (meters) are never the user
+
+# Seconds the startup phase report waits for phases still running once the application is ready
+STARTUP_REPORT_TIMEOUT = 5.0
 
 # Deck shuffling for auto-suggestions (to avoid repetition)
 auto_suggestions_available = []
@@ -265,12 +337,14 @@ def on_application_start(task_data):
     global application_should_run
     application_should_run = True
     print(f"Application enabled - Task: {task_data.get('currentTaskName')}")
+    get_deep_idle().resume()  # Wake the camera loop, detector, listener and suggestion timers
 
 def on_application_stop(task_data):
     """Called when application should stop running"""
     global application_should_run
     application_should_run = False
     print(f"Application disabled - Task Status: {task_data.get('taskStatus')}")
+    get_deep_idle().enter()
     
     # Clear any ongoing speech safely
     try:
@@ -279,6 +353,30 @@ def on_application_stop(task_data):
     except Exception as e:
         print(f"Note: Lock release handled: {e}")
 
+# Speech addressed to the user in front of the kiosk; dropped if they left after it was queued
+USER_DIRECTED_SPEECH = ('greeting', 'instant_greeting', 'suggestion')
+
+# Presence subscriber - runs in the camera loop on every presence transition
+def on_presence_transition(transition):
+    """Update the listener gate, greeting state and WebSocket clients as soon as presence changes"""
+    global is_greeted
+    state = transition['state']
+    print(f"Presence: {transition['previous']} -> {state} (after {transition['previous_duration']:.1f}s)")
+    if state in ENGAGED_STATES:
+        USER_ABSENT.clear()
+    else:
+        USER_ABSENT.set()
+    if state == PRESENCE_ABSENT:
+        is_greeted = False
+    update_user_presence(
+        user_present=state != PRESENCE_ABSENT,
+        user_count=transition['user_count'],
+        distance=transition['distance'],
+        gender=None,
+        age=None,
+        presence_state=state
+    )
+
 # Speech worker function for thread pool
 def speech_worker(worker_id):
     """Speech worker thread for processing speech requests"""
@@ -302,6 +400,14 @@ def speech_worker(worker_id):
             if not text:
                 continue
             
+            # The user this was meant for has left in the meantime
+            presence = get_presence()
+            if (speech_type in USER_DIRECTED_SPEECH and presence.state == PRESENCE_ABSENT
+                    and presence.since > speech_request.get('timestamp', 0)):
+                print(f"Worker {worker_id} dropping {speech_type}: user left")
+                pending_speech_requests.task_done()
+                continue
+            
             # Acquire speaking lock
             if NOW_SPEAKING.acquire(blocking=False):
                 try:
@@ -353,8 +459,15 @@ def play_speech(text):
 
 # Auto-suggest thread function
 def suggest_loop():
+    presence = get_presence()
     while not stop_event.is_set():
-        time.sleep(suggest_interval)
+        get_deep_idle().wait_enabled()  # Suspended during deep idle; the interval restarts on resume
+        # The interval starts when a user arrives and is cancelled as soon as they leave
+        if not presence.wait_for((PRESENCE_PRESENT,), timeout=1.0):
+            continue
+        version = presence.version
+        if presence.wait_for_change(version, timeout=suggest_interval) != version:
+            continue
         if application_should_run and face_detected:
             suggestion = get_next_suggestion(is_person_present=True)
             text = f"。　{suggestion}　。"
@@ -364,6 +477,7 @@ def suggest_loop():
 def auto_speak_loop():
     auto_speak_interval = 60  # 1 minute
     while not stop_event.is_set():
+        get_deep_idle().wait_enabled()  # Suspended during deep idle; the interval restarts on resume
         time.sleep(auto_speak_interval)
         # Only speak when no user is detected
         if application_should_run and not face_detected:
@@ -427,7 +541,7 @@ def listen_status_monitor():
         except Exception as e:
             print(f"Listen Status Monitor Error: {e}")
         
-        time.sleep(monitor_interval)
+        time.sleep(monitor_interval * get_optimizer().get_throttle('polling'))
 
 
 GREETINGs = []
@@ -460,38 +574,51 @@ def calculate_distance(face_width_pixels):
     distance = (KNOWN_FACE_WIDTH * FOCAL_LENGTH) / face_width_pixels
     return distance
 
-def try_camera_indices():
-    """Try camera indices 0 and 1 to find a working camera"""
-    for cam_id in [0, 1]:
-        print(f"Trying camera index {cam_id}...")
-        cap = cv2.VideoCapture(cam_id)
-        
-        if cap.isOpened():
-            # Test if we can actually read a frame
-            ret, frame = cap.read()
-            if ret:
-                print(f"Camera {cam_id} working successfully!")
-                return cap, cam_id
-            else:
-                print(f"Camera {cam_id} opened but can't read frames")
-                cap.release()
-        else:
-            print(f"Camera {cam_id} failed to open")
-            cap.release()
-    
-    return None, -1
+def detector_face_width(width):
+    """Face width in detector-input pixels converted to the scale FOCAL_LENGTH was calibrated at"""
+    return width * DISTANCE_REFERENCE_SCALE / detector_preprocessor.camera_scale
+
+def face_distances(faces):
+    """Estimated distance in meters of every face in a face result array"""
+    return calculate_distance(detector_face_width(np.maximum(face_widths(faces), 1.0)))
+
+def select_crowd_faces(faces):
+    """Keep the CROWD_MAX_FACES largest faces within CROWD_MAX_DISTANCE, largest first; returns (faces, dropped)"""
+    if not len(faces):
+        return faces, 0
+    # One vectorized pass over every box instead of per-face Python work
+    keep = top_k_indices(face_areas(faces), CROWD_MAX_FACES, face_distances(faces) <= CROWD_MAX_DISTANCE)
+    return faces[keep], len(faces) - len(keep)
 
 def initialize_frame_buffers(width, height):
-    """Pre-allocate frame buffers to reduce memory allocation overhead"""
+    """Pre-allocate detector input buffers to reduce memory allocation overhead"""
     global frame_buffer_pool
     frame_buffer_pool.clear()
     
+    if detection_process is not None:
+        # Shared-memory slots: the detection process reads frames without a copy
+        frame_buffer_pool.extend(detection_process.pool_buffers((height, width, 3)))
+        print(f"Initialized {len(frame_buffer_pool)} shared-memory frame buffers ({width}x{height})")
+        return
+    
     for i in range(BUFFER_POOL_SIZE):
         buffer = np.zeros((height, width, 3), dtype=np.uint8)
         frame_buffer_pool.append(buffer)
     
     print(f"Initialized {BUFFER_POOL_SIZE} frame buffers ({width}x{height})")
 
+def resize_frame_buffers(width, height):
+    """Switch the pool to a new detector input size without handing out buffers that are still in flight"""
+    if detection_process is None:
+        # In-flight buffers are separate arrays; return_frame_buffer drops them at the old size
+        initialize_frame_buffers(width, height)
+        return
+    # Only the free slots are re-viewed here; slots still queued in the mailbox or being detected
+    # on by the child are re-viewed by return_frame_buffer when they come back
+    ring = detection_process.ring
+    frame_buffer_pool[:] = [ring.slot(ring.slot_of(buffer), (height, width, 3)) for buffer in frame_buffer_pool]
+    print(f"Resized {len(frame_buffer_pool)} free shared-memory frame buffers ({width}x{height})")
+
 def get_frame_buffer():
     """Get a pre-allocated frame buffer"""
     if frame_buffer_pool:
@@ -502,9 +629,96 @@ def get_frame_buffer():
 
 def return_frame_buffer(buffer):
     """Return frame buffer to pool"""
+    det_w, det_h = detector_preprocessor.det_size
+    if buffer.shape != (det_h, det_w, 3):
+        # ROI input viewing a full-size pool buffer, or prepared before a detector input size switch
+        if detection_process is None:
+            if buffer.base is None or buffer.base.shape != (det_h, det_w, 3):
+                return  # Dropped; prepare() allocates replacements at the new size
+            buffer = buffer.base
+        else:
+            slot = detection_process.ring.slot_of(buffer)
+            if slot is None:
+                return
+            buffer = detection_process.ring.slot(slot, (det_h, det_w, 3))
+    if detection_process is not None:
+        # A slot may only be in the pool once, or two frames would share its pixels
+        slot = detection_process.ring.slot_of(buffer)
+        if any(detection_process.ring.slot_of(pooled) == slot for pooled in frame_buffer_pool):
+            return
     if len(frame_buffer_pool) < BUFFER_POOL_SIZE:
         frame_buffer_pool.append(buffer)
 
+def apply_detection_size(det_size):
+    """Switch the detector input size (every level's size was prepared when the detector started)"""
+    old_size = tuple(detector_preprocessor.det_size)
+    det_size = tuple(det_size)
+    if det_size == old_size:
+        return False
+    detector_preprocessor.set_det_size(det_size)
+    resize_frame_buffers(det_size[0], det_size[1])
+    # Tracks live in detector-input coordinates, which scale with the input size
+    face_tracker.rescale(min(det_size[0] / old_size[0], det_size[1] / old_size[1]))
+    print(f"Detector input size changed from {old_size[0]}x{old_size[1]} to {det_size[0]}x{det_size[1]}")
+    return True
+
+def setup_detection_process():
+    """Create the out-of-process face detector when --detection-process is given"""
+    global detection_process
+    if args.detection_process and detection_process is None:
+        detection_process = DetectionProcess(DET_SIZE, slots=BUFFER_POOL_SIZE, profile_path=args.ort_profile,
+                                             det_sizes=DET_SIZES, warmup_inferences=args.warmup_inferences)
+    return detection_process
+
+def start_face_detector():
+    """Load and warm up the face detector once (startup 'models' phase); the detection worker picks it up"""
+    global face_detector
+    with face_detector_lock:
+        if face_detector is None:
+            detector = detection_process if detection_process is not None else LocalFaceDetector(DET_SIZE, args.ort_profile, DET_SIZES,
+                                                                                                 args.warmup_inferences)
+            try:
+                started = detector.start()
+                error = None if started else "detector did not start"
+            except Exception as e:
+                error = f"detector failed to load: {e}"
+            if error:
+                print(f"Could not start the face detector: {error}")
+                get_readiness().report_failed('vision', error)
+                return None
+            # Models loaded and warmed up: the first visitor gets warm-path latency
+            get_readiness().report_ready('vision', **detector.warmup)
+            face_detector = detector
+        return face_detector
+
+def open_camera_source():
+    """Open the frame source once (startup 'camera' phase); the camera loop picks it up"""
+    global camera_source
+    with camera_source_lock:
+        if camera_source is None:
+            source = open_frame_source(args.source, pacing=args.pacing)
+            if not source.open():
+                print(f"Failed to open frame source: {args.source}")
+                return None
+            camera_source = source
+        return camera_source
+
+def probe_component(name, check):
+    """Run a readiness check (returns an error or None) and report the result for `name`"""
+    error = check()
+    if error:
+        get_readiness().report_failed(name, error)
+    else:
+        get_readiness().report_ready(name)
+    return error is None
+
+def init_cpu_optimizations():
+    """Process priority, per-subsystem core plan and CPU monitoring"""
+    print("Initializing CPU optimizations...")
+    optimize_process_priority()
+    enable_cpu_affinity_optimization(args.affinity_profile)
+    get_optimizer().start_monitoring()
+
 def setup_frame_save_directory():
     """Create frame save directory if it doesn't exist"""
     if not os.path.exists(FRAME_SAVE_DIR):
@@ -513,7 +727,7 @@ def setup_frame_save_directory():
 
 def save_frame_with_user(frame, faces):
     """Save frame when user is detected"""
-    if not ENABLE_FRAME_SAVING or not faces:
+    if not ENABLE_FRAME_SAVING or not len(faces):
         return
     
     try:
@@ -558,40 +772,6 @@ def cleanup_old_frames():
     except Exception as e:
         print(f"Error during frame cleanup: {e}")
 
-def parse_gender(face_obj):
-    """Parse gender from face detection object, handling different formats"""
-    try:
-        # Try different possible attribute names
-        for attr in ['sex', 'gender', 'g']:
-            if hasattr(face_obj, attr):
-                gender_value = getattr(face_obj, attr)
-                
-                # Handle numeric gender (common format: 0=female, 1=male)
-                if isinstance(gender_value, (int, float)):
-                    return 'M' if gender_value >= 0.5 else 'F'
-                
-                # Handle string gender
-                if isinstance(gender_value, str):
-                    gender_lower = gender_value.lower()
-                    if gender_lower in ['m', 'male', 'man']:
-                        return 'M'
-                    elif gender_lower in ['f', 'female', 'woman']:
-                        return 'F'
-                    
-                # Return raw value if it's already in expected format
-                if gender_value in ['M', 'F']:
-                    return gender_value
-        
-        # Check if there's a gender prediction array/tensor
-        if hasattr(face_obj, 'gender_prob') or hasattr(face_obj, 'gender'):
-            print(f"Found gender attributes, debugging...")
-            
-        return 'unknown'
-        
-    except Exception as e:
-        print(f"Error parsing gender: {e}")
-        return 'unknown'
-
 def age_detection(age):
     if age < 18:
         return "小朋友"
@@ -604,22 +784,28 @@ def age_detection(age):
 def face_detection_worker():
     """Separate thread for face detection processing with intelligent caching"""
     global latest_faces, detection_timestamp, stop_event, application_should_run
-    
-    # Initialize face analysis with minimal modules for speed
-    app = FaceAnalysis(allowed_modules=['detection', 'genderage'])
+    metrics = get_vision_metrics()
     
     # Get optimizer for performance settings
     optimizer = get_optimizer()
     perf_settings = optimizer.get_performance_settings()
-    det_size = (320, 320)  # Use smaller detection size for much faster processing
-    app.prepare(ctx_id=-1, det_size=det_size)
+    
+    # Detection and genderage (on demand for one face), in this thread or in a separate process.
+    # Frames arrive already letterboxed to the current performance level's size.
+    # Usually already loaded by the startup 'models' phase; otherwise this waits for or does the load.
+    detector = start_face_detector()
+    if detector is None:
+        print("Face detection worker could not start the detector")
+        return
     
     # Performance tracking
     detection_times = deque(maxlen=10)  # Track last 10 detection times
     avg_detection_time = 0.2  # Initial estimate
     
-    # WebSocket absence tracking
-    last_user_present_state = False
+    # Deep idle: models are optionally unloaded while the application is disabled
+    deep_idle = get_deep_idle()
+    detector_loaded = True
+    was_idle = False
     
     print("Face detection worker started")
     
@@ -627,23 +813,62 @@ def face_detection_worker():
         try:
             # Check if application should run
             if not application_should_run:
-                time.sleep(1)
+                if deep_idle.unload_models and detector_loaded:
+                    detector.unload()
+                    detector_loaded = False
+                    trim_process_memory()
+                    print("Face detection models unloaded for deep idle")
+                was_idle = True
+                deep_idle.wait_enabled(1.0)
                 continue
+            if was_idle:
+                # Warm start after deep idle (optimized graphs come from the ORT cache)
+                if not detector_loaded:
+                    if not detector.start():
+                        print("Face detection worker could not restart the detector, retrying")
+                        time.sleep(1)
+                        continue
+                    detector_loaded = True
+                was_idle = False
+                deep_idle.component_ready('detector')
             
-            # Get frame from queue (with timeout to prevent blocking)
+            # Get the newest frame (with timeout to prevent blocking)
             try:
-                frame_data = frame_queue.get(timeout=0.1)
-                if frame_data is None:  # Shutdown signal
-                    break
-                    
-                frame, timestamp = frame_data
+                frame_seq, frame_data = frame_mailbox.get(timeout=0.1)
+                frame, timestamp, frame_times, attribute_box = frame_data
             except queue.Empty:
+                if frame_mailbox.closed:  # Shutdown signal
+                    break
                 continue
             
-            # Perform face detection with timing
+            # Perform face detection with timing (detection only - the hot path).
+            # Gender/age on demand for a single face: the tracked face the camera loop
+            # has no attributes for yet, or the closest face about to be greeted
+            global is_greeted, GREET_GENDER_ENABLED
             start_time = time.time()
-            faces = app.get(frame)
+            metrics.record(STAGE_QUEUE_WAIT, time.perf_counter() - frame_times['enqueued'])
+            detection = detector.detect(frame,
+                                        attribute_box=attribute_box if GREET_GENDER_ENABLED else None,
+                                        largest_attributes=GREET_GENDER_ENABLED and not is_greeted)
+            if detection is None:
+                # Detection process crashed and was restarted; this frame is lost
+                return_frame_buffer(frame)
+                continue
+            faces, attribute_index, inference_seconds, attribute_seconds = detection
+            metrics.record(STAGE_INFERENCE, inference_seconds)
+            
+            # Crowd mode: tracking, greeting and overlay only see the closest faces
+            faces, faces_dropped = select_crowd_faces(faces)
+            if faces_dropped:
+                metrics.increment('faces_dropped', faces_dropped)
+            if attribute_index >= 0:
+                metrics.record(STAGE_ATTRIBUTES, attribute_seconds)
+                metrics.increment('attribute_inferences')
+            
+            results_ready = time.perf_counter()
             detection_time = time.time() - start_time
+            metrics.record(STAGE_CAPTURE_TO_RESULT, results_ready - frame_times['captured'])
+            metrics.increment('frames_detected')
             
             # Update performance tracking
             detection_times.append(detection_time)
@@ -654,47 +879,25 @@ def face_detection_worker():
                 latest_faces = faces
                 detection_timestamp = timestamp
             
-            # Track user presence state changes for immediate WebSocket updates
-            current_user_present = bool(faces)
-            if current_user_present != last_user_present_state:
-                if not current_user_present:
-                    # User just became absent - send immediate update
-                    update_user_presence(
-                        user_present=False,
-                        user_count=0,
-                        distance=None,
-                        gender=None,
-                        age=None
-                    )
-                last_user_present_state = current_user_present
-            
             # Put results in queue for main thread with performance info
             result_data = {
                 'faces': faces,
+                'frame_seq': frame_seq,
+                'det_size': (frame.shape[1], frame.shape[0]),
                 'timestamp': timestamp,
                 'detection_time': detection_time,
                 'avg_detection_time': avg_detection_time
             }
             
             # Immediate greeting logic for faster response with proper gender detection
-            global is_greeted, GREET_GENDER_ENABLED
-            if faces and application_should_run and not is_greeted:
-                closest_face = max(faces, key=lambda f: (f.bbox[2] - f.bbox[0]) * (f.bbox[3] - f.bbox[1]))
+            if len(faces) and application_should_run and not is_greeted:
+                closest_face = faces[0]  # select_crowd_faces() orders largest first
                 
-                # Get gender and age from face detection with robust parsing
+                # Gender and age come straight from the face result (unknown until genderage has run)
                 if GREET_GENDER_ENABLED:
-                    gender = parse_gender(closest_face)
-                    age = getattr(closest_face, 'age', 25)
-                    
-                    # Debug detection results - ENHANCED DEBUGGING
+                    gender = gender_label(closest_face['gender'])
+                    age = face_age(closest_face) or 25
                     print(f"Detected: Gender={gender}, Age={age}")
-                    print(f"Raw face attributes: {[attr for attr in dir(closest_face) if not attr.startswith('_')]}")
-                    
-                    # Check specific gender attributes
-                    for attr in ['sex', 'gender', 'g']:
-                        if hasattr(closest_face, attr):
-                            raw_value = getattr(closest_face, attr)
-                            print(f"Found {attr} = {raw_value} (type: {type(raw_value)})")
                     
                     if gender == 'unknown':
                         print("WARNING: Gender detection failed - check InsightFace model loading")
@@ -705,8 +908,7 @@ def face_detection_worker():
                     print("Gender detection disabled - using neutral greeting")
                 
                 # Calculate distance for WebSocket
-                face_width = (closest_face.bbox[2] - closest_face.bbox[0])
-                distance = calculate_distance(face_width)
+                distance = float(face_distances(faces[:1])[0])
                 
                 # PARALLEL EXECUTION: Send WebSocket update immediately when user detected
                 update_user_presence(
@@ -737,21 +939,19 @@ def face_detection_worker():
                 
                 # Queue the greeting and mark as greeted
                 success = queue_speech(greeting_text, 'instant_greeting', priority=0)
+                greeting_queued = time.perf_counter()
+                metrics.record(STAGE_GREETING_DECISION, greeting_queued - results_ready)
                 if success:
                     is_greeted = True  # Mark as greeted to prevent duplicate greetings
+                    metrics.record(STAGE_CAPTURE_TO_GREETING, greeting_queued - frame_times['captured'])
+                    metrics.increment('greetings_queued')
             
-            try:
-                detection_result_queue.put_nowait(result_data)
-            except queue.Full:
-                # Remove old result and add new one
-                try:
-                    detection_result_queue.get_nowait()
-                    detection_result_queue.put_nowait(result_data)
-                except queue.Empty:
-                    pass
+            # Newest result wins; an unread older one is superseded
+            if detection_result_mailbox.put(result_data) is not None:
+                metrics.increment('results_dropped')
             
-            # Mark task as done
-            frame_queue.task_done()
+            # Hand the detector input buffer back to the camera loop
+            return_frame_buffer(frame)
             
             # Log performance periodically
             if len(detection_times) == detection_times.maxlen:
@@ -787,15 +987,22 @@ def frame_cleanup_worker():
 # Camera capture loop - OPTIMIZED FOR HIGH PERFORMANCE
 def face_detection_loop():
     global face_detected, is_greeted, latest_frame, latest_faces, detection_timestamp
-    absent = False
-    # Absence timer variables
-    absence_start = None
-    # Distance threshold timer
+    absent = True
     distance_threshold = 1.0  # meters
-    distance_far_start = None
+    
+    # Presence state machine: absence and too-far timers, transitions published to subscribers
+    presence = get_presence()
+    presence.absence_threshold = absence_threshold
+    presence.distance_threshold = distance_threshold
+    presence.subscribe(on_presence_transition)
+    if not presence.engaged:
+        USER_ABSENT.set()  # No transition is published for the initial ABSENT state
     
     # Get CPU optimizer for adaptive performance
     optimizer = get_optimizer()
+    metrics = get_vision_metrics()
+    system_sampler = get_system_sampler()
+    system_sampler.start()
     
     # Performance optimization variables - ADAPTIVE
     TARGET_FPS = 15  # Higher FPS for camera capture since detection is separate
@@ -826,47 +1033,38 @@ def face_detection_loop():
     camera_res = perf_settings['camera_resolution']
     FACE_DETECTION_INTERVAL = perf_settings['face_detection_interval']
     
-    # Camera retry loop
-    cap = None
-    working_cam_id = -1
-    camera_retry_interval = 20  # 20 seconds
-    last_camera_retry = 0
+    # Frame source (live camera by default, or recorded footage), usually opened by the startup 'camera' phase
+    source = open_camera_source()
+    if source is None:
+        stop_event.set()
+        return
+    # Recorded footage in fast pacing mode is consumed without wall-clock throttling
+    full_speed = source.full_speed
     
-    # Try to initialize camera with retry logic - only try indices 0 and 1
-    while cap is None:
-        current_time = time.time()
-        
-        # Only try camera indices 0 and 1
-        print("Trying camera indices 0 and 1...")
-        cap, working_cam_id = try_camera_indices()
-        
-        # If still no camera found, wait briefly and retry
-        if cap is None:
-            print(f"No working camera found (tried indices 0, 1). Retrying immediately...")
-            time.sleep(1)  # Brief 1-second delay to prevent excessive CPU usage
-            last_camera_retry = current_time
+    # Reduced-scale decode for the detection path; the GUI shows full-resolution frames
+    decode_scale = args.decode_scale if args.headless else 1
+    if decode_scale > 1:
+        if source.set_decode_scale(decode_scale):
+            print(f"Decoding frames at 1/{decode_scale} scale for detection")
         else:
-            print(f"Successfully connected to camera {working_cam_id}")
-            break
+            print(f"{source.describe()} does not support reduced-scale decode, using full resolution")
     
-    # Optimize camera settings with ADAPTIVE resolution
-    def setup_camera_properties(cap, camera_res, perf_settings):
-        """Setup camera properties for optimal performance"""
-        cap.set(cv2.CAP_PROP_FRAME_WIDTH, camera_res[0])  # Adaptive width
-        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, camera_res[1])  # Adaptive height
-        cap.set(cv2.CAP_PROP_FPS, perf_settings['face_detection_fps'])  # Adaptive FPS
-        cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)  # Minimize buffer to avoid lag
-        cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc('M', 'J', 'P', 'G'))  # Use MJPEG for better performance
-        cap.set(cv2.CAP_PROP_AUTOFOCUS, 0)  # Disable autofocus to save CPU
-        cap.set(cv2.CAP_PROP_AUTO_EXPOSURE, 0.25)  # Reduce auto-exposure processing
+    source.configure(camera_res, perf_settings['face_detection_fps'])
     
-    setup_camera_properties(cap, camera_res, perf_settings)
+    # Initialize detector input buffers for memory optimization
+    detector_preprocessor.set_det_size(perf_settings['detection_size'])
+    initialize_frame_buffers(*detector_preprocessor.det_size)
     
-    # Initialize frame buffers for memory optimization
-    initialize_frame_buffers(camera_res[0], camera_res[1])
+    # Cheap scene-change gate in front of the detector
+    motion_gate = MotionGate(safety_interval=MOTION_GATE_SAFETY_INTERVAL)
+    
+    # Deep idle: the camera is released while the application is disabled
+    deep_idle = get_deep_idle()
+    camera_released = False
+    resume_pending = False
     
     try:
-        while True:
+        while not stop_event.is_set():
             current_time = time.time()
             
             # Check if application should run
@@ -874,18 +1072,37 @@ def face_detection_loop():
                 face_detected = False
                 is_greeted = False
                 USER_ABSENT.set()
+                face_tracker.reset()
+                presence.reset()
+                if source.is_live and not camera_released:
+                    source.release()
+                    camera_released = True
+                    print("Camera released for deep idle")
+                resume_pending = True
                 if not args.headless:
-                    # Show disabled status
-                    ret, frame = cap.read()
-                    if ret:
-                        cv2.putText(frame, "APPLICATION DISABLED", (50, 50), cv2.FONT_HERSHEY_SIMPLEX, 1.0, (0, 0, 255), 2)
-                        cv2.putText(frame, "Task not executing", (50, 90), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255), 2)
-                        cv2.imshow("InsightFace", frame)
-                        if cv2.waitKey(1) & 0xFF == ord('q'):
-                            break
-                time.sleep(1)
+                    # Show disabled status without touching the camera
+                    frame = np.zeros((480, 640, 3), dtype=np.uint8)
+                    cv2.putText(frame, "APPLICATION DISABLED", (50, 50), cv2.FONT_HERSHEY_SIMPLEX, 1.0, (0, 0, 255), 2)
+                    cv2.putText(frame, "Task not executing", (50, 90), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255), 2)
+                    cv2.imshow("InsightFace", frame)
+                    if cv2.waitKey(1) & 0xFF == ord('q'):
+                        break
+                deep_idle.wait_enabled(1.0)
                 continue
             
+            if camera_released:
+                # Warm start: reopen the camera with the current level's settings
+                # (one attempt, so a later disable or shutdown is still seen while the camera is missing)
+                if not source.open(retry=False):
+                    time.sleep(1)
+                    continue
+                perf_settings = optimizer.get_performance_settings()
+                camera_res = perf_settings['camera_resolution']
+                source.configure(camera_res, perf_settings['face_detection_fps'])
+                apply_detection_size(perf_settings['detection_size'])
+                motion_gate.reset()
+                camera_released = False
+            
             # Update adaptive performance settings
             if current_time - last_perf_update > PERF_UPDATE_INTERVAL:
                 perf_settings = optimizer.get_performance_settings()
@@ -893,12 +1110,22 @@ def face_detection_loop():
                 frame_time = 1.0 / TARGET_FPS
                 FACE_DETECTION_INTERVAL = perf_settings['face_detection_interval']
                 FRAME_SKIP_WHEN_ABSENT = max(8, int(8 * perf_settings['sleep_multiplier']))
+                
+                # Apply level changes live: camera resolution and detector input size
+                if tuple(perf_settings['camera_resolution']) != tuple(camera_res):
+                    camera_res = perf_settings['camera_resolution']
+                    source.configure(camera_res, perf_settings['face_detection_fps'])
+                    motion_gate.reset()
+                    if source.is_live:
+                        print(f"Camera resolution changed to {camera_res[0]}x{camera_res[1]}")
+                if apply_detection_size(perf_settings['detection_size']):
+                    motion_gate.reset()
                 last_perf_update = current_time
             
             # Dynamic CPU monitoring and adaptive frame skipping
             if PSUTIL_AVAILABLE and current_time - last_cpu_check > CPU_CHECK_INTERVAL:
                 try:
-                    cpu_percent = psutil.cpu_percent(interval=0.05)  # Faster CPU check
+                    cpu_percent = system_sampler.snapshot()['cpu_percent']  # Published by the sampler thread, never blocks
                     if cpu_percent > cpu_high_threshold:  # High CPU usage
                         adaptive_frame_skip = min(adaptive_frame_skip + 2, 5)  # More aggressive skipping
                         print(f"High CPU detected ({cpu_percent:.1f}%), increasing frame skip to {adaptive_frame_skip}")
@@ -910,215 +1137,173 @@ def face_detection_loop():
                     adaptive_frame_skip = 0
             
             # Frame rate limiting with adaptive skipping - OPTIMIZED
-            if current_time - last_frame_time < frame_time:
+            if not full_speed and current_time - last_frame_time < frame_time:
                 sleep_time = 0.05 * perf_settings['sleep_multiplier']  # Adaptive sleep time
                 time.sleep(sleep_time)
                 continue
             last_frame_time = current_time
             
-            ret, frame = cap.read()
+            # Frame skipping while absent - the grabber thread keeps draining the camera,
+            # so skipped frames are never decoded
+            total_skip_frames = max(2, FRAME_SKIP_WHEN_ABSENT // 2) + adaptive_frame_skip  # Reduced skipping
+            if absent and not full_speed and skip_frame_count < total_skip_frames:
+                skip_frame_count += 1
+                source.skip()
+                metrics.increment('frames_skipped')
+                sleep_time = 0.05 * perf_settings['sleep_multiplier']  # Reduced sleep time for faster detection
+                time.sleep(sleep_time)
+                continue
+            skip_frame_count = 0
+            
+            capture_start = time.perf_counter()
+            ret, frame = source.read()
+            captured_at = time.perf_counter()
             if not ret:
+                if not source.is_live:
+                    print(f"End of frame source reached ({source.frame_index} frames)")
+                    # Let the detection worker finish the frames already queued
+                    drain_deadline = time.time() + 5.0
+                    while frame_mailbox.pending() and time.time() < drain_deadline:
+                        time.sleep(0.01)
+                    break
+                
                 print("Camera disconnected or failed to read frame")
-                cap.release()
                 
                 # Try to reconnect to camera immediately
-                print("Attempting to reconnect to camera...")
-                last_camera_retry = current_time
-                
-                # First try the working camera ID
-                if working_cam_id != -1:
-                    print(f"Trying to reconnect to camera {working_cam_id}...")
-                    cap = cv2.VideoCapture(working_cam_id)
-                    if cap.isOpened():
-                        ret, test_frame = cap.read()
-                        if ret:
-                            print(f"Successfully reconnected to camera {working_cam_id}")
-                            setup_camera_properties(cap, camera_res, perf_settings)
-                            continue
-                        else:
-                            print(f"Camera {working_cam_id} opened but can't read frames")
-                            cap.release()
-                
-                # If reconnection failed, try camera indices 0 and 1
-                print("Trying camera indices 0 and 1...")
-                cap, new_cam_id = try_camera_indices()
-                if cap is not None:
-                    print(f"Successfully switched to camera {new_cam_id}")
-                    working_cam_id = new_cam_id
-                    setup_camera_properties(cap, camera_res, perf_settings)
+                if source.reconnect():
+                    motion_gate.reset()
+                    face_tracker.reset()
                     continue
-                else:
-                    print("No working camera found (tried indices 0, 1)")
-                    cap = None
                 
                 # If no camera available, wait and continue
-                if cap is None:
-                    face_detected = False
-                    is_greeted = False
-                    USER_ABSENT.set()
-                    if not args.headless:
-                        # Create a black frame to show camera disconnected message
-                        frame = np.zeros((480, 640, 3), dtype=np.uint8)
-                        cv2.putText(frame, "CAMERA DISCONNECTED", (50, 240), cv2.FONT_HERSHEY_SIMPLEX, 1.0, (0, 0, 255), 2)
-                        cv2.putText(frame, "Retrying continuously...", (50, 280), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 255), 2)
-                        cv2.imshow("InsightFace", frame)
-                        if cv2.waitKey(1) & 0xFF == ord('q'):
-                            break
-                    time.sleep(1)
-                    continue
-                else:
-                    time.sleep(1)
-                    continue
-                
-            # Enhanced frame skipping logic - OPTIMIZED FOR FAST USER DETECTION
-            # Reduce frame skipping when absent to detect new users faster
-            total_skip_frames = max(2, FRAME_SKIP_WHEN_ABSENT // 2) + adaptive_frame_skip  # Reduced skipping
-            if absent and skip_frame_count < total_skip_frames:
-                skip_frame_count += 1
-                sleep_time = 0.05 * perf_settings['sleep_multiplier']  # Reduced sleep time for faster detection
-                time.sleep(sleep_time)
+                face_detected = False
+                is_greeted = False
+                USER_ABSENT.set()
+                if not args.headless:
+                    # Create a black frame to show camera disconnected message
+                    frame = np.zeros((480, 640, 3), dtype=np.uint8)
+                    cv2.putText(frame, "CAMERA DISCONNECTED", (50, 240), cv2.FONT_HERSHEY_SIMPLEX, 1.0, (0, 0, 255), 2)
+                    cv2.putText(frame, "Retrying continuously...", (50, 280), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 255), 2)
+                    cv2.imshow("InsightFace", frame)
+                    if cv2.waitKey(1) & 0xFF == ord('q'):
+                        break
+                time.sleep(1)
                 continue
-            skip_frame_count = 0
+                
+            metrics.record(STAGE_CAPTURE, captured_at - capture_start)
+            if resume_pending:
+                resume_pending = False
+                deep_idle.component_ready('camera')
+            if source.last_grab_time is not None:
+                metrics.record(STAGE_CAPTURE_TO_USE, captured_at - source.last_grab_time)
+            metrics.increment('frames_captured')
             
             # Store latest frame for display (avoid unnecessary copying)
             with frame_lock:
                 latest_frame = frame  # Use reference instead of copy for better performance
             
-            # Intelligent detection intervals based on face tracking
-            global face_tracking_data
+            # Single preprocessing pass: raw frame -> letterboxed detector input in a pooled buffer.
+            # Frames may be decoded at reduced scale; distances are computed against the camera resolution.
+            # The tracker runs on a grayscale copy of it, so tracks live in detector coordinates.
+            preprocess_start = time.perf_counter()
+            detector_preprocessor.input_scale = 1.0 / source.decode_scale
+            detection_frame = detector_preprocessor.prepare(frame, get_frame_buffer())
+            tracking_gray = detector_preprocessor.to_gray(detection_frame)
+            metrics.record(STAGE_PREPROCESS, time.perf_counter() - preprocess_start)
+            
+            # Propagate tracked faces to this frame with optical flow
+            face_tracker.propagate(tracking_gray, current_time)
+            tracking_mode = face_tracker.is_stable()
+            
+            # Gender/age is computed once per track, only for the closest face
+            closest_track = face_tracker.largest_track()
+            needs_attributes = GREET_GENDER_ENABLED and closest_track is not None and not closest_track.has_attributes
             
             # Determine detection interval based on tracking state
-            if face_tracking_data['tracking_mode'] and not absent:
-                # When tracking a stable face, reduce detection frequency dramatically
+            if tracking_mode and not absent and not needs_attributes:
+                # The tracker follows stable faces every frame; the detector only re-anchors it
                 adaptive_interval = DETECTION_SEND_INTERVAL * 8  # Much slower for stable faces (4 seconds)
-            elif absent:
-                adaptive_interval = 0.2  # Fast when absent to catch new users
+            elif absent or face_tracker.redetect_requested:
+                adaptive_interval = 0.2  # Fast when absent to catch new users, or when a track missed / lost the flow
             else:
                 adaptive_interval = DETECTION_SEND_INTERVAL  # Normal interval
             
             # Send frame to face detection worker at controlled intervals
-            if current_time - last_detection_send >= adaptive_interval:
-                # Prepare frame for detection (resize for speed, rotate only if enabled)
-                if ENABLE_FRAME_ROTATION:
-                    detection_frame = cv2.rotate(frame, cv2.ROTATE_90_COUNTERCLOCKWISE)
-                else:
-                    detection_frame = frame  # Use frame as-is for better performance
-                
-                # Resize frame for faster detection (half size = 4x faster processing)
-                height, width = detection_frame.shape[:2]
-                fast_frame = cv2.resize(detection_frame, (width//2, height//2), interpolation=cv2.INTER_LINEAR)
+            # (every frame when replaying footage at full speed)
+            detection_due = full_speed or current_time - last_detection_send >= adaptive_interval
+            
+            # While nobody is in view, only run detection when the scene actually changes
+            if detection_due and ENABLE_MOTION_GATE and not motion_gate.should_detect(detector_preprocessor.roi_view(frame), current_time, faces_present=face_detected):
+                detection_due = False
+                metrics.increment('motion_gate_skipped')
+            
+            if detection_due:
+                frame_times = {'captured': captured_at, 'enqueued': time.perf_counter()}
+                attribute_box = closest_track.bbox.copy() if needs_attributes else None
                 
-                # Send frame to detection worker (non-blocking)
-                try:
-                    frame_queue.put_nowait((fast_frame, current_time))
-                    last_detection_send = current_time
-                except queue.Full:
-                    # Queue is full, skip this frame
-                    pass
+                # Hand the frame to the detection worker, replacing any frame it has not picked up yet
+                # (waits for the worker at full speed so no replayed frame is dropped)
+                replaced = frame_mailbox.put((detection_frame, current_time, frame_times, attribute_box),
+                                             block=full_speed, timeout=1.0)
+                last_detection_send = current_time
+                if replaced is not None:
+                    metrics.increment('frames_dropped')
+                    return_frame_buffer(replaced[0])
+            else:
+                return_frame_buffer(detection_frame)
             
-            # Get latest detection results (non-blocking)
-            faces = []
+            # Re-anchor the tracker with the latest detection result (non-blocking)
             try:
-                while True:  # Get the most recent result
-                    result_data = detection_result_queue.get_nowait()
-                    faces = result_data['faces']
-                    # Optional: print detection performance
-                    # print(f"Detection time: {result_data['detection_time']:.3f}s")
+                result_seq, result_data = detection_result_mailbox.get_nowait()
+                # Results for frames prepared before a detector input size switch are in stale coordinates
+                if result_data['det_size'] == tuple(detector_preprocessor.input_size):
+                    face_tracker.update(result_data['faces'], result_data['timestamp'], tracking_gray)
+                # Optional: print detection performance
+                # print(f"Detection time: {result_data['detection_time']:.3f}s")
             except queue.Empty:
-                # Use cached faces from global variable
-                with frame_lock:
-                    faces = latest_faces.copy()
+                pass
             
-            face_detected = bool(faces)
+            # Tracked faces for this frame, largest first
+            faces = face_tracker.results()
+            face_detected = len(faces) > 0
             distance_too_far = False
             closest_face_distance = float('inf')
             closest_face_gender = None
-            
-            # Face tracking and stability analysis
-            if face_detected and faces:
-                largest_face = max(faces, key=lambda f: (f.bbox[2] - f.bbox[0]) * (f.bbox[3] - f.bbox[1]))
-                face_center = ((largest_face.bbox[0] + largest_face.bbox[2]) // 2, 
-                              (largest_face.bbox[1] + largest_face.bbox[3]) // 2)
-                
-                if face_tracking_data['last_position'] is not None:
-                    # Calculate movement distance
-                    movement = np.sqrt((face_center[0] - face_tracking_data['last_position'][0])**2 + 
-                                     (face_center[1] - face_tracking_data['last_position'][1])**2)
-                    
-                    if movement < 50:  # Face is stable (increased threshold for easier tracking)
-                        face_tracking_data['stability_count'] += 1
-                        if face_tracking_data['stability_count'] > 2:  # Stable for just 2+ frames (faster tracking)
-                            face_tracking_data['tracking_mode'] = True
-                    else:  # Face moved significantly
-                        face_tracking_data['stability_count'] = 0
-                        face_tracking_data['tracking_mode'] = False
-                
-                face_tracking_data['last_position'] = face_center
-                face_tracking_data['last_detection_time'] = current_time
-            else:
-                # No face detected, reset tracking
-                face_tracking_data['tracking_mode'] = False
-                face_tracking_data['stability_count'] = 0
-                if current_time - face_tracking_data['last_detection_time'] > 2.0:
-                    face_tracking_data['last_position'] = None
 
-            # Absence detection logic
             if face_detected:
-                absence_start = None
-                absent = False
+                # Distances in meters for every face at once
+                distances = face_distances(faces)
+                closest_index = int(np.argmin(distances))
+                closest_face_distance = float(distances[closest_index])
+                closest_face = faces[closest_index]
+                closest_face_gender = gender_label(closest_face['gender'])  # Cached per track
+                distance_too_far = bool(np.any(distances > distance_threshold))
                 
                 # Update WebSocket with user presence (ongoing updates, less frequent than initial detection)
                 # This provides continuous updates for existing users
-                closest_face_for_ws = None
-                if faces:
-                    closest_face_for_ws = max(faces, key=lambda f: (f.bbox[2] - f.bbox[0]) * (f.bbox[3] - f.bbox[1]))
                 
                 # Only send updates every few seconds to avoid spam (initial detection handles immediate updates)
                 global last_ws_update_time
                 
-                if current_time - last_ws_update_time >= 2.0:  # Update every 2 seconds
+                if current_time - last_ws_update_time >= 2.0 * optimizer.get_throttle('websocket'):  # Update every 2 seconds (longer while throttled)
                     update_user_presence(
                         user_present=True,
                         user_count=len(faces),
                         distance=closest_face_distance if closest_face_distance != float('inf') else None,
-                        gender=parse_gender(closest_face_for_ws) if closest_face_for_ws else None,
-                        age=getattr(closest_face_for_ws, 'age', None) if closest_face_for_ws else None
+                        gender=closest_face_gender if closest_face_gender != 'unknown' else None,
+                        age=face_age(closest_face)
                     )
                     last_ws_update_time = current_time
                 
-                # Process each detected face
-                for face in faces:
-                    x1, y1, x2, y2 = map(int, face.bbox)
-                    face_width = x2 - x1
-                    
-                    # Calculate distance in meters
-                    distance = calculate_distance(face_width)
-                    
-                    # Track closest face for greeting
-                    if distance < closest_face_distance:
-                        closest_face_distance = distance
-                        # Use robust gender parsing
-                        closest_face_gender = parse_gender(face)
-                    
-                    # Check if distance is too far
-                    if distance > distance_threshold:
-                        distance_too_far = True
-                        if distance_far_start is None:
-                            distance_far_start = current_time
-                        else:
-                            elapsed = current_time - distance_far_start
-                            if elapsed >= absence_threshold:
-                                absent = True
-                            remaining = max(0, absence_threshold - int(elapsed))
-                            far_text = f"Too far: {remaining}s"
-                            cv2.putText(frame, far_text, (20, 120), cv2.FONT_HERSHEY_SIMPLEX, 1.0, (0, 255, 255), 2)
-                    else:
-                        distance_far_start = None
+                # Process each tracked face (at most CROWD_MAX_FACES plus tracks about to expire)
+                display_boxes = detector_preprocessor.boxes_to_source(faces['bbox'])
+                for face, display_box, distance in zip(faces, display_boxes, distances):
+                    x1, y1, x2, y2 = map(int, display_box)
                     
                     # Batch drawing operations for better performance
                     face_info = {
                         'bbox': (x1, y1, x2, y2),
-                        'label': f"{face.sex}:{face.age}",
+                        'label': f"#{face['track_id']} {gender_label(face['gender'])}:{face['age']}" if face_age(face) is not None else f"#{face['track_id']}",
                         'distance': f"Distance: {distance:.2f}m"
                     }
                     
@@ -1142,43 +1327,23 @@ def face_detection_loop():
                 global last_frame_save_time
                 if (application_should_run and not distance_too_far and 
                     current_time - last_frame_save_time >= FRAME_SAVE_INTERVAL):
-                    save_frame_with_user(frame, faces)
+                    save_frame_with_user(source.full_frame(), faces)  # Full-resolution decode only here
                     last_frame_save_time = current_time
-                
-                # If all faces are not too far, reset the timer
-                if not distance_too_far:
-                    distance_far_start = None
-            else:
-                if absence_start is None:
-                    absence_start = current_time
-                else:
-                    elapsed = current_time - absence_start
-                    if elapsed >= absence_threshold:
-                        absent = True
-                    remaining = max(0, absence_threshold - int(elapsed))
-                    timer_text = f"User away: {remaining}s"
-                    cv2.putText(frame, timer_text, (20, 40), cv2.FONT_HERSHEY_SIMPLEX, 1.0, (0, 0, 255), 2)
-
-            if absent:
+            
+            # Presence transitions (USER_ABSENT, greeting re-arm, WebSocket) are handled by the subscribers
+            presence.update(len(faces), closest_face_distance if len(faces) else None, current_time)
+            absent = not presence.engaged
+            remaining = presence.seconds_remaining(current_time)
+            if presence.state == PRESENCE_TOO_FAR:
+                cv2.putText(frame, f"Too far: {int(remaining)}s", (20, 120), cv2.FONT_HERSHEY_SIMPLEX, 1.0, (0, 255, 255), 2)
+            elif presence.state == PRESENCE_LEAVING:
+                cv2.putText(frame, f"User away: {int(remaining)}s", (20, 40), cv2.FONT_HERSHEY_SIMPLEX, 1.0, (0, 0, 255), 2)
+            elif absent:
                 cv2.putText(frame, "User not exist", (20, 80), cv2.FONT_HERSHEY_SIMPLEX, 1.0, (0, 0, 255), 2)
-                is_greeted = False
-                face_detected = False
                 if distance_too_far:
                     cv2.putText(frame, "User too far", (20, 160), cv2.FONT_HERSHEY_SIMPLEX, 1.0, (0, 255, 255), 2)
-                # Set the USER_ABSENT event when user is absent or too far
-                USER_ABSENT.set()
-                
-                # Update WebSocket with user absence
-                update_user_presence(
-                    user_present=False,
-                    user_count=0,
-                    distance=None,
-                    gender=None,
-                    age=None
-                )
-            else:
-                # Clear the USER_ABSENT event when user is present and not too far
-                USER_ABSENT.clear()
+                if presence.state == PRESENCE_ABSENT:
+                    face_detected = False
 
             # FPS monitoring
             global fps_counter, fps_start_time, current_fps
@@ -1186,20 +1351,39 @@ def face_detection_loop():
             if current_time - fps_start_time >= 5.0:  # Update FPS every 5 seconds
                 current_fps = fps_counter / (current_time - fps_start_time)
                 print(f"Camera FPS: {current_fps:.1f}")
+                capture_stats = source.get_stats()
+                if capture_stats:
+                    print(f"Camera grabbed {capture_stats['grab_fps']:.1f} FPS, decoded {capture_stats['delivered_fps']:.1f} FPS")
+                mailbox_stats = frame_mailbox.get_stats()
+                print(f"Detection frames: {mailbox_stats['delivered']} delivered, {mailbox_stats['dropped']} dropped as stale")
+                faces_dropped = metrics.get_counter('faces_dropped')
+                if faces_dropped:
+                    print(f"Crowd mode: {faces_dropped} faces beyond the closest {CROWD_MAX_FACES} ignored so far")
+                if ENABLE_MOTION_GATE:
+                    gate_stats = motion_gate.get_stats()
+                    print(f"Motion gate: skipped {gate_stats['frames_skipped']}/{gate_stats['frames_checked']} detections ({gate_stats['skip_ratio']:.0%})")
                 fps_counter = 0
                 fps_start_time = current_time
             
             if not args.headless:
                 # Add performance info to frame
-                cv2.putText(frame, f"Camera: {working_cam_id}", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 1)
+                cv2.putText(frame, source.describe(), (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 1)
                 cv2.putText(frame, f"FPS: {current_fps:.1f}", (10, 55), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 1)
                 cv2.putText(frame, f"Faces: {len(faces)}", (10, 80), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 1)
-                tracking_status = "TRACKING" if face_tracking_data['tracking_mode'] else "DETECTING"
+                tracking_status = "TRACKING" if tracking_mode else "DETECTING"
                 cv2.putText(frame, f"Mode: {tracking_status}", (10, 105), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 0), 1)
+                if detector_preprocessor.roi is not None:
+                    # Service zone outline (detection ignores everything outside it)
+                    roi = detector_preprocessor.roi
+                    frame_h, frame_w = frame.shape[:2]
+                    x1, y1, x2, y2 = roi['rect']
+                    points = roi['polygon'] or ((x1, y1), (x2, y1), (x2, y2), (x1, y2))
+                    outline = np.array([(x * frame_w, y * frame_h) for x, y in points], dtype=np.int32)
+                    cv2.polylines(frame, [outline], True, (0, 255, 255), 1)
                 cv2.imshow("InsightFace", frame)
                 if cv2.waitKey(1) & 0xFF == ord('q'):
                     break
-            else:
+            elif not full_speed:
                 # Minimal sleep in headless mode - optimized for fast detection
                 if absent:
                     # When user absent, very minimal sleep to detect new users quickly
@@ -1211,7 +1395,7 @@ def face_detection_loop():
 
     finally:
         stop_event.set()
-        cap.release()
+        source.release()
         if not args.headless:
             cv2.destroyAllWindows()
 
@@ -1235,122 +1419,144 @@ if __name__ == "__main__":
     # from aiUnderstandPrompt import PromptUnderstand
     from listener import set_application_state_reference
     
-    # Initialize CPU optimizations
-    print("Initializing CPU optimizations...")
-    optimize_process_priority()
-    enable_cpu_affinity_optimization()
-    
-    # Start CPU monitoring
-    cpu_optimizer = get_optimizer()
-    cpu_optimizer.start_monitoring()
+    # Cold boot: the slow steps run concurrently as startup phases, each after the phases it needs.
+    # The machine config is fetched in this thread meanwhile; threads that need the detector or the
+    # camera wait for their phase instead of loading / opening them again.
+    startup = get_startup()
+    setup_detection_process()  # Optional out-of-process detector, before the camera loop allocates frame buffers
+    startup.add_phase('cpu', init_cpu_optimizations)
+    startup.add_phase('websocket', lambda: init_websocket_server(host='0.0.0.0', port=8765))
+    startup.add_phase('tts_key', init_dashscope_api_key)
+    startup.add_phase('models', start_face_detector, after=('cpu',))  # ORT sessions pick up the core plan
+    startup.add_phase('camera', open_camera_source)
+    # PortAudio init/terminate is not thread-safe: one probe after the other, mic_listen after both
+    startup.add_phase('tts_probe', lambda: probe_component('tts', check_tts_ready), after=('tts_key',))
+    startup.add_phase('asr_probe', lambda: probe_component('asr', check_asr_ready), after=('tts_probe',))
+    startup.start()
     
-    # Initialize WebSocket server
-    print("Initializing WebSocket server...")
-    websocket_server = init_websocket_server(host='0.0.0.0', port=8765)
-    
-    # Initialize TTS
-    print("Initializing TTS API...")
-    init_dashscope_api_key()    
-
-    print("Fetching product data from API...")
-    try:
-        api_result = fetch_product_by_name(args.machineid)
-        if 'error' in api_result:
-            print(f"API Error: {api_result['error']}")
+    with startup.phase('config'):
+        print("Fetching product data from API...")
+        try:
+            api_result = fetch_product_by_name(args.machineid)
+            if 'error' in api_result:
+                print(f"API Error: {api_result['error']}")
+                print("Using fallback configuration...")
+                result = None
+            else:
+                result = api_result['data']
+                print("Product data loaded successfully.")
+        except Exception as e:
+            print(f"Failed to fetch API data: {e}")
             print("Using fallback configuration...")
             result = None
+        # print(f"RES:::: {result}")
+        # sys.exit(0)
+        # Initialize configuration with defaults from chat.py
+        print("Initializing configuration with defaults and API data...")
+        
+        # Use default values as fallback, override with API data if available
+        products = result.get("products") if result else default.get("products", ["盲盒"])
+        prompt = result.get("prompt") if result else default.get("prompt", "你是一个友好的咖啡店助手。")
+        GREETINGs = result.get("greetings") if result else default.get("greetings", ["欢迎光临", "您好", "欢迎"])
+        AUTO_SUGGESTIONS = result.get("suggestions") if result else default.get("suggestions", ["需要推荐吗?", "要试试我们的招牌饮品吗?", "有什么可以帮您的?"])
+        NO_PERSON_AUTO_SUGGESTIONS = result.get("noPersonSuggestions") if result else default.get("noPersonSuggestions", ["欢迎光临", "需要帮助请随时呼唤我", "今日特色等您品尝"])
+        busy_speak = result.get("busySpeak") if result else default.get("busySpeak", ["在充电。"])
+        busy_speak_time = result.get("busySpeakTime", 180) if result else default.get("busySpeakTime", "180")
+        
+        # Initialize gender detection setting
+        GREET_GENDER_ENABLED = result.get("isGreetGender") if result else default.get("isGreetGender", False)
+        
+        # Detection service zone for this machine (--roi takes precedence)
+        if not args.roi:
+            apply_detection_roi(result.get("detectionRoi") if result else default.get("detectionRoi"), "machine config")
+        
+        # Ensure busy_speak_time is integer
+        if isinstance(busy_speak_time, str):
+            busy_speak_time = int(busy_speak_time)
+        
+        # Build system prompt
+        if products:
+            prompt += ".你可以推荐以下饮品：\n" + ",".join(products)    
+            NO_RESPONSE_NEEDED_RULE = "。\n重要过滤指令: 如果对话不是关于'"  + ",".join(products)+ "' "+  NO_RESPONSE_NEEDED_RULE
+            prompt += NO_RESPONSE_NEEDED_RULE
+        
+        SYSTEM_PROMPT = prompt
+        
+        # Print configuration source
+        if result:
+            print("Using API configuration with defaults as fallback")
         else:
-            result = api_result['data']
-            print("Product data loaded successfully.")
-    except Exception as e:
-        print(f"Failed to fetch API data: {e}")
-        print("Using fallback configuration...")
-        result = None
-    # print(f"RES:::: {result}")
-    # sys.exit(0)
-    # Initialize configuration with defaults from chat.py
-    print("Initializing configuration with defaults and API data...")
-    
-    # Use default values as fallback, override with API data if available
-    products = result.get("products") if result else default.get("products", ["盲盒"])
-    prompt = result.get("prompt") if result else default.get("prompt", "你是一个友好的咖啡店助手。")
-    GREETINGs = result.get("greetings") if result else default.get("greetings", ["欢迎光临", "您好", "欢迎"])
-    AUTO_SUGGESTIONS = result.get("suggestions") if result else default.get("suggestions", ["需要推荐吗?", "要试试我们的招牌饮品吗?", "有什么可以帮您的?"])
-    NO_PERSON_AUTO_SUGGESTIONS = result.get("noPersonSuggestions") if result else default.get("noPersonSuggestions", ["欢迎光临", "需要帮助请随时呼唤我", "今日特色等您品尝"])
-    busy_speak = result.get("busySpeak") if result else default.get("busySpeak", ["在充电。"])
-    busy_speak_time = result.get("busySpeakTime", 180) if result else default.get("busySpeakTime", "180")
-    
-    # Initialize gender detection setting
-    GREET_GENDER_ENABLED = result.get("isGreetGender") if result else default.get("isGreetGender", False)
-    
-    # Ensure busy_speak_time is integer
-    if isinstance(busy_speak_time, str):
-        busy_speak_time = int(busy_speak_time)
-    
-    # Build system prompt
-    if products:
-        prompt += ".你可以推荐以下饮品：\n" + ",".join(products)    
-        NO_RESPONSE_NEEDED_RULE = "。\n重要过滤指令: 如果对话不是关于'"  + ",".join(products)+ "' "+  NO_RESPONSE_NEEDED_RULE
-        prompt += NO_RESPONSE_NEEDED_RULE
-    
-    SYSTEM_PROMPT = prompt
-    
-    # Print configuration source
-    if result:
-        print("Using API configuration with defaults as fallback")
-    else:
-        print("Using default configuration from chat.py")
-    
-    print(f"Products: {products}")
-    print(f"Greetings: {len(GREETINGs)} items")
-    print(f"Suggestions: {len(AUTO_SUGGESTIONS)} items")
-    print(f"No-person suggestions: {len(NO_PERSON_AUTO_SUGGESTIONS)} items")
-    print(f"Busy speak: {len(busy_speak)} items")
-    print(f"Busy speak time: {busy_speak_time}s")
-    print(f"Gender detection: {'enabled' if GREET_GENDER_ENABLED else 'disabled'}")
-    
-    # Initialize deck shuffling for all components
-    initialize_suggestion_decks()
-    initialize_greeting_deck()
-    initialize_busy_speak_deck(busy_speak)
-    
-    # Initialize task monitoring
-    print("Initializing task monitoring...")
-    task_monitor = TaskMonitor(machine_id=args.machineid)
-    task_monitor.set_application_callbacks(on_application_start, on_application_stop)
-    
-    # Set application state reference for listener
-    set_application_state_reference(lambda: application_should_run)
-    
-    # Setup frame saving
-    setup_frame_save_directory()
+            print("Using default configuration from chat.py")
+        
+        print(f"Products: {products}")
+        print(f"Greetings: {len(GREETINGs)} items")
+        print(f"Suggestions: {len(AUTO_SUGGESTIONS)} items")
+        print(f"No-person suggestions: {len(NO_PERSON_AUTO_SUGGESTIONS)} items")
+        print(f"Busy speak: {len(busy_speak)} items")
+        print(f"Busy speak time: {busy_speak_time}s")
+        print(f"Gender detection: {'enabled' if GREET_GENDER_ENABLED else 'disabled'}")
+        
+        # Initialize deck shuffling for all components
+        initialize_suggestion_decks()
+        initialize_greeting_deck()
+        initialize_busy_speak_deck(busy_speak)
     
-    # Start task monitoring
-    task_monitor.start_monitoring()
+    with startup.phase('task_monitor'):
+        # Initialize task monitoring
+        print("Initializing task monitoring...")
+        get_deep_idle().unload_models = args.idle_unload_models
+        get_deep_idle().resume_target = args.resume_target
+        task_monitor = TaskMonitor(machine_id=args.machineid)
+        task_monitor.set_application_callbacks(on_application_start, on_application_stop)
+        
+        # Set application state reference for listener
+        set_application_state_reference(lambda: application_should_run)
+        
+        # Setup frame saving
+        setup_frame_save_directory()
+        
+        # Start task monitoring
+        task_monitor.start_monitoring()
     
     print("Starting application threads...")
     
     # Start speech worker pool (2 workers for parallel speech processing)
     for i in range(2):
-        worker_thread = threading.Thread(target=speech_worker, args=(i,), daemon=True)
+        worker_thread = threading.Thread(target=speech_worker, args=(i,), name=f"speech-worker-{i}", daemon=True)
         worker_thread.start()
         speech_worker_pool.append(worker_thread)
     
-    threading.Thread(target=face_detection_worker, daemon=True).start()  # Start face detection worker
-    threading.Thread(target=face_detection_loop, daemon=True).start()    # Start camera capture loop
-    threading.Thread(target=frame_cleanup_worker, daemon=True).start()   # Start frame cleanup worker
-    threading.Thread(target=LLM_Speak, args=(SYSTEM_PROMPT,), daemon=True).start()
-    threading.Thread(target=suggest_loop, daemon=True).start()
-    threading.Thread(target=auto_speak_loop, daemon=True).start()
-    threading.Thread(target=listen_status_monitor, daemon=True).start()
-    threading.Thread(target=charging_announcement_loop, args=(int(busy_speak_time),busy_speak,), daemon=True).start()  # Start charging announcement thread
-    threading.Thread(target=mic_listen, daemon=True).start()
+    # Thread names map CPU time to subsystems (system_metrics.SUBSYSTEM_THREAD_PREFIXES)
+    threading.Thread(target=face_detection_worker, name="face-detection-worker", daemon=True).start()  # Start face detection worker
+    threading.Thread(target=face_detection_loop, name="camera-loop", daemon=True).start()    # Start camera capture loop
+    threading.Thread(target=frame_cleanup_worker, name="frame-cleanup", daemon=True).start()   # Start frame cleanup worker
+    threading.Thread(target=LLM_Speak, args=(SYSTEM_PROMPT,), name="llm-speak", daemon=True).start()
+    threading.Thread(target=suggest_loop, name="suggestions", daemon=True).start()
+    threading.Thread(target=auto_speak_loop, name="auto-speak", daemon=True).start()
+    threading.Thread(target=listen_status_monitor, name="listen-status", daemon=True).start()
+    threading.Thread(target=charging_announcement_loop, args=(int(busy_speak_time),busy_speak,), name="charging-announcement", daemon=True).start()  # Start charging announcement thread
+    startup.wait(('asr_probe',))
+    threading.Thread(target=mic_listen, name="mic-listen", daemon=True).start()
+    startup.wait(('cpu',))
+    get_affinity_planner().apply()  # Pin the threads just started; the CPU optimizer picks up later ones
     # threading.Thread(target=get_user_input, daemon=True).start()
     
-    print("Application started successfully!")
-    
-    # Prevent main thread from exiting
     try:
+        # Only announce once vision, TTS and ASR have each reported in
+        readiness = get_readiness()
+        while not readiness.wait(timeout=10.0) and not stop_event.is_set():
+            print(f"Waiting for {', '.join(readiness.pending())} to become ready...")
+        unavailable = readiness.failed()
+        if unavailable:
+            print("Application started with unavailable components: " +
+                  ", ".join(f"{name} ({error})" for name, error in unavailable.items()))
+        else:
+            print(f"Application started successfully! (ready in {time.time() - readiness.started:.1f}s)")
+        ready_seconds = time.time() - startup.started
+        startup.wait(timeout=STARTUP_REPORT_TIMEOUT)  # A phase stuck on a missing device is reported as still running
+        startup.report(ready_seconds)
+        
+        # Prevent main thread from exiting
         while not stop_event.is_set():
             time.sleep(1)
     finally:
@@ -1358,11 +1564,10 @@ if __name__ == "__main__":
         if task_monitor:
             task_monitor.stop_monitoring()
         
-        # Cleanup frame queues
-        try:
-            frame_queue.put_nowait(None)  # Signal face detection worker to stop
-        except queue.Full:
-            pass
+        # Signal face detection worker to stop
+        frame_mailbox.close()
+        if detection_process is not None:
+            detection_process.stop()
         
         # Cleanup speech workers
         for _ in speech_worker_pool:
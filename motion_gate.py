@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Motion Gate for AI Kiosk Application
+Cheap scene-change detector that sits in front of the face detector so
+InsightFace only runs when something in front of the kiosk moves.
+"""
+
+import time
+from typing import Optional
+
+import cv2
+import numpy as np
+
+
+class MotionGate:
+    """
+    Running-average background model on a tiny grayscale copy of the frame.
+
+    Each frame is downscaled to `analysis_width` pixels wide, blurred and
+    compared against an exponentially weighted background. The scene counts
+    as changed when more than `motion_fraction` of the pixels differ from the
+    background by more than `pixel_threshold`. A detection is also let
+    through every `safety_interval` seconds so a perfectly still visitor
+    (or a missed change) is still picked up.
+    """
+
+    def __init__(self,
+                 analysis_width: int = 80,
+                 pixel_threshold: int = 25,
+                 motion_fraction: float = 0.01,
+                 learning_rate: float = 0.05,
+                 safety_interval: float = 5.0):
+        self.analysis_width = analysis_width
+        self.pixel_threshold = pixel_threshold
+        self.motion_fraction = motion_fraction
+        self.learning_rate = learning_rate
+        self.safety_interval = safety_interval
+
+        self.background: Optional[np.ndarray] = None
+        self.last_pass_time = 0.0
+        self.last_motion_score = 0.0
+
+        # Statistics
+        self.frames_checked = 0
+        self.frames_passed = 0
+        self.frames_skipped = 0
+
+    def reset(self):
+        """Forget the background (e.g. after a camera reconnect)."""
+        self.background = None
+        self.last_pass_time = 0.0
+
+    def _small_gray(self, frame) -> np.ndarray:
+        height, width = frame.shape[:2]
+        scale = self.analysis_width / float(width)
+        small = cv2.resize(frame, (self.analysis_width, max(1, int(height * scale))), interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(small, (5, 5), 0)
+
+    def update(self, frame) -> float:
+        """Feed a frame into the background model and return the changed-pixel fraction."""
+        gray = self._small_gray(frame)
+        if self.background is None or self.background.shape != gray.shape:
+            self.background = gray.astype(np.float32)
+            self.last_motion_score = 1.0  # First frame always counts as a change
+            return self.last_motion_score
+
+        diff = cv2.absdiff(gray, cv2.convertScaleAbs(self.background))
+        changed = np.count_nonzero(diff > self.pixel_threshold)
+        self.last_motion_score = changed / float(diff.size)
+        cv2.accumulateWeighted(gray, self.background, self.learning_rate)
+        return self.last_motion_score
+
+    def should_detect(self, frame, current_time: Optional[float] = None, faces_present: bool = False) -> bool:
+        """
+        Decide whether this frame should go to the face detector.
+        Always True while faces are present so presence tracking stays exact.
+        """
+        if current_time is None:
+            current_time = time.time()
+
+        self.frames_checked += 1
+        score = self.update(frame)
+
+        if (faces_present
+                or score >= self.motion_fraction
+                or current_time - self.last_pass_time >= self.safety_interval):
+            self.last_pass_time = current_time
+            self.frames_passed += 1
+            return True
+
+        self.frames_skipped += 1
+        return False
+
+    def get_stats(self):
+        """Get gate statistics."""
+        return {
+            'frames_checked': self.frames_checked,
+            'frames_passed': self.frames_passed,
+            'frames_skipped': self.frames_skipped,
+            'skip_ratio': self.frames_skipped / self.frames_checked if self.frames_checked else 0.0,
+            'last_motion_score': self.last_motion_score
+        }
@@ -0,0 +1,382 @@
+#!/usr/bin/env python3
+"""
+ONNX Runtime Session Configuration for AI Kiosk Application
+Builds the InsightFace models with explicit ONNX Runtime session options
+(thread counts, execution mode, graph optimization level, memory arena)
+taken from a per-device profile, normally written by
+benchmarks/tune_ort_session.py, and caches the optimized graphs on disk so
+later starts skip graph optimization. The profile can also swap in
+replacement models per task, such as the INT8 detector written by
+benchmarks/quantize_detector.py.
+"""
+
+import glob
+import hashlib
+import json
+import os
+import os.path as osp
+import platform
+import time
+from typing import Any, Dict, Optional
+
+import onnxruntime
+from insightface.app.common import Face
+from insightface.model_zoo.model_zoo import ModelRouter
+from insightface.utils import ensure_available
+
+from core_affinity import get_affinity_planner
+
+try:
+    import psutil
+    PSUTIL_AVAILABLE = True
+except ImportError:
+    PSUTIL_AVAILABLE = False
+
+# Profile loaded by the face detection worker at startup
+ORT_PROFILE_PATH = "ort_profile.json"
+
+# Optimized graphs, keyed by model hash, ONNX Runtime version, optimization level and CPU architecture
+ORT_CACHE_DIR = os.path.join("~", ".insightface", "ort_cache")
+
+DEFAULT_SESSION_PROFILE = {
+    'intra_op_num_threads': 0,          # 0 = one thread per core this process may run on (per vision core with an affinity plan)
+    'inter_op_num_threads': 1,          # Only used with the parallel execution mode
+    'execution_mode': 'sequential',     # sequential | parallel
+    'graph_optimization_level': 'all',  # disable | basic | extended | all
+    'enable_cpu_mem_arena': True,
+    'enable_mem_pattern': True,
+}
+
+EXECUTION_MODES = {
+    'sequential': onnxruntime.ExecutionMode.ORT_SEQUENTIAL,
+    'parallel': onnxruntime.ExecutionMode.ORT_PARALLEL,
+}
+
+GRAPH_OPTIMIZATION_LEVELS = {
+    'disable': onnxruntime.GraphOptimizationLevel.ORT_DISABLE_ALL,
+    'basic': onnxruntime.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+    'extended': onnxruntime.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    'all': onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL,
+}
+
+
+def allowed_cpu_count() -> int:
+    """Cores this process may run on (respects taskset / cgroup limits)."""
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    if PSUTIL_AVAILABLE:
+        try:
+            return len(psutil.Process().cpu_affinity())
+        except Exception:
+            pass
+    return os.cpu_count() or 1
+
+
+def load_session_profile(path: str = ORT_PROFILE_PATH) -> Dict[str, Any]:
+    """Default session settings overlaid with the profile on disk, if there is one."""
+    profile = dict(DEFAULT_SESSION_PROFILE)
+    if not path or not os.path.exists(path):
+        return profile
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        profile.update({k: v for k, v in data.get('session', {}).items() if k in DEFAULT_SESSION_PROFILE})
+        print(f"Loaded ONNX Runtime profile from {path}: {describe_session_profile(profile)}")
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"Could not read ONNX Runtime profile {path}, using defaults: {e}")
+    return profile
+
+
+def load_model_overrides(path: str = ORT_PROFILE_PATH) -> Dict[str, Dict[str, Any]]:
+    """
+    Replacement models from the profile's 'models' section, by task:
+    {"detection": {"path": "quantized_models/det_10g_int8.onnx"}, ...}.
+    Entries may also carry input_mean / input_std for the replacement.
+    """
+    if not path or not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"Could not read model overrides from {path}: {e}")
+        return {}
+    overrides = {}
+    for taskname, entry in data.get('models', {}).items():
+        if isinstance(entry, str):
+            entry = {'path': entry}
+        if isinstance(entry, dict) and entry.get('path'):
+            overrides[taskname] = entry
+    return overrides
+
+
+def save_model_overrides(overrides: Dict[str, Dict[str, Any]], path: str = ORT_PROFILE_PATH):
+    """Set the profile's 'models' section, keeping its session settings."""
+    data = {}
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    data['models'] = overrides
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2)
+
+
+def save_session_profile(profile: Dict[str, Any], path: str = ORT_PROFILE_PATH, results=None):
+    """Write a session profile plus the measurements it was chosen from (model overrides are kept)."""
+    overrides = load_model_overrides(path)
+    data = {
+        'session': {k: profile[k] for k in DEFAULT_SESSION_PROFILE if k in profile},
+        'tuned': {
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'platform': platform.platform(),
+            'machine': platform.machine(),
+            'cpu_count': os.cpu_count(),
+            'allowed_cpu_count': allowed_cpu_count(),
+            'onnxruntime': onnxruntime.__version__,
+            'results': results or [],
+        },
+    }
+    if overrides:
+        data['models'] = overrides
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2)
+
+
+def describe_session_profile(profile: Dict[str, Any]) -> str:
+    return (f"intra={profile['intra_op_num_threads'] or default_intra_op_threads()} "
+            f"inter={profile['inter_op_num_threads']} mode={profile['execution_mode']} "
+            f"opt={profile['graph_optimization_level']} arena={profile['enable_cpu_mem_arena']}")
+
+
+def default_intra_op_threads() -> int:
+    """Intra-op threads when the profile leaves it at 0: one per vision core of the affinity plan, else per usable core."""
+    cores = get_affinity_planner().cores_for('vision')
+    return len(cores) if cores else allowed_cpu_count()
+
+
+def make_session_options(profile: Optional[Dict[str, Any]] = None) -> onnxruntime.SessionOptions:
+    """Translate a session profile into onnxruntime.SessionOptions (pool pinned to the plan's vision cores)."""
+    profile = dict(DEFAULT_SESSION_PROFILE, **(profile or {}))
+    options = onnxruntime.SessionOptions()
+    options.intra_op_num_threads = int(profile['intra_op_num_threads']) or default_intra_op_threads()
+    affinities = get_affinity_planner().ort_thread_affinities(options.intra_op_num_threads)
+    if affinities:
+        options.add_session_config_entry('session.intra_op_thread_affinities', affinities)
+    options.inter_op_num_threads = int(profile['inter_op_num_threads'])
+    options.execution_mode = EXECUTION_MODES[profile['execution_mode']]
+    options.graph_optimization_level = GRAPH_OPTIMIZATION_LEVELS[profile['graph_optimization_level']]
+    options.enable_cpu_mem_arena = bool(profile['enable_cpu_mem_arena'])
+    options.enable_mem_pattern = bool(profile['enable_mem_pattern'])
+    return options
+
+
+class OptimizedModelCache:
+    """
+    On-disk cache of ONNX Runtime-optimized model files.
+
+    An index remembers each source model's SHA-256, task and input
+    normalization by path, size and mtime, so unchanged models are not
+    re-hashed on every start, models whose task is not wanted are not
+    loaded at all, and models loaded from an optimized graph (whose first
+    nodes InsightFace can no longer inspect) keep the source's normalization.
+    """
+
+    PREPROCESS_ATTRS = ('input_mean', 'input_std')
+
+    INDEX_FILE = 'index.json'
+
+    def __init__(self, cache_dir: str = ORT_CACHE_DIR):
+        self.cache_dir = os.path.expanduser(cache_dir)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.index_path = os.path.join(self.cache_dir, self.INDEX_FILE)
+        self.index: Dict[str, Any] = {}
+        self._dirty = False
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                self.index = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            self.index = {}
+
+    def model_info(self, onnx_file: str) -> Dict[str, Any]:
+        """Hash (and known task, if any) of a source model."""
+        path = os.path.abspath(onnx_file)
+        stat = os.stat(path)
+        info = self.index.get(path)
+        if info is None or info.get('size') != stat.st_size or info.get('mtime') != stat.st_mtime:
+            sha256 = hashlib.sha256()
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    sha256.update(chunk)
+            info = {'size': stat.st_size, 'mtime': stat.st_mtime, 'sha256': sha256.hexdigest(), 'taskname': None}
+            self.index[path] = info
+            self._dirty = True
+        return info
+
+    def remember_model(self, onnx_file: str, model):
+        """Record the task and input normalization of a model loaded from its source file."""
+        info = self.index.get(os.path.abspath(onnx_file))
+        if info is None:
+            return
+        preprocess = {attr: float(getattr(model, attr)) for attr in self.PREPROCESS_ATTRS if hasattr(model, attr)}
+        if info.get('taskname') != model.taskname or info.get('preprocess') != preprocess:
+            info['taskname'] = model.taskname
+            info['preprocess'] = preprocess
+            self._dirty = True
+
+    def optimized_path(self, onnx_file: str, info: Dict[str, Any], level: str) -> str:
+        stem = os.path.splitext(os.path.basename(onnx_file))[0]
+        key = f"{info['sha256'][:16]}-ort{onnxruntime.__version__}-{level}-{platform.machine()}"
+        return os.path.join(self.cache_dir, f"{stem}-{key}.onnx")
+
+    def save_index(self):
+        if not self._dirty:
+            return
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.index, f, indent=2)
+        os.replace(tmp_path, self.index_path)
+        self._dirty = False
+
+
+class FaceModels:
+    """
+    Loads an InsightFace model pack like insightface.app.FaceAnalysis does
+    (det_model, models, prepare, get), but creates every ONNX Runtime
+    session with the given session profile instead of the library defaults,
+    reusing optimized graphs from `cache_dir` when they are valid.
+    `model_overrides` (see load_model_overrides) replaces the pack's model
+    for a task with another file, e.g. an INT8-quantized detector.
+    """
+
+    def __init__(self, name: str = 'buffalo_l', root: str = '~/.insightface', allowed_modules=None,
+                 session_profile: Optional[Dict[str, Any]] = None, providers=None,
+                 cache_dir: Optional[str] = ORT_CACHE_DIR,
+                 model_overrides: Optional[Dict[str, Dict[str, Any]]] = None):
+        start_time = time.perf_counter()
+        self.session_profile = dict(DEFAULT_SESSION_PROFILE, **(session_profile or {}))
+        self.providers = providers or ['CPUExecutionProvider']
+        self.model_dir = ensure_available('models', name, root=root)
+        self.models = {}
+        self.cache_hits = 0
+
+        self.cache = None
+        if cache_dir:
+            try:
+                self.cache = OptimizedModelCache(cache_dir)
+            except OSError as e:
+                print(f"ONNX Runtime graph cache disabled ({cache_dir}): {e}")
+
+        for taskname, override in (model_overrides or {}).items():
+            if allowed_modules is not None and taskname not in allowed_modules:
+                continue
+            self._load_override(taskname, override)
+
+        for onnx_file in sorted(glob.glob(osp.join(self.model_dir, '*.onnx'))):
+            info = self.cache.model_info(onnx_file) if self.cache is not None else None
+            known_task = info.get('taskname') if info else None
+            if known_task and ((allowed_modules is not None and known_task not in allowed_modules)
+                               or known_task in self.models):
+                continue  # Known to be a model we do not use (or one replaced above) - skip loading it
+            model = self._load_model(onnx_file, info)
+            if model is None:
+                print(f"model not recognized: {onnx_file}")
+                continue
+            if allowed_modules is not None and model.taskname not in allowed_modules:
+                del model
+            elif model.taskname not in self.models:
+                print(f"find model: {onnx_file} {model.taskname}")
+                self.models[model.taskname] = model
+            else:
+                del model
+
+        if self.cache is not None:
+            try:
+                self.cache.save_index()
+            except OSError as e:
+                print(f"Could not update ONNX Runtime graph cache index: {e}")
+        assert 'detection' in self.models
+        self.det_model = self.models['detection']
+        self.load_seconds = time.perf_counter() - start_time
+        print(f"Loaded {len(self.models)} face models in {self.load_seconds:.2f}s "
+              f"({self.cache_hits} from optimized graph cache)")
+
+    def _load_override(self, taskname: str, override: Dict[str, Any]):
+        path = os.path.expanduser(override['path'])
+        if not os.path.exists(path):
+            print(f"Replacement {taskname} model {path} not found, using the default one")
+            return
+        info = self.cache.model_info(path) if self.cache is not None else None
+        model = self._load_model(path, info)
+        if model is None or model.taskname != taskname:
+            print(f"Replacement model {path} is not a {taskname} model, using the default one")
+            return
+        # Quantization rewrites the first nodes InsightFace inspects for input normalization
+        for attr in OptimizedModelCache.PREPROCESS_ATTRS:
+            if attr in override:
+                setattr(model, attr, float(override[attr]))
+        print(f"find model: {path} {taskname} (replacement)")
+        self.models[taskname] = model
+
+    def _load_model(self, onnx_file: str, info: Optional[Dict[str, Any]]):
+        level = self.session_profile['graph_optimization_level']
+        if self.cache is None or info is None or level == 'disable':
+            return ModelRouter(onnx_file).get_model(sess_options=make_session_options(self.session_profile),
+                                                    providers=self.providers)
+
+        cached_path = self.cache.optimized_path(onnx_file, info, level)
+        if os.path.exists(cached_path) and info.get('taskname'):
+            # Already optimized: load without running the graph optimizers again
+            options = make_session_options(self.session_profile)
+            options.graph_optimization_level = GRAPH_OPTIMIZATION_LEVELS['disable']
+            try:
+                model = ModelRouter(cached_path).get_model(sess_options=options, providers=self.providers)
+                if model is not None and model.taskname == info['taskname']:
+                    for attr, value in info.get('preprocess', {}).items():
+                        setattr(model, attr, value)
+                    model.model_file = onnx_file
+                    self.cache_hits += 1
+                    return model
+            except Exception as e:
+                print(f"Discarding invalid cached graph {cached_path}: {e}")
+            try:
+                os.remove(cached_path)
+            except OSError:
+                pass
+
+        # Optimize from the source model and save the result for the next start
+        options = make_session_options(self.session_profile)
+        tmp_path = cached_path + '.tmp'
+        options.optimized_model_filepath = tmp_path
+        model = ModelRouter(onnx_file).get_model(sess_options=options, providers=self.providers)
+        try:
+            if model is not None and os.path.exists(tmp_path):
+                os.replace(tmp_path, cached_path)
+                self.cache.remember_model(onnx_file, model)
+        except OSError as e:
+            print(f"Could not cache optimized graph for {onnx_file}: {e}")
+        return model
+
+    def prepare(self, ctx_id: int = -1, det_thresh: float = 0.5, det_size=(640, 640)):
+        self.det_thresh = det_thresh
+        self.det_size = det_size
+        for taskname, model in self.models.items():
+            if taskname == 'detection':
+                model.prepare(ctx_id, input_size=det_size, det_thresh=det_thresh)
+            else:
+                model.prepare(ctx_id)
+
+    def get(self, img, max_num: int = 0):
+        """Detect faces and run every other loaded model on each, like FaceAnalysis.get"""
+        bboxes, kpss = self.det_model.detect(img, max_num=max_num, metric='default')
+        if bboxes.shape[0] == 0:
+            return []
+        faces = []
+        for i in range(bboxes.shape[0]):
+            kps = kpss[i] if kpss is not None else None
+            face = Face(bbox=bboxes[i, 0:4], kps=kps, det_score=bboxes[i, 4])
+            for taskname, model in self.models.items():
+                if taskname == 'detection':
+                    continue
+                model.get(img, face)
+            faces.append(face)
+        return faces
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+User Presence State Machine for AI Kiosk Application
+One state machine, fed by the camera loop with the tracked faces of each
+frame, decides whether a user is in front of the kiosk:
+
+    ABSENT -> APPROACHING (face in view, farther than the distance threshold)
+    ABSENT / APPROACHING -> PRESENT (closest face within the threshold)
+    PRESENT -> TOO_FAR (closest face beyond the threshold) -> PRESENT / ABSENT
+    PRESENT / TOO_FAR -> LEAVING (no face) -> PRESENT / TOO_FAR / ABSENT
+
+TOO_FAR and LEAVING fall back to ABSENT after `absence_threshold`
+seconds, counted from when the user left PRESENT (flipping between the
+two does not restart it). Transitions are published with timestamps to
+subscriber callbacks and through a condition variable, so other threads
+react as soon as presence changes instead of polling globals.
+"""
+
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+PRESENCE_ABSENT = 'absent'
+PRESENCE_APPROACHING = 'approaching'
+PRESENCE_PRESENT = 'present'
+PRESENCE_TOO_FAR = 'too_far'
+PRESENCE_LEAVING = 'leaving'
+
+PRESENCE_STATES = (PRESENCE_ABSENT, PRESENCE_APPROACHING, PRESENCE_PRESENT, PRESENCE_TOO_FAR, PRESENCE_LEAVING)
+
+# States in which a user is engaged with the kiosk (the absence timers have not run out)
+ENGAGED_STATES = frozenset((PRESENCE_PRESENT, PRESENCE_TOO_FAR, PRESENCE_LEAVING))
+
+# States whose absence timer turns them into ABSENT
+ABSENCE_TIMER_STATES = frozenset((PRESENCE_TOO_FAR, PRESENCE_LEAVING))
+
+
+class PresenceStateMachine:
+    """
+    Presence state plus transition publishing.
+
+    update() is called once per camera loop frame and returns the
+    transition dict if the state changed: {'state', 'previous',
+    'timestamp', 'previous_duration', 'user_count', 'distance'}.
+    Subscribers are called synchronously in the updating thread and must
+    return quickly; threads that want to block use wait_for() /
+    wait_for_change() instead.
+    """
+
+    def __init__(self, absence_threshold: float = 5.0, distance_threshold: float = 1.0):
+        self.absence_threshold = absence_threshold    # Seconds in TOO_FAR / LEAVING before ABSENT
+        self.distance_threshold = distance_threshold  # Meters; closest face beyond it is not PRESENT
+        self.state = PRESENCE_ABSENT
+        self.since = time.time()
+        self.version = 0  # Incremented on every transition
+        self.last_transition: Optional[Dict[str, Any]] = None
+        self._timer_start: Optional[float] = None  # TOO_FAR / LEAVING entered
+        self._condition = threading.Condition()
+        self._subscribers: List[Callable[[Dict[str, Any]], None]] = []
+
+    @property
+    def engaged(self) -> bool:
+        return self.state in ENGAGED_STATES
+
+    def subscribe(self, callback: Callable[[Dict[str, Any]], None]):
+        """Call `callback(transition)` on every state change."""
+        self._subscribers.append(callback)
+
+    def unsubscribe(self, callback: Callable[[Dict[str, Any]], None]):
+        if callback in self._subscribers:
+            self._subscribers.remove(callback)
+
+    def seconds_remaining(self, now: Optional[float] = None) -> Optional[float]:
+        """Seconds until TOO_FAR / LEAVING turns into ABSENT (None in other states)."""
+        if self._timer_start is None:
+            return None
+        now = time.time() if now is None else now
+        return max(0.0, self.absence_threshold - (now - self._timer_start))
+
+    def _next_state(self, user_count: int, distance: Optional[float], now: float) -> str:
+        state = self.state
+        near = user_count > 0 and distance is not None and distance <= self.distance_threshold
+        if near:
+            return PRESENCE_PRESENT
+        # The absence timer runs across TOO_FAR <-> LEAVING flips
+        if state in ABSENCE_TIMER_STATES and now - self._timer_start >= self.absence_threshold:
+            return PRESENCE_ABSENT
+
+        if user_count == 0:
+            if state in (PRESENCE_PRESENT, PRESENCE_TOO_FAR):
+                return PRESENCE_LEAVING
+            if state == PRESENCE_APPROACHING:
+                return PRESENCE_ABSENT
+            return state
+
+        if state in (PRESENCE_ABSENT, PRESENCE_APPROACHING):
+            return PRESENCE_APPROACHING
+        if state in (PRESENCE_PRESENT, PRESENCE_LEAVING):
+            return PRESENCE_TOO_FAR
+        return state
+
+    def update(self, user_count: int, distance: Optional[float] = None,
+               now: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Feed one frame's faces (count, closest distance in meters); returns the transition, if any."""
+        now = time.time() if now is None else now
+        new_state = self._next_state(user_count, distance, now)
+        if new_state == self.state:
+            return None
+        return self._transition(new_state, user_count, distance, now)
+
+    def reset(self, now: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Force ABSENT (e.g. application disabled); returns the transition, if any."""
+        if self.state == PRESENCE_ABSENT:
+            return None
+        return self._transition(PRESENCE_ABSENT, 0, None, time.time() if now is None else now)
+
+    def _transition(self, new_state: str, user_count: int, distance: Optional[float], now: float) -> Dict[str, Any]:
+        transition = {
+            'state': new_state,
+            'previous': self.state,
+            'timestamp': now,
+            'previous_duration': now - self.since,
+            'user_count': user_count,
+            'distance': distance,
+        }
+        with self._condition:
+            self.state = new_state
+            self.since = now
+            self.version += 1
+            self.last_transition = transition
+            if new_state not in ABSENCE_TIMER_STATES:
+                self._timer_start = None
+            elif self._timer_start is None:
+                # Flipping between TOO_FAR and LEAVING keeps counting, so a flickering far face still times out
+                self._timer_start = now
+            self._condition.notify_all()
+        for callback in list(self._subscribers):
+            try:
+                callback(transition)
+            except Exception as e:
+                print(f"Presence subscriber error: {e}")
+        return transition
+
+    def wait_for(self, states: Iterable[str], timeout: Optional[float] = None) -> bool:
+        """Block until the state is one of `states`; False on timeout."""
+        states = frozenset(states)
+        with self._condition:
+            return self._condition.wait_for(lambda: self.state in states, timeout)
+
+    def wait_for_change(self, version: int, timeout: Optional[float] = None) -> int:
+        """Block until a transition after `version`; returns the current version."""
+        with self._condition:
+            self._condition.wait_for(lambda: self.version != version, timeout)
+            return self.version
+
+
+# Global presence state machine
+presence = PresenceStateMachine()
+
+def get_presence() -> PresenceStateMachine:
+    """Get the global presence state machine."""
+    return presence
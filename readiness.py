@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Startup Readiness for AI Kiosk Application
+Each subsystem reports here once it can serve a visitor (vision: detector
+loaded and warmed up; tts: output device and decoder available; asr:
+microphone available), or that it failed to come up. main.py waits for
+every component before announcing that the application has started, so
+the announcement means the first visitor gets warm, working subsystems.
+"""
+
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+READINESS_COMPONENTS = ('vision', 'tts', 'asr')
+
+
+class StartupReadiness:
+    """
+    One readiness event per component plus the details it reported.
+
+    report_ready() / report_failed() may be called from any thread; only the
+    first report per component counts. wait() blocks until every component
+    has reported either way.
+    """
+
+    def __init__(self, components: Iterable[str] = READINESS_COMPONENTS):
+        self.components = tuple(components)
+        self.started = time.time()
+        self._events = {name: threading.Event() for name in self.components}
+        self._reports: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def _report(self, name: str, report: Dict[str, Any]):
+        with self._lock:
+            if name in self._reports:
+                return
+            report['seconds'] = time.time() - self.started
+            self._reports[name] = report
+            event = self._events.setdefault(name, threading.Event())
+        event.set()
+
+    def report_ready(self, name: str, **details):
+        """Component `name` is ready; `details` (e.g. measured latencies) are kept for status()."""
+        self._report(name, dict(details, ready=True))
+        extra = ", ".join(f"{key} {value}" for key, value in details.items())
+        print(f"Ready: {name}" + (f" ({extra})" if extra else ""))
+
+    def report_failed(self, name: str, reason: str):
+        """Component `name` could not start; waiting for it is over."""
+        self._report(name, {'ready': False, 'error': reason})
+        print(f"Not ready: {name} ({reason})")
+
+    def event(self, name: str) -> threading.Event:
+        """Set once `name` has reported (ready or failed)."""
+        with self._lock:
+            return self._events.setdefault(name, threading.Event())
+
+    def is_ready(self, name: str) -> bool:
+        with self._lock:
+            return self._reports.get(name, {}).get('ready', False)
+
+    def pending(self) -> List[str]:
+        with self._lock:
+            return [name for name in self.components if name not in self._reports]
+
+    def failed(self) -> Dict[str, str]:
+        """Component -> error for every component that reported a failure."""
+        with self._lock:
+            return {name: report['error'] for name, report in self._reports.items() if not report['ready']}
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until every component has reported; False on timeout."""
+        deadline = None if timeout is None else time.time() + timeout
+        for name in self.components:
+            remaining = None if deadline is None else max(0.0, deadline - time.time())
+            if not self.event(name).wait(remaining):
+                return False
+        return True
+
+    def status(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {name: dict(self._reports[name]) for name in self._reports}
+
+
+# Global readiness instance
+readiness = StartupReadiness()
+
+def get_readiness() -> StartupReadiness:
+    """Get the global startup readiness tracker."""
+    return readiness
@@ -3,6 +3,7 @@
 # MIT License (https://opensource.org/licenses/MIT)
 
 import os
+import shutil
 import sys
 import threading
 
@@ -15,6 +16,7 @@ sys.path.append(
                  './utils'))
 from chat import CHAT_HISTORY,SYSTEM_PROMPT
 from RealtimeMp3Player import RealtimeMp3Player
+import pyaudio
 
 import multiprocessing
 from echocheck import is_likely_system_echo
@@ -50,6 +52,28 @@ def init_dashscope_api_key():
         print("Warning: DASHSCOPE_API_KEY not found in environment variables")
         dashscope.api_key = '<your-dashscope-api-key>'  # set API-key manually
 
+def dashscope_api_key_missing():
+    """True while the API key is unset or still the placeholder"""
+    return not dashscope.api_key or dashscope.api_key.startswith('<')
+
+def check_tts_ready():
+    """Check speech synthesis prerequisites (API key, ffmpeg decoder, audio output device); returns an error or None"""
+    if dashscope_api_key_missing():
+        return "DASHSCOPE_API_KEY not set"
+    if shutil.which('ffmpeg') is None:
+        return "ffmpeg not found"
+    try:
+        audio = pyaudio.PyAudio()
+    except Exception as e:
+        return f"audio system unavailable: {e}"
+    try:
+        for i in range(audio.get_device_count()):
+            if audio.get_device_info_by_index(i).get('maxOutputChannels', 0) > 0:
+                return None
+        return "no audio output device"
+    finally:
+        audio.terminate()
+
 def synthesis_text_to_speech_and_play_by_streaming_mode(text):
     '''
     Synthesize speech with given text by streaming mode, async call and play the synthesized audio in real-time.
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Startup Orchestration for AI Kiosk Application
+Cold boot is a handful of slow, mostly independent steps: loading and
+warming up the face models, fetching the machine configuration, opening
+the camera, probing the audio devices. Each step is registered as a phase
+with the phases it really depends on; start() runs every phase in its own
+thread as soon as its dependencies have finished, while the main thread
+can time its own inline work with phase(). report() prints when each
+phase ran and how long it took, so the cold-boot-to-ready time and the
+phase that bounds it are visible in the startup log.
+"""
+
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Optional
+
+PHASE_PENDING = 'pending'
+PHASE_RUNNING = 'running'
+PHASE_DONE = 'done'
+PHASE_FAILED = 'failed'
+PHASE_SKIPPED = 'skipped'  # A dependency failed
+
+
+class StartupOrchestrator:
+    """
+    Dependency-ordered concurrent startup phases with timing.
+
+    Phases are dicts: {'name', 'func', 'after', 'state', 'start', 'end',
+    'result', 'error'}; start/end are seconds since the orchestrator was
+    created. A phase that raises is marked failed and every phase after it
+    is skipped; the rest of startup carries on.
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self.phases: Dict[str, Dict[str, Any]] = {}
+        self._done: Dict[str, threading.Event] = {}
+        self._threads: Dict[str, threading.Thread] = {}
+        self._lock = threading.Lock()
+
+    def _now(self) -> float:
+        return time.time() - self.started
+
+    def _new_phase(self, name: str, func: Optional[Callable[[], Any]], after: Iterable[str]) -> Dict[str, Any]:
+        with self._lock:
+            if name in self.phases:
+                raise ValueError(f"Startup phase already registered: {name}")
+            phase = {'name': name, 'func': func, 'after': tuple(after), 'state': PHASE_PENDING,
+                     'start': None, 'end': None, 'result': None, 'error': None}
+            self.phases[name] = phase
+            self._done[name] = threading.Event()
+        return phase
+
+    def add_phase(self, name: str, func: Callable[[], Any], after: Iterable[str] = ()):
+        """Register `func` to run in its own thread once every phase in `after` is done."""
+        self._new_phase(name, func, after)
+
+    def start(self):
+        """Start every registered phase that is not running yet."""
+        for name, phase in list(self.phases.items()):
+            unknown = [dep for dep in phase['after'] if dep not in self.phases]
+            if unknown:
+                raise ValueError(f"Startup phase {name} depends on unknown phase(s): {', '.join(unknown)}")
+        for name, phase in list(self.phases.items()):
+            if phase['func'] is None or name in self._threads:
+                continue
+            thread = threading.Thread(target=self._run_phase, args=(phase,), name=f"startup-{name}", daemon=True)
+            self._threads[name] = thread
+            thread.start()
+
+    def _run_phase(self, phase: Dict[str, Any]):
+        for dep in phase['after']:
+            self._done[dep].wait()
+        failed = [dep for dep in phase['after'] if self.phases[dep]['state'] != PHASE_DONE]
+        if failed:
+            phase['state'] = PHASE_SKIPPED
+            phase['error'] = f"after failed {', '.join(failed)}"
+            print(f"Startup phase {phase['name']} skipped ({phase['error']})")
+            self._done[phase['name']].set()
+            return
+        phase['state'] = PHASE_RUNNING
+        phase['start'] = self._now()
+        try:
+            phase['result'] = phase['func']()
+            phase['state'] = PHASE_DONE
+        except Exception as e:
+            phase['state'] = PHASE_FAILED
+            phase['error'] = str(e) or type(e).__name__
+            print(f"Startup phase {phase['name']} failed: {phase['error']}")
+            traceback.print_exc()
+        finally:
+            phase['end'] = self._now()
+            self._done[phase['name']].set()
+
+    @contextmanager
+    def phase(self, name: str):
+        """Time a block of work in the calling thread as phase `name`."""
+        phase = self._new_phase(name, None, ())
+        phase['state'] = PHASE_RUNNING
+        phase['start'] = self._now()
+        try:
+            yield phase
+            phase['state'] = PHASE_DONE
+        except Exception as e:
+            phase['state'] = PHASE_FAILED
+            phase['error'] = str(e) or type(e).__name__
+            raise
+        finally:
+            phase['end'] = self._now()
+            self._done[name].set()
+
+    def wait(self, names: Optional[Iterable[str]] = None, timeout: Optional[float] = None) -> bool:
+        """Block until the given phases (default: all) have finished; False on timeout."""
+        deadline = None if timeout is None else time.time() + timeout
+        for name in (self.phases if names is None else names):
+            remaining = None if deadline is None else max(0.0, deadline - time.time())
+            if not self._done[name].wait(remaining):
+                return False
+        return True
+
+    def result(self, name: str) -> Any:
+        """Return value of a finished phase (None if it failed or was skipped)."""
+        return self.phases[name]['result']
+
+    def failed(self) -> Dict[str, str]:
+        """Phase -> error for every failed or skipped phase."""
+        return {name: phase['error'] for name, phase in self.phases.items()
+                if phase['state'] in (PHASE_FAILED, PHASE_SKIPPED)}
+
+    def summary(self) -> Dict[str, Any]:
+        """Per-phase timings plus the wall-clock and summed phase time."""
+        phases = {}
+        for name, phase in self.phases.items():
+            duration = None
+            if phase['start'] is not None and phase['end'] is not None:
+                duration = phase['end'] - phase['start']
+            phases[name] = {'state': phase['state'], 'start': phase['start'], 'end': phase['end'],
+                            'seconds': duration, 'after': list(phase['after']), 'error': phase['error']}
+        ends = [phase['end'] for phase in phases.values() if phase['end'] is not None]
+        return {
+            'phases': phases,
+            'wall_seconds': max(ends) if ends else 0.0,
+            'serial_seconds': sum(phase['seconds'] or 0.0 for phase in phases.values()),
+        }
+
+    def report(self, ready_seconds: Optional[float] = None):
+        """Print when each phase ran and how long it took; phases still running are listed as such."""
+        summary = self.summary()
+        print("Startup phases (seconds since start):")
+        for name, phase in sorted(summary['phases'].items(),
+                                  key=lambda item: (item[1]['start'] is None, item[1]['start'] or 0.0)):
+            if phase['state'] == PHASE_RUNNING:
+                print(f"  {name:<14} {phase['start']:6.2f} -> still running after {self._now() - phase['start']:.2f}s")
+                continue
+            if phase['seconds'] is None:
+                print(f"  {name:<14} {phase['state']}" + (f" ({phase['error']})" if phase['error'] else ""))
+                continue
+            after = f"  after {', '.join(phase['after'])}" if phase['after'] else ""
+            status = f"  {phase['state'].upper()}: {phase['error']}" if phase['state'] != PHASE_DONE else ""
+            print(f"  {name:<14} {phase['start']:6.2f} -> {phase['end']:6.2f}  {phase['seconds']:6.2f}s{after}{status}")
+        unfinished = [name for name, phase in summary['phases'].items() if phase['state'] in (PHASE_PENDING, PHASE_RUNNING)]
+        line = (f"Startup phases finished in {summary['wall_seconds']:.2f}s "
+                f"({summary['serial_seconds']:.2f}s if run one after another)")
+        if unfinished:
+            line = (f"Startup phases {', '.join(unfinished)} not finished; the others finished in "
+                    f"{summary['wall_seconds']:.2f}s ({summary['serial_seconds']:.2f}s if run one after another)")
+        if ready_seconds is not None:
+            line += f", ready in {ready_seconds:.2f}s"
+        print(line)
+
+
+# Global startup orchestrator
+startup = StartupOrchestrator()
+
+def get_startup() -> StartupOrchestrator:
+    """Get the global startup orchestrator."""
+    return startup
@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+"""
+System Metrics Sampler for AI Kiosk Application
+One background thread samples CPU usage (total and per core), memory and
+load average with non-blocking psutil calls and publishes them as a new
+snapshot dict. Any thread reads the latest snapshot in O(1) without
+taking a lock or waiting for a measurement interval.
+
+Each sample also accounts CPU time per thread (and per child process) to
+the subsystem it belongs to, by thread name, and publishes rolling CPU
+rates per subsystem so the CPU optimizer can tell which one is busy.
+
+ThermalReader reads SoC temperature and CPU frequency limits from sysfs
+(root configurable, e.g. a fake tree for testing).
+"""
+
+import glob
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Optional, Tuple
+
+try:
+    import psutil
+    PSUTIL_AVAILABLE = True
+except ImportError:
+    PSUTIL_AVAILABLE = False
+
+# Published until the first real sample (same assumptions CPUOptimizer made without psutil)
+DEFAULT_SNAPSHOT = {
+    'timestamp': 0.0,
+    'cpu_percent': 50.0,
+    'per_cpu_percent': (),
+    'memory_percent': 50.0,
+    'memory_available_mb': 1000.0,
+    'load_average': None,
+    'process_cpu': 0.0,      # Percent of one core, this process and its children (rolling)
+    'subsystem_cpu': {},     # Subsystem -> percent of one core (rolling)
+    'thread_cpu': {},        # Thread / child process name -> percent of one core (rolling)
+    'samples': 0,
+}
+
+# Thread name prefixes of each subsystem (threads are named where they are started)
+SUBSYSTEM_THREAD_PREFIXES = (
+    ('vision', ('camera-', 'face-detection')),
+    ('audio', ('mic-listen',)),
+    ('tts', ('speech-worker', 'llm-speak', 'tts-')),
+    ('websocket', ('websocket',)),
+    ('polling', ('suggestions', 'auto-speak', 'listen-status', 'charging-announcement', 'frame-cleanup',
+                 'task-monitor', 'cpu-optimizer', 'system-metrics')),
+)
+
+# Child processes that are not registered are matched by executable name
+SUBSYSTEM_PROCESS_NAMES = {
+    'ffmpeg': 'tts',  # MP3 decode for TTS playback
+}
+
+# sysfs root for thermal zones and cpufreq (override for testing against a fake tree)
+DEFAULT_SYSFS_ROOT = os.environ.get('KIOSK_SYSFS_ROOT', '/sys')
+DEFAULT_THROTTLE_TEMP_C = 80.0  # Raspberry Pi firmware soft limit, used when no passive trip point is exposed
+# Raspberry Pi firmware get_throttled bits that mean the ARM clock is being held down right now
+FIRMWARE_THROTTLE_FLAGS = 0x2 | 0x4 | 0x8  # Frequency capped, throttled, soft temperature limit
+
+OTHER_SUBSYSTEM = 'other'    # Python threads without a subsystem name (main thread, library threads)
+NATIVE_SUBSYSTEM = 'native'  # Threads Python does not know about (ONNX Runtime pool, audio callbacks)
+
+
+def subsystem_for_thread(name: str) -> str:
+    for subsystem, prefixes in SUBSYSTEM_THREAD_PREFIXES:
+        if name.startswith(prefixes):
+            return subsystem
+    return OTHER_SUBSYSTEM
+
+
+class ThreadCPUAccounting:
+    """
+    Per-thread and per-child-process CPU time, attributed to subsystems.
+
+    Every sample() reads cumulative CPU times (psutil thread times on this
+    process, cpu_times of child processes), turns them into deltas since the
+    previous sample and returns rates averaged over the last `window`
+    seconds, as percent of one core.
+    """
+
+    def __init__(self, window: float = 10.0):
+        self.window = window
+        self._process = psutil.Process() if PSUTIL_AVAILABLE else None
+        self._registered: Dict[int, Tuple[str, str]] = {}  # pid -> (subsystem, name)
+        self._last_times: Dict[Any, float] = {}
+        self._last_sample: Optional[float] = None
+        self._history = deque()  # (timestamp, seconds, {subsystem: cpu}, {name: cpu})
+        self._lock = threading.Lock()
+
+    def register_process(self, pid: int, subsystem: str, name: Optional[str] = None):
+        """Attribute a child process (e.g. the face detection process) to a subsystem."""
+        with self._lock:
+            self._registered[pid] = (subsystem, name or f"{subsystem}-process")
+
+    def unregister_process(self, pid: int):
+        with self._lock:
+            self._registered.pop(pid, None)
+
+    def _read_times(self) -> Dict[Any, Tuple[str, str, float]]:
+        """key -> (subsystem, name, cumulative CPU seconds)"""
+        times = {}
+        python_threads = {t.native_id: t.name for t in threading.enumerate()}
+        for thread in self._process.threads():
+            name = python_threads.get(thread.id)
+            subsystem = subsystem_for_thread(name) if name is not None else NATIVE_SUBSYSTEM
+            times[('thread', thread.id)] = (subsystem, name or NATIVE_SUBSYSTEM, thread.user_time + thread.system_time)
+
+        with self._lock:
+            registered = dict(self._registered)
+        for child in self._process.children(recursive=True):
+            try:
+                cpu = child.cpu_times()
+                if child.pid in registered:
+                    subsystem, name = registered[child.pid]
+                else:
+                    name = child.name()
+                    subsystem = SUBSYSTEM_PROCESS_NAMES.get(name, OTHER_SUBSYSTEM)
+                times[('process', child.pid)] = (subsystem, name, cpu.user + cpu.system)
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                continue
+        return times
+
+    def sample(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        times = self._read_times()
+        subsystem_delta: Dict[str, float] = {}
+        name_delta: Dict[str, float] = {}
+        for key, (subsystem, name, cpu_seconds) in times.items():
+            # Threads and processes that appeared since the last sample count from zero
+            delta = max(0.0, cpu_seconds - self._last_times.get(key, 0.0))
+            subsystem_delta[subsystem] = subsystem_delta.get(subsystem, 0.0) + delta
+            name_delta[name] = name_delta.get(name, 0.0) + delta
+        self._last_times = {key: value[2] for key, value in times.items()}
+
+        if self._last_sample is not None:
+            self._history.append((now, now - self._last_sample, subsystem_delta, name_delta))
+        self._last_sample = now
+        while self._history and now - self._history[0][0] > self.window:
+            self._history.popleft()
+
+        elapsed = sum(entry[1] for entry in self._history)
+        subsystem_cpu: Dict[str, float] = {}
+        thread_cpu: Dict[str, float] = {}
+        for _, _, subsystems, names in self._history:
+            for subsystem, cpu in subsystems.items():
+                subsystem_cpu[subsystem] = subsystem_cpu.get(subsystem, 0.0) + cpu
+            for name, cpu in names.items():
+                thread_cpu[name] = thread_cpu.get(name, 0.0) + cpu
+        if elapsed > 0:
+            subsystem_cpu = {k: round(v / elapsed * 100.0, 1) for k, v in subsystem_cpu.items()}
+            thread_cpu = {k: round(v / elapsed * 100.0, 1) for k, v in thread_cpu.items() if v > 0}
+        else:
+            subsystem_cpu, thread_cpu = {}, {}
+        return {
+            'process_cpu': round(sum(subsystem_cpu.values()), 1),
+            'subsystem_cpu': subsystem_cpu,
+            'thread_cpu': dict(sorted(thread_cpu.items(), key=lambda item: item[1], reverse=True)),
+        }
+
+
+def _read_sysfs(path: str) -> Optional[str]:
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except (OSError, ValueError):
+        return None
+
+
+def _read_sysfs_int(path: str, base: int = 10) -> Optional[int]:
+    value = _read_sysfs(path)
+    try:
+        return int(value, base) if value else None
+    except ValueError:
+        return None
+
+
+class ThermalReader:
+    """
+    SoC temperature and CPU frequency limits from sysfs.
+
+    Thermal zones, cpufreq policies and the throttle temperature (lowest
+    passive trip point) are discovered once; read() then only reads a few
+    small files. The CPU counts as throttled when a policy's
+    scaling_max_freq drops below its value at startup (cpufreq cooling) or
+    the Raspberry Pi firmware reports a frequency cap.
+    """
+
+    def __init__(self, sysfs_root: str = DEFAULT_SYSFS_ROOT):
+        self.sysfs_root = sysfs_root
+        self.zones = sorted(glob.glob(os.path.join(sysfs_root, 'class', 'thermal', 'thermal_zone*')))
+        cpu_dir = os.path.join(sysfs_root, 'devices', 'system', 'cpu')
+        self.policies = (sorted(glob.glob(os.path.join(cpu_dir, 'cpufreq', 'policy*')))
+                         or sorted(glob.glob(os.path.join(cpu_dir, 'cpu[0-9]*', 'cpufreq'))))
+        self.firmware_path = os.path.join(sysfs_root, 'devices', 'platform', 'soc', 'soc:firmware', 'get_throttled')
+        self.throttle_temp_c = self._passive_trip_temp() or DEFAULT_THROTTLE_TEMP_C
+        self.base_max_freq = {policy: _read_sysfs_int(os.path.join(policy, 'scaling_max_freq'))
+                              for policy in self.policies}
+
+    @property
+    def available(self) -> bool:
+        return bool(self.zones or self.policies)
+
+    def _passive_trip_temp(self) -> Optional[float]:
+        trips = []
+        for zone in self.zones:
+            for type_path in glob.glob(os.path.join(zone, 'trip_point_*_type')):
+                if _read_sysfs(type_path) == 'passive':
+                    temp = _read_sysfs_int(type_path[:-len('type')] + 'temp')
+                    if temp:
+                        trips.append(temp / 1000.0)
+        return min(trips) if trips else None
+
+    def read(self) -> Dict[str, Any]:
+        state = {
+            'available': self.available,
+            'temperature_c': None,
+            'zone': None,
+            'throttle_temp_c': self.throttle_temp_c,
+            'cpu_freq_mhz': None,
+            'cpu_max_freq_mhz': None,
+            'freq_capped': False,
+            'firmware_flags': None,
+            'throttled': False,
+        }
+        for zone in self.zones:
+            temp = _read_sysfs_int(os.path.join(zone, 'temp'))
+            if temp is not None and (state['temperature_c'] is None or temp / 1000.0 > state['temperature_c']):
+                state['temperature_c'] = temp / 1000.0
+                state['zone'] = _read_sysfs(os.path.join(zone, 'type')) or os.path.basename(zone)
+
+        current, maximum = [], []
+        for policy in self.policies:
+            cur_freq = _read_sysfs_int(os.path.join(policy, 'scaling_cur_freq'))
+            max_freq = _read_sysfs_int(os.path.join(policy, 'cpuinfo_max_freq'))
+            limit = _read_sysfs_int(os.path.join(policy, 'scaling_max_freq'))
+            if cur_freq:
+                current.append(cur_freq)
+            if max_freq:
+                maximum.append(max_freq)
+            base = self.base_max_freq.get(policy)
+            if limit and base and limit < base:
+                state['freq_capped'] = True
+        if current:
+            state['cpu_freq_mhz'] = sum(current) / len(current) / 1000.0
+        if maximum:
+            state['cpu_max_freq_mhz'] = max(maximum) / 1000.0
+
+        flags = _read_sysfs_int(self.firmware_path, 16)
+        state['firmware_flags'] = flags
+        state['throttled'] = state['freq_capped'] or bool(flags and flags & FIRMWARE_THROTTLE_FLAGS)
+        return state
+
+
+class SystemMetricsSampler:
+    """
+    Background sampler publishing system load snapshots.
+
+    psutil.cpu_percent(interval=None) measures since the previous call, so
+    the sampling thread's own interval is the measurement window and no
+    caller ever sleeps inside psutil. snapshot() returns the current dict by
+    reference (a single attribute read); it is replaced, never modified, so
+    readers must treat it as read-only.
+    """
+
+    def __init__(self, interval: float = 1.0, accounting_window: float = 10.0):
+        self.interval = interval
+        self.accounting = ThreadCPUAccounting(accounting_window) if PSUTIL_AVAILABLE else None
+        self._snapshot: Dict[str, Any] = dict(DEFAULT_SNAPSHOT)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        """Start the sampling thread (no-op if it is already running)."""
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            if PSUTIL_AVAILABLE:
+                # The first calls only set the reference points for the next ones
+                psutil.cpu_percent(interval=None, percpu=True)
+                try:
+                    self.accounting.sample()
+                except Exception as e:
+                    print(f"Thread CPU accounting unavailable: {e}")
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="system-metrics", daemon=True)
+            self._thread.start()
+            print(f"System metrics sampler started ({self.interval:.1f}s interval)")
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None and self._thread.is_alive():
+            self._thread.join(timeout=2.0)
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Latest published sample; never blocks."""
+        return self._snapshot
+
+    def register_process(self, pid: int, subsystem: str, name: Optional[str] = None):
+        """Attribute a child process's CPU time to a subsystem."""
+        if self.accounting is not None:
+            self.accounting.register_process(pid, subsystem, name)
+
+    def unregister_process(self, pid: int):
+        if self.accounting is not None:
+            self.accounting.unregister_process(pid)
+
+    def sample(self) -> Dict[str, Any]:
+        """Take one sample and publish it."""
+        snapshot = dict(self._snapshot)
+        snapshot['timestamp'] = time.time()
+        snapshot['samples'] = self._snapshot['samples'] + 1
+        if PSUTIL_AVAILABLE:
+            try:
+                per_cpu = psutil.cpu_percent(interval=None, percpu=True)
+                if per_cpu:
+                    snapshot['per_cpu_percent'] = tuple(per_cpu)
+                    snapshot['cpu_percent'] = sum(per_cpu) / len(per_cpu)
+                memory = psutil.virtual_memory()
+                snapshot['memory_percent'] = memory.percent
+                snapshot['memory_available_mb'] = memory.available / (1024 * 1024)
+                snapshot.update(self.accounting.sample())
+            except Exception as e:
+                print(f"System metrics sampling error: {e}")
+        if hasattr(os, 'getloadavg'):
+            try:
+                snapshot['load_average'] = os.getloadavg()
+            except OSError:
+                pass
+        self._snapshot = snapshot  # Atomic reference swap; readers never see a half-written sample
+        return snapshot
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+
+# Global sampler instance
+system_sampler = SystemMetricsSampler()
+
+def get_system_sampler() -> SystemMetricsSampler:
+    """Get the global system metrics sampler."""
+    return system_sampler
@@ -4,6 +4,8 @@ import threading
 import json
 from typing import Dict, Any, Optional
 
+from cpu_optimizer import get_optimizer
+
 class TaskMonitor:
     """Monitor task status from API and control application execution"""
     
@@ -105,7 +107,7 @@ class TaskMonitor:
                 print(f"Task Monitor Error: {e}")
             
             # Wait for next check
-            time.sleep(self.monitor_interval)
+            time.sleep(self.monitor_interval * get_optimizer().get_throttle('polling'))
     
     def start_monitoring(self):
         """Start the monitoring thread"""
@@ -114,7 +116,7 @@ class TaskMonitor:
             
         self.is_running = True
         self.stop_event.clear()
-        self.monitor_thread = threading.Thread(target=self.monitor_loop, daemon=True)
+        self.monitor_thread = threading.Thread(target=self.monitor_loop, name="task-monitor", daemon=True)
         self.monitor_thread.start()
         print(f"Task monitoring started for machine ID: {self.machine_id}")
     
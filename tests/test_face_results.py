@@ -0,0 +1,32 @@
+import numpy as np
+
+from face_results import (AGE_UNKNOWN, GENDER_MALE, GENDER_UNKNOWN, NO_TRACK, face_age, face_areas,
+                          face_results_from_detections, face_widths, gender_label, largest_face_index,
+                          sort_largest_first)
+
+
+def test_detections_start_without_attributes_or_track():
+    faces = face_results_from_detections([[0, 0, 10, 20, 0.9], [5, 5, 45, 45, 0.8]])
+    assert len(faces) == 2
+    np.testing.assert_allclose(faces['score'], [0.9, 0.8], rtol=1e-6)
+    assert (faces['gender'] == GENDER_UNKNOWN).all()
+    assert (faces['age'] == AGE_UNKNOWN).all()
+    assert (faces['track_id'] == NO_TRACK).all()
+
+
+def test_sizes_and_largest_face():
+    faces = face_results_from_detections([[0, 0, 10, 20, 0.9], [5, 5, 45, 45, 0.8]])
+    assert face_widths(faces).tolist() == [10, 40]
+    assert face_areas(faces).tolist() == [200, 1600]
+    assert largest_face_index(faces) == 1
+    assert sort_largest_first(faces)['score'][0] == np.float32(0.8)
+    assert largest_face_index(face_results_from_detections(np.zeros((0, 5)))) == -1
+
+
+def test_attribute_helpers():
+    faces = face_results_from_detections([[0, 0, 10, 10, 0.9]])
+    assert face_age(faces[0]) is None
+    assert gender_label(faces[0]['gender']) == 'unknown'
+    faces['age'], faces['gender'] = 31, GENDER_MALE
+    assert face_age(faces[0]) == 31
+    assert gender_label(faces[0]['gender']) == 'M'
@@ -0,0 +1,98 @@
+import numpy as np
+
+from face_results import empty_face_results, face_results_from_detections
+from face_tracker import FaceTracker, box_iou, top_k_indices
+
+FACE = [100, 80, 160, 150, 0.9]
+
+
+def textured_frame(shift=0):
+    rng = np.random.default_rng(0)
+    gray = rng.integers(0, 255, (240, 320), dtype=np.uint8)
+    return np.roll(gray, shift, axis=1)
+
+
+def detections(*rows):
+    return face_results_from_detections(np.array(rows, dtype=np.float32).reshape(-1, 5))
+
+
+def confirmed_tracker(hits=3):
+    tracker = FaceTracker(min_hits_stable=3)
+    gray = textured_frame()
+    for i in range(hits):
+        tracker.propagate(gray, float(i))
+        tracker.update(detections(FACE), float(i), gray)
+    return tracker, gray
+
+
+def test_box_iou():
+    boxes = np.array([[0, 0, 10, 10]], dtype=np.float32)
+    assert box_iou(boxes, boxes)[0, 0] == 1.0
+    assert box_iou(boxes, np.array([[20, 20, 30, 30]], dtype=np.float32))[0, 0] == 0.0
+
+
+def test_matched_detection_keeps_track_id():
+    tracker, gray = confirmed_tracker()
+    assert len(tracker.tracks) == 1
+    faces = detections([104, 82, 164, 152, 0.9])
+    tracker.update(faces, 3.0, gray)
+    assert faces['track_id'][0] == tracker.tracks[0].track_id
+    assert tracker.tracks[0].hits == 4
+
+
+def test_confirmed_track_is_stable():
+    tracker, _ = confirmed_tracker()
+    assert tracker.is_stable()
+
+
+def test_miss_forces_redetect_and_unstable():
+    tracker, gray = confirmed_tracker()
+    tracker.update(empty_face_results(), 3.0, gray)
+    # The track survives the miss but is no longer trusted on optical flow alone
+    assert len(tracker.tracks) == 1
+    assert tracker.redetect_requested
+    assert not tracker.is_stable()
+
+
+def test_confirmed_track_dropped_after_max_misses():
+    tracker, gray = confirmed_tracker()
+    for i in range(tracker.max_misses + 1):
+        tracker.update(empty_face_results(), 3.0 + i, gray)
+    assert tracker.tracks == []
+
+
+def test_unconfirmed_track_expires_on_first_miss():
+    tracker = FaceTracker(min_hits_stable=3)
+    gray = textured_frame()
+    tracker.update(detections(FACE), 0.0, gray)
+    tracker.update(empty_face_results(), 1.0, gray)
+    assert tracker.tracks == []
+
+
+def test_flow_follows_motion():
+    tracker, gray = confirmed_tracker()
+    tracker.propagate(textured_frame(shift=5), 3.0)
+    x1 = tracker.tracks[0].bbox[0]
+    assert abs(x1 - (FACE[0] + 5)) < 1.5
+
+
+def test_rescale_scales_boxes_and_history():
+    tracker, _ = confirmed_tracker()
+    before = tracker.tracks[0].bbox.copy()
+    tracker.rescale(1.2)
+    np.testing.assert_allclose(tracker.tracks[0].bbox, before * 1.2, rtol=1e-5)
+    np.testing.assert_allclose(tracker.tracks[0].history[-1][1], before * 1.2, rtol=1e-5)
+    assert tracker.prev_gray is None
+
+
+def test_top_k_indices_highest_first():
+    scores = np.array([5.0, 1.0, 9.0, 7.0, 3.0])
+    assert top_k_indices(scores, 3).tolist() == [2, 3, 0]
+    assert top_k_indices(scores, 10).tolist() == [2, 3, 0, 4, 1]
+
+
+def test_top_k_indices_only_among_eligible():
+    scores = np.array([5.0, 1.0, 9.0, 7.0, 3.0])
+    eligible = np.array([True, True, False, False, True])
+    assert top_k_indices(scores, 2, eligible).tolist() == [0, 4]
+    assert top_k_indices(scores, 2, np.zeros(5, dtype=bool)).tolist() == []
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from frame_preprocess import DetectorPreprocessor, parse_roi
+
+SQUARE = (200, 100, 280, 180)  # x1, y1, x2, y2 in camera frame pixels
+
+
+def frame_with_square():
+    frame = np.zeros((480, 640, 3), dtype=np.uint8)
+    x1, y1, x2, y2 = SQUARE
+    frame[y1:y2, x1:x2] = 255
+    return frame
+
+
+def bright_box(det_input):
+    ys, xs = np.nonzero(det_input[:, :, 0] > 127)
+    return [xs.min(), ys.min(), xs.max() + 1, ys.max() + 1]
+
+
+@pytest.mark.parametrize('rotate', [True, False])
+@pytest.mark.parametrize('roi', [None, '0.2,0.1,0.8,0.9'])
+def test_boxes_map_back_to_the_camera_frame(rotate, roi):
+    pre = DetectorPreprocessor((320, 320), rotate=rotate)
+    pre.set_roi(parse_roi(roi))
+    det_input = pre.prepare(frame_with_square())
+    assert det_input.shape == (pre.input_size[1], pre.input_size[0], 3)
+    mapped = pre.boxes_to_source([bright_box(det_input)])[0]
+    # One detector pixel is about two camera pixels at this scale
+    np.testing.assert_allclose(mapped, SQUARE, atol=4)
+
+
+def test_letterbox_padding_stays_black_in_reused_buffers():
+    pre = DetectorPreprocessor((320, 320), rotate=False)
+    out = np.full((320, 320, 3), 200, dtype=np.uint8)
+    det_input = pre.prepare(frame_with_square(), out)
+    assert det_input is out
+    content_w, content_h = pre.content_size
+    assert (content_w, content_h) == (320, 240)
+    assert not det_input[content_h:].any()
+
+
+def test_roi_shrinks_the_detector_input():
+    pre = DetectorPreprocessor((320, 320), rotate=False)
+    pre.set_roi(parse_roi('0,0,0.5,0.5'))
+    pre.prepare(frame_with_square())
+    assert pre.input_size == (160, 128)
+    assert pre.scale == pytest.approx(0.5)
+
+
+def test_parse_roi_rejects_bad_values():
+    assert parse_roi('') is None
+    assert parse_roi({'polygon': [[0, 0], [1, 0], [0, 1]]})['rect'] == (0.0, 0.0, 1.0, 1.0)
+    with pytest.raises(ValueError):
+        parse_roi('0.5,0.5,0.2,0.9')
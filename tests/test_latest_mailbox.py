@@ -0,0 +1,58 @@
+import queue
+import threading
+import time
+
+import pytest
+
+from latest_mailbox import LatestMailbox
+
+
+def test_newest_item_wins_and_replaced_item_is_returned():
+    mailbox = LatestMailbox()
+    assert mailbox.put('a') is None
+    assert mailbox.put('b') == 'a'
+    assert mailbox.get(timeout=0.1) == (2, 'b')
+    assert mailbox.get_stats()['dropped'] == 1
+
+
+def test_get_times_out_when_empty():
+    mailbox = LatestMailbox()
+    with pytest.raises(queue.Empty):
+        mailbox.get(timeout=0.01)
+    with pytest.raises(queue.Empty):
+        mailbox.get_nowait()
+
+
+def test_close_wakes_a_waiting_consumer():
+    mailbox = LatestMailbox()
+    errors = []
+
+    def consume():
+        try:
+            mailbox.get(timeout=5.0)
+        except queue.Empty:
+            errors.append('empty')
+
+    consumer = threading.Thread(target=consume)
+    consumer.start()
+    time.sleep(0.05)
+    mailbox.close()
+    consumer.join(timeout=1.0)
+    assert errors == ['empty'] and mailbox.closed
+
+
+def test_blocking_put_waits_for_the_consumer():
+    mailbox = LatestMailbox()
+    mailbox.put(1)
+    taker = threading.Timer(0.05, mailbox.get_nowait)
+    taker.start()
+    assert mailbox.put(2, block=True, timeout=1.0) is None  # Nothing was dropped
+    taker.join()
+    assert mailbox.get_nowait() == (2, 2)
+
+
+def test_clear_returns_the_unread_item():
+    mailbox = LatestMailbox()
+    mailbox.put('frame')
+    assert mailbox.clear() == 'frame'
+    assert not mailbox.pending()
@@ -0,0 +1,35 @@
+import numpy as np
+
+from motion_gate import MotionGate
+
+
+def still_frame():
+    return np.full((240, 320, 3), 100, dtype=np.uint8)
+
+
+def test_first_frame_counts_as_motion():
+    gate = MotionGate()
+    assert gate.should_detect(still_frame(), current_time=0.0)
+
+
+def test_still_scene_is_skipped_until_the_safety_interval():
+    gate = MotionGate(safety_interval=5.0)
+    gate.should_detect(still_frame(), current_time=0.0)
+    assert not gate.should_detect(still_frame(), current_time=1.0)
+    assert not gate.should_detect(still_frame(), current_time=4.9)
+    assert gate.should_detect(still_frame(), current_time=5.0)
+    assert gate.get_stats()['frames_skipped'] == 2
+
+
+def test_scene_change_passes():
+    gate = MotionGate()
+    gate.should_detect(still_frame(), current_time=0.0)
+    changed = still_frame()
+    changed[60:180, 100:220] = 255
+    assert gate.should_detect(changed, current_time=1.0)
+
+
+def test_faces_present_always_pass():
+    gate = MotionGate()
+    gate.should_detect(still_frame(), current_time=0.0)
+    assert gate.should_detect(still_frame(), current_time=1.0, faces_present=True)
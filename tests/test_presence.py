@@ -0,0 +1,73 @@
+import threading
+
+from presence import (PRESENCE_ABSENT, PRESENCE_APPROACHING, PRESENCE_LEAVING, PRESENCE_PRESENT,
+                      PRESENCE_TOO_FAR, PresenceStateMachine)
+
+
+def present_machine():
+    machine = PresenceStateMachine(absence_threshold=5.0, distance_threshold=1.0)
+    machine.update(1, 0.5, now=0.0)
+    return machine
+
+
+def test_far_face_approaches_then_becomes_present():
+    machine = PresenceStateMachine()
+    machine.update(1, 2.0, now=0.0)
+    assert machine.state == PRESENCE_APPROACHING
+    machine.update(1, 0.8, now=1.0)
+    assert machine.state == PRESENCE_PRESENT
+
+
+def test_leaving_times_out_to_absent():
+    machine = present_machine()
+    machine.update(0, now=1.0)
+    assert machine.state == PRESENCE_LEAVING
+    assert machine.seconds_remaining(now=3.0) == 3.0
+    machine.update(0, now=5.9)
+    assert machine.state == PRESENCE_LEAVING
+    machine.update(0, now=6.0)
+    assert machine.state == PRESENCE_ABSENT
+
+
+def test_flickering_far_face_still_times_out():
+    machine = present_machine()
+    for second in range(1, 41):
+        if second % 2:
+            machine.update(1, 2.0, now=float(second))
+        else:
+            machine.update(0, now=float(second))
+        if machine.state == PRESENCE_ABSENT:
+            break
+    # The timer started when the user left PRESENT at t=1 and kept running across TOO_FAR <-> LEAVING
+    assert machine.state == PRESENCE_ABSENT
+    assert second == 6
+
+
+def test_returning_close_resets_the_timer():
+    machine = present_machine()
+    machine.update(1, 2.0, now=1.0)
+    assert machine.state == PRESENCE_TOO_FAR
+    machine.update(1, 0.5, now=4.0)
+    assert machine.state == PRESENCE_PRESENT
+    assert machine.seconds_remaining() is None
+    machine.update(0, now=5.0)
+    assert machine.seconds_remaining(now=5.0) == 5.0
+
+
+def test_transitions_are_published():
+    machine = PresenceStateMachine()
+    transitions = []
+    machine.subscribe(transitions.append)
+    machine.update(1, 0.5, now=10.0)
+    machine.reset(now=12.0)
+    assert [(t['previous'], t['state']) for t in transitions] == [
+        (PRESENCE_ABSENT, PRESENCE_PRESENT), (PRESENCE_PRESENT, PRESENCE_ABSENT)]
+    assert transitions[1]['previous_duration'] == 2.0
+
+
+def test_wait_for_wakes_on_transition():
+    machine = PresenceStateMachine()
+    timer = threading.Timer(0.05, machine.update, args=(1, 0.5))
+    timer.start()
+    assert machine.wait_for((PRESENCE_PRESENT,), timeout=2.0)
+    timer.join()
@@ -0,0 +1,31 @@
+import threading
+
+from readiness import StartupReadiness
+
+
+def test_wait_returns_once_every_component_reported():
+    readiness = StartupReadiness(('vision', 'tts'))
+    readiness.report_ready('vision', warm_ms=12.0)
+    assert not readiness.wait(timeout=0.01)
+    assert readiness.pending() == ['tts']
+    readiness.report_ready('tts')
+    assert readiness.wait(timeout=0.01)
+    assert readiness.status()['vision']['warm_ms'] == 12.0
+
+
+def test_failure_unblocks_the_wait():
+    # A detector that fails to load must still end the startup wait
+    readiness = StartupReadiness(('vision',))
+    timer = threading.Timer(0.05, readiness.report_failed, args=('vision', 'detector failed to load'))
+    timer.start()
+    assert readiness.wait(timeout=2.0)
+    timer.join()
+    assert readiness.failed() == {'vision': 'detector failed to load'}
+    assert not readiness.is_ready('vision')
+
+
+def test_only_the_first_report_counts():
+    readiness = StartupReadiness(('asr',))
+    readiness.report_failed('asr', 'no microphone')
+    readiness.report_ready('asr')
+    assert readiness.failed() == {'asr': 'no microphone'}
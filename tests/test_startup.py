@@ -0,0 +1,69 @@
+import threading
+import time
+
+from startup import PHASE_DONE, PHASE_FAILED, PHASE_RUNNING, PHASE_SKIPPED, StartupOrchestrator
+
+
+def test_phases_run_concurrently_after_their_dependencies():
+    startup = StartupOrchestrator()
+    order = []
+    lock = threading.Lock()
+
+    def phase(name, seconds):
+        def run():
+            time.sleep(seconds)
+            with lock:
+                order.append(name)
+            return name
+        return run
+
+    startup.add_phase('slow_a', phase('slow_a', 0.2))
+    startup.add_phase('slow_b', phase('slow_b', 0.2))
+    startup.add_phase('after_a', phase('after_a', 0.0), after=('slow_a',))
+    started = time.time()
+    startup.start()
+    assert startup.wait(timeout=2.0)
+    assert time.time() - started < 0.35  # slow_a and slow_b overlapped
+    assert order.index('after_a') > order.index('slow_a')
+    assert startup.result('after_a') == 'after_a'
+    summary = startup.summary()
+    assert summary['phases']['after_a']['start'] >= summary['phases']['slow_a']['end']
+
+
+def test_failed_phase_skips_its_dependents():
+    startup = StartupOrchestrator()
+
+    def broken():
+        raise RuntimeError("no camera")
+
+    startup.add_phase('camera', broken)
+    startup.add_phase('after_camera', lambda: None, after=('camera',))
+    startup.start()
+    assert startup.wait(timeout=2.0)
+    assert startup.phases['camera']['state'] == PHASE_FAILED
+    assert startup.phases['after_camera']['state'] == PHASE_SKIPPED
+    assert startup.failed() == {'camera': 'no camera', 'after_camera': 'after failed camera'}
+
+
+def test_inline_phase_is_timed():
+    startup = StartupOrchestrator()
+    with startup.phase('config'):
+        time.sleep(0.02)
+    assert startup.phases['config']['state'] == PHASE_DONE
+    assert startup.summary()['phases']['config']['seconds'] >= 0.02
+
+
+def test_report_does_not_wait_for_a_stuck_phase(capsys):
+    startup = StartupOrchestrator()
+    release = threading.Event()
+    startup.add_phase('camera', release.wait)
+    startup.add_phase('after_camera', lambda: None, after=('camera',))
+    startup.start()
+    assert not startup.wait(timeout=0.05)
+    startup.report(ready_seconds=0.05)
+    output = capsys.readouterr().out
+    assert startup.phases['camera']['state'] == PHASE_RUNNING
+    assert 'still running' in output
+    assert 'camera, after_camera not finished' in output
+    release.set()
+    assert startup.wait(timeout=2.0)
@@ -149,7 +149,7 @@ class RealtimeMp3Player:
                 # initialize play thread
                 # print('start play thread')
                 self._stream.start_stream()
-                self.play_thread = threading.Thread(target=self.play_audio)
+                self.play_thread = threading.Thread(target=self.play_audio, name="tts-playback")
                 self.play_thread.start()
         except subprocess.CalledProcessError as e:
             # Capturing ffmpeg exceptions, printing error details
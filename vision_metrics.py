@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Vision Pipeline Metrics for AI Kiosk Application
+Collects per-stage latencies and counters from the camera loop and the
+face detection worker so benchmarks can report p50/p95/p99 per stage.
+"""
+
+import threading
+from collections import deque
+from typing import Any, Dict, List
+
+# Stage names used by main.py
+STAGE_CAPTURE = 'capture'                          # source.read()
+STAGE_CAPTURE_TO_USE = 'capture_to_use'            # frame grabbed from the driver -> decoded for the loop
+STAGE_PREPROCESS = 'preprocess'                    # letterboxed detector input + tracking gray
+STAGE_QUEUE_WAIT = 'queue_wait'                    # frame_mailbox put -> worker get
+STAGE_INFERENCE = 'inference'                      # Face detector
+STAGE_ATTRIBUTES = 'attributes'                    # On-demand genderage for a single face
+STAGE_GREETING_DECISION = 'greeting_decision'      # detection result -> queue_speech returned
+STAGE_CAPTURE_TO_RESULT = 'capture_to_result'      # frame captured -> detection result stored
+STAGE_CAPTURE_TO_GREETING = 'capture_to_greeting'  # frame captured -> instant greeting queued
+STAGE_MODEL_LOAD = 'model_load'                    # Detector start: face models loaded, prepared and warmed up
+STAGE_RESUME = 'resume'                            # Deep idle left -> camera and detector working again
+
+STAGES = (
+    STAGE_CAPTURE,
+    STAGE_CAPTURE_TO_USE,
+    STAGE_PREPROCESS,
+    STAGE_QUEUE_WAIT,
+    STAGE_INFERENCE,
+    STAGE_ATTRIBUTES,
+    STAGE_GREETING_DECISION,
+    STAGE_CAPTURE_TO_RESULT,
+    STAGE_CAPTURE_TO_GREETING,
+    STAGE_MODEL_LOAD,
+    STAGE_RESUME,
+)
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = int(round(pct / 100.0 * (len(sorted_values) - 1)))
+    return sorted_values[max(0, min(rank, len(sorted_values) - 1))]
+
+
+class VisionMetrics:
+    """
+    Thread-safe store of recent stage latencies (seconds) and counters.
+    Recording is a deque append under a lock, cheap enough for the hot loop.
+    """
+
+    def __init__(self, max_samples: int = 10000):
+        self.max_samples = max_samples
+        self._lock = threading.Lock()
+        self._samples: Dict[str, deque] = {}
+        self._counters: Dict[str, int] = {}
+
+    def record(self, stage: str, seconds: float):
+        with self._lock:
+            samples = self._samples.get(stage)
+            if samples is None:
+                samples = deque(maxlen=self.max_samples)
+                self._samples[stage] = samples
+            samples.append(seconds)
+
+    def increment(self, counter: str, amount: int = 1):
+        with self._lock:
+            self._counters[counter] = self._counters.get(counter, 0) + amount
+
+    def get_counter(self, counter: str) -> int:
+        with self._lock:
+            return self._counters.get(counter, 0)
+
+    def reset(self):
+        with self._lock:
+            self._samples.clear()
+            self._counters.clear()
+
+    def stage_summary(self, stage: str) -> Dict[str, Any]:
+        with self._lock:
+            values = sorted(self._samples.get(stage, ()))
+        if not values:
+            return {'count': 0}
+        return {
+            'count': len(values),
+            'mean_ms': round(sum(values) / len(values) * 1000.0, 3),
+            'p50_ms': round(percentile(values, 50) * 1000.0, 3),
+            'p95_ms': round(percentile(values, 95) * 1000.0, 3),
+            'p99_ms': round(percentile(values, 99) * 1000.0, 3),
+            'max_ms': round(values[-1] * 1000.0, 3),
+        }
+
+    def summary(self) -> Dict[str, Any]:
+        """Machine-readable snapshot of every stage and counter."""
+        with self._lock:
+            stages = list(self._samples.keys())
+            counters = dict(self._counters)
+        ordered = [s for s in STAGES if s in stages] + sorted(s for s in stages if s not in STAGES)
+        return {
+            'stages': {stage: self.stage_summary(stage) for stage in ordered},
+            'counters': counters,
+        }
+
+
+# Global metrics instance
+vision_metrics = VisionMetrics()
+
+
+def get_vision_metrics() -> VisionMetrics:
+    """Get the global vision metrics instance."""
+    return vision_metrics
@@ -6,6 +6,8 @@ import time
 from typing import Set
 import logging
 
+from cpu_optimizer import get_optimizer
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -21,7 +23,8 @@ class UserPresenceWebSocketServer:
             'last_detection_time': None,
             'distance': None,
             'gender': None,
-            'age': None
+            'age': None,
+            'presence_state': 'absent'
         }
         self.server = None
         self.loop = None
@@ -181,7 +184,7 @@ class UserPresenceWebSocketServer:
         """Background task to broadcast every 30 seconds when no user is detected"""
         while self.interval_broadcasting:
             try:
-                await asyncio.sleep(self.broadcast_interval)
+                await asyncio.sleep(self.broadcast_interval * get_optimizer().get_throttle('websocket'))
                 if self.interval_broadcasting and not self.current_user_status['user_present']:
                     message = {
                         'type': 'status_update',
@@ -216,12 +219,15 @@ class UserPresenceWebSocketServer:
                 self.interval_task = None
             logger.info("Stopped interval broadcasting")
     
-    def update_user_status(self, user_present=False, user_count=0, distance=None, gender=None, age=None):
-        """Update user status and broadcast to all clients"""
+    def update_user_status(self, user_present=False, user_count=0, distance=None, gender=None, age=None, presence_state=None):
+        """Update user status and broadcast to all clients (presence_state None keeps the current state)"""
         current_time = time.time()
         
         # Check if user presence changed
         previous_user_present = self.current_user_status['user_present']
+        previous_presence_state = self.current_user_status['presence_state']
+        if presence_state is None:
+            presence_state = previous_presence_state
         
         # Update status
         self.current_user_status.update({
@@ -230,7 +236,8 @@ class UserPresenceWebSocketServer:
             'last_detection_time': current_time if user_present else self.current_user_status['last_detection_time'],
             'distance': distance,
             'gender': gender,
-            'age': age
+            'age': age,
+            'presence_state': presence_state
         })
         
         # Schedule broadcast and interval management in the event loop
@@ -259,6 +266,11 @@ class UserPresenceWebSocketServer:
                         )
                         logger.info("User absent - started interval broadcasting")
                 
+                # Presence state transitions (approaching, too far, leaving) are sent immediately
+                elif previous_presence_state != presence_state:
+                    should_broadcast = True
+                    self.last_immediate_broadcast = current_time
+                
                 # For ongoing presence updates, only throttle if user is present
                 elif user_present and current_time - self.last_immediate_broadcast >= self.immediate_broadcast_throttle:
                     should_broadcast = True
@@ -311,7 +323,7 @@ class UserPresenceWebSocketServer:
     
     def start(self):
         """Start the WebSocket server in a background thread"""
-        self.thread = threading.Thread(target=self.run_server, daemon=True)
+        self.thread = threading.Thread(target=self.run_server, name="websocket-server", daemon=True)
         self.thread.start()
         logger.info("WebSocket server thread started")
         
@@ -337,7 +349,7 @@ def init_websocket_server(host='localhost', port=8765):
     websocket_server.start()
     return websocket_server
 
-def update_user_presence(user_present=False, user_count=0, distance=None, gender=None, age=None):
+def update_user_presence(user_present=False, user_count=0, distance=None, gender=None, age=None, presence_state=None):
     """Update user presence status (to be called from main application)"""
     global websocket_server
     if websocket_server:
@@ -346,7 +358,8 @@ def update_user_presence(user_present=False, user_count=0, distance=None, gender
             user_count=user_count,
             distance=distance,
             gender=gender,
-            age=age
+            age=age,
+            presence_state=presence_state
         )
 
 if __name__ == "__main__":